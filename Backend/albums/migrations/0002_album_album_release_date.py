@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('albums', '0001_initial'),
+        ('artists', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['-release_date', '-id'], name='album_release_date'),
+        ),
+    ]
@@ -1,11 +1,20 @@
 from django.db import models
 from artists.models import Artist
 
+class AlbumQuerySet(models.QuerySet):
+    def with_related(self):
+        return self.select_related('artist')
+
 class Album(models.Model):
     title = models.CharField(max_length=255)
     artist = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name="albums")
     release_date = models.DateField()
     cover_image = models.URLField(blank=True, null=True)
 
+    objects = AlbumQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['-release_date', '-id'], name='album_release_date')]
+
     def __str__(self):
         return f"{self.title} - {self.artist.name}"
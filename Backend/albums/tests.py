@@ -1,3 +1,22 @@
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from songs.tests import create_songs
+
+
+class AlbumQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_list(self):
+        create_songs(1, title='First')
+        create_songs(1, title='Second')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/albums/')
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_get_all_songs(self):
+        album = create_songs(10)[0].album
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/v1/albums/{album.id}/get_all_songs/')
+        self.assertEqual(len(response.data['results']), 10)
@@ -7,12 +7,24 @@ from .serializers import AlbumSerializer
 from artists.models import Artist
 from songs.models import Song
 from songs.serializers import SongSerializer
+from root.pagination import PaginatedActionMixin
+from search.backends import get_backend
+from caching.decorators import cached_response
+from caching.tags import album_tags, song_tags
 
 
-class AlbumViewSet(viewsets.ModelViewSet):
-    queryset = Album.objects.all()
+class AlbumViewSet(PaginatedActionMixin, viewsets.ModelViewSet):
+    queryset = Album.objects.with_related()
     serializer_class = AlbumSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    @cached_response('albums', data_tags=album_tags)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response('album:{pk}', data_tags=album_tags)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
     
     @action(detail=True, methods=['post'])
     def add_song(self, request, pk=None):
@@ -99,12 +111,12 @@ class AlbumViewSet(viewsets.ModelViewSet):
             )
 
     @action(detail=True, methods=['get'])
+    @cached_response('album:{pk}', data_tags=song_tags)
     def get_all_songs(self, request, pk=None):
         try:
             album = self.get_object()
-            songs = Song.objects.filter(album=album)
-            serializer = SongSerializer(songs, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            songs = Song.objects.with_related().filter(album=album)
+            return self.paginated_response(songs, SongSerializer)
         except Album.DoesNotExist:
             return Response(
                 {"error": "Album not found"},
@@ -114,6 +126,7 @@ class AlbumViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def search_album(self, request):
         query = request.query_params.get('q', '')
-        albums = Album.objects.filter(title__icontains=query)
-        serializer = self.get_serializer(albums, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        albums = self.get_queryset()
+        if query:
+            albums = get_backend().filter_albums(albums, query)
+        return self.paginated_response(albums)
\ No newline at end of file
@@ -4,13 +4,25 @@ from rest_framework.decorators import action
 
 from .models import Artist
 from .serializers import ArtistSerializer
+from root.pagination import PaginatedActionMixin
+from search.backends import get_backend
+from caching.decorators import cached_response
+from caching.tags import artist_tags
 
 
-class ArtistViewSet(viewsets.ModelViewSet):
+class ArtistViewSet(PaginatedActionMixin, viewsets.ModelViewSet):
     queryset = Artist.objects.all()
     serializer_class = ArtistSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
+    @cached_response('artists', data_tags=artist_tags)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response('artist:{pk}', data_tags=artist_tags)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     @action(detail=False, methods=['get'])
     def find_artist(self, request):
         query = request.query_params.get('q', '')
@@ -20,6 +32,5 @@ class ArtistViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
          
-        artists = Artist.objects.filter(name__icontains=query)
-        serializer = self.get_serializer(artists, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        artists = get_backend().filter_artists(self.get_queryset(), query)
+        return self.paginated_response(artists)
@@ -0,0 +1,91 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+
+from benchmarks import runner, scenarios, synthetic
+from .generate_synthetic_data import add_scale_arguments, scale_overrides
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the client scenarios against a throwaway database filled with synthetic data and '
+        'report latency percentiles, throughput and query counts per endpoint'
+    )
+
+    def add_arguments(self, parser):
+        add_scale_arguments(parser)
+        parser.set_defaults(scale='tiny')
+        parser.add_argument('--scenarios', nargs='+', choices=list(scenarios.SCENARIOS),
+                            help='Defaults to a weighted mix of all of them')
+        parser.add_argument('--iterations', type=int, default=50, help='Scenario runs per worker')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Workers in parallel threads (use PostgreSQL for more than one)')
+        parser.add_argument('--warmup', type=int, default=1, help='Unrecorded runs of each scenario per worker')
+        parser.add_argument('--llm-latency', type=float, default=0.0,
+                            help='Seconds the local fake LLM waits per call')
+        parser.add_argument('--current-db', action='store_true',
+                            help='Use the configured database as it is (see generate_synthetic_data)')
+        parser.add_argument('--output', help='Results file (default benchmark-<commit>.json)')
+        parser.add_argument('--compare', help='Earlier results file to compare with')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] > 1 and connection.vendor == 'sqlite':
+            raise CommandError('SQLite locks tables under concurrent writers; use PostgreSQL for --concurrency > 1')
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        llm_settings = override_settings(
+            CHATBOT_LLM_BACKEND='local',
+            CHATBOT_LOCAL_LLM_LATENCY=options['llm_latency'],
+            CHATBOT_LOCAL_LLM_TOKEN_LATENCY=0,
+        )
+        setup_test_environment()
+        old_config = None if options['current_db'] else setup_databases(verbosity=0, interactive=False)
+        try:
+            with llm_settings:
+                if old_config is not None:
+                    started = time.perf_counter()
+                    synthetic.generate(options['scale'], options['seed'], stdout=self.stdout, **scale_overrides(options))
+                    self.stdout.write(f'Synthetic data generated in {time.perf_counter() - started:.1f}s')
+                results = runner.run(
+                    options['scenarios'], options['iterations'], options['concurrency'],
+                    options['seed'], options['warmup'],
+                )
+        except runner.BenchmarkError as e:
+            raise CommandError(e)
+        finally:
+            if old_config is not None:
+                teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        if not options['current_db']:
+            results['meta']['scale'] = options['scale']
+            results['meta']['counts'] = synthetic.scale_counts(options['scale'], **scale_overrides(options))
+        output = options['output'] or f"benchmark-{results['meta']['commit'] or int(time.time())}.json"
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+        self.stdout.write(f"{'endpoint':<40} {'reqs':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'rps':>8} {'queries':>8}")
+        for endpoint, figures in results['endpoints'].items():
+            self.stdout.write(
+                f"{endpoint:<40} {figures['requests']:>5} {figures['p50_ms']:>8.1f} {figures['p95_ms']:>8.1f} "
+                f"{figures['p99_ms']:>8.1f} {figures['throughput_rps']:>8.1f} {figures['queries_mean']:>8.1f}"
+            )
+        for name, messages in results['failures'].items():
+            self.stderr.write(f'{name} failed: {messages[0]}')
+        summary = results['summary']
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['requests']} requests in {summary['duration_s']:.1f}s "
+            f"({summary['throughput_rps']:.1f} req/s, {summary['errors']} errors); results written to {output}"
+        ))
+        if baseline is not None:
+            self.stdout.write(f"Compared with {options['compare']} ({baseline['meta'].get('commit')}):")
+            for line in runner.compare(baseline, results):
+                self.stdout.write(f'  {line}')
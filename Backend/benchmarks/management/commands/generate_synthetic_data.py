@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from benchmarks import synthetic
+
+
+def add_scale_arguments(parser):
+    parser.add_argument('--scale', choices=list(synthetic.SCALES), default='small')
+    parser.add_argument('--seed', type=int, default=0)
+    for name in synthetic.SCALES['small']:
+        parser.add_argument(f'--{name}', type=int, help=f'Override the number of {name} of the scale')
+
+
+def scale_overrides(options):
+    return {name: options[name] for name in synthetic.SCALES['small']}
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with a seeded synthetic catalog, users, playlists and conversations'
+
+    def add_arguments(self, parser):
+        add_scale_arguments(parser)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        synthetic.generate(options['scale'], options['seed'], stdout=self.stdout, **scale_overrides(options))
+        self.stdout.write(self.style.SUCCESS(f'Generated in {time.perf_counter() - started:.1f}s'))
@@ -0,0 +1,228 @@
+"""
+Run client scenarios in-process and summarize them per endpoint.
+
+Requests go through the full Django stack (middleware, DRF, serializers)
+with the test client, so no server or network is involved. Each worker
+thread logs in as its own synthetic user and runs scenarios picked with a
+seeded RNG. Every request is timed and its SQL queries counted; the results
+are a JSON-serializable dict with p50/p95/p99 latency, throughput and query
+counts per endpoint.
+"""
+import json
+import math
+import platform
+import random
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from genres.models import Genre
+from songs.models import Song
+from . import scenarios as scenario_module
+from .synthetic import USERNAME_PREFIX
+
+API_PREFIX = '/api/v1'
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class RequestFailed(Exception):
+    """A scenario request got an error response; the scenario run is abandoned"""
+
+
+class Session:
+    """One simulated client: a logged in test client, an RNG and the catalog ids scenarios pick from"""
+
+    def __init__(self, user, rng, catalog, samples):
+        self.client = Client()
+        self.client.force_login(user)
+        self.rng = rng
+        self.song_ids, self.song_titles, self.genres = catalog
+        self.samples = samples
+        self.recording = True
+
+    def request(self, method, template, data=None, params=None, **ids):
+        path = API_PREFIX + template.format(**ids)
+        if params:
+            path = f'{path}?{urlencode(params)}'
+        kwargs = {'content_type': 'application/json', 'data': json.dumps(data)} if data is not None else {}
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(self.client, method)(path, **kwargs)
+            elapsed = time.perf_counter() - started
+        if self.recording:
+            # list.append is atomic, so sessions in different threads can share the list
+            self.samples.append((f'{method.upper()} {template}', elapsed, len(queries), response.status_code))
+        if response.status_code >= 400:
+            raise RequestFailed(f'{method.upper()} {path} returned {response.status_code}: {response.content[:200]!r}')
+        return response
+
+    def get(self, template, params=None, **ids):
+        return self.request('get', template, params=params, **ids)
+
+    def post(self, template, data, **ids):
+        return self.request('post', template, data=data, **ids)
+
+
+def load_catalog():
+    songs = list(Song.objects.order_by('id').values_list('id', 'title', 'album__title', 'album__artist__name'))
+    if not songs:
+        raise BenchmarkError('The catalog is empty; generate synthetic data first')
+    genres = list(Genre.objects.order_by('id').values_list('name', flat=True)) or ['pop']
+    return [song[0] for song in songs], [song[1:] for song in songs], genres
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, math.ceil(fraction * len(values)) - 1)]
+
+
+def summarize(samples, duration):
+    """Per-endpoint figures for (endpoint, seconds, queries, status) samples"""
+    by_endpoint = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample[0]].append(sample)
+    endpoints = {}
+    for endpoint, rows in sorted(by_endpoint.items()):
+        latencies = sorted(row[1] * 1000 for row in rows)
+        queries = [row[2] for row in rows]
+        endpoints[endpoint] = {
+            'requests': len(rows),
+            'errors': sum(1 for row in rows if row[3] >= 400),
+            'throughput_rps': round(len(rows) / duration, 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 2),
+            'p50_ms': round(_percentile(latencies, 0.5), 2),
+            'p95_ms': round(_percentile(latencies, 0.95), 2),
+            'p99_ms': round(_percentile(latencies, 0.99), 2),
+            'max_ms': round(latencies[-1], 2),
+            'queries_mean': round(sum(queries) / len(queries), 2),
+            'queries_max': max(queries),
+        }
+    return endpoints
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def in_workers(func, sessions):
+    """Call ``func(session)`` for every session, each in its own thread when there are several"""
+    if len(sessions) == 1:
+        return func(sessions[0])
+
+    def call(session):
+        try:
+            func(session)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(len(sessions)) as pool:
+        for future in [pool.submit(call, session) for session in sessions]:
+            future.result()
+
+
+def run(scenarios=None, iterations=50, concurrency=1, seed=0, warmup=1):
+    """
+    Run ``iterations`` weighted scenario picks on each of ``concurrency``
+    workers (after ``warmup`` unrecorded runs of every scenario per worker).
+    """
+    names = scenarios or list(scenario_module.SCENARIOS)
+    unknown = set(names) - set(scenario_module.SCENARIOS)
+    if unknown:
+        raise BenchmarkError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    weights = [scenario_module.SCENARIOS[name][1] for name in names]
+    users = list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('id'))
+    if len(users) < concurrency:
+        raise BenchmarkError(f'Need {concurrency} synthetic users, found {len(users)}')
+    catalog = load_catalog()
+    samples = []
+    lock = threading.Lock()
+    runs = defaultdict(int)
+    failures = defaultdict(list)
+
+    def play(name, session):
+        try:
+            scenario_module.SCENARIOS[name][0](session)
+        except RequestFailed as e:
+            with lock:
+                failures[name].append(str(e))
+
+    def warm_up(session):
+        session.recording = False
+        for _ in range(warmup):
+            for name in names:
+                play(name, session)
+        session.recording = True
+
+    def measure(session):
+        for _ in range(iterations):
+            name = session.rng.choices(names, weights)[0]
+            play(name, session)
+            with lock:
+                runs[name] += 1
+
+    sessions = [
+        Session(users[index], random.Random(seed * 1000 + index), catalog, samples)
+        for index in range(concurrency)
+    ]
+    in_workers(warm_up, sessions)
+    started = time.perf_counter()
+    in_workers(measure, sessions)
+    duration = time.perf_counter() - started
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'seed': seed,
+            'iterations': iterations,
+            'concurrency': concurrency,
+            'scenarios': dict(sorted(runs.items())),
+        },
+        # The first few error responses per scenario, to tell a slow endpoint from a broken one
+        'failures': {name: messages[:5] for name, messages in sorted(failures.items())},
+        'summary': {
+            'requests': len(samples),
+            'errors': sum(1 for sample in samples if sample[3] >= 400),
+            'duration_s': round(duration, 3),
+            'throughput_rps': round(len(samples) / duration, 2),
+        },
+        'endpoints': summarize(samples, duration),
+    }
+
+
+def compare(baseline, results, metric='p95_ms'):
+    """Lines comparing ``metric`` and query counts per endpoint between two result files"""
+    lines = []
+    for endpoint, figures in results['endpoints'].items():
+        before = baseline['endpoints'].get(endpoint)
+        if before is None:
+            lines.append(f'{endpoint}: new, {metric} {figures[metric]}')
+            continue
+        change = (figures[metric] - before[metric]) / before[metric] if before[metric] else 0.0
+        line = f'{endpoint}: {metric} {before[metric]} -> {figures[metric]} ({change:+.0%})'
+        if figures['queries_mean'] != before['queries_mean']:
+            line += f", queries {before['queries_mean']} -> {figures['queries_mean']}"
+        lines.append(line)
+    return lines
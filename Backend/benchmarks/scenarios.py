@@ -0,0 +1,73 @@
+"""
+Scripted client flows, one per screen of the Flutter app, issuing the same
+requests as its API classes (frontend/lib/apis). Each scenario takes a
+runner.Session and leaves the data as it found it, so runs can be repeated.
+"""
+from . import synthetic
+
+
+def browse_albums(session):
+    """album_song_api.dart: album list, an album's songs, a song's details"""
+    albums = session.get('/albums/').json()['results']
+    if not albums:
+        return
+    album = session.rng.choice(albums)
+    songs = session.get('/albums/{id}/get_all_songs/', id=album['id']).json()['results']
+    if songs:
+        session.get('/songs/{id}/details/', id=session.rng.choice(songs)['id'])
+
+
+def find_song(session):
+    """find_song_api.dart: a one or two word title search, then the first result"""
+    query = ' '.join(session.rng.sample(synthetic.WORDS, session.rng.randint(1, 2)))
+    results = session.get('/songs/find_song/', params={'q': query}).json()['results']
+    if results:
+        session.get('/songs/{id}/details/', id=results[0]['id'])
+
+
+def edit_playlist(session):
+    """playlist_song_api.dart: open a playlist, add, move and remove songs"""
+    playlists = session.get('/playlists/').json()['results']
+    if not playlists:
+        return
+    playlist_id = session.rng.choice(playlists)['id']
+    present = {song['id'] for song in session.get('/playlists/{id}/', id=playlist_id).json()['songs']}
+    new = [song_id for song_id in session.rng.sample(session.song_ids, 6) if song_id not in present]
+    if len(new) < 2:
+        return
+    single, batch = new[0], new[1:]
+    session.post('/playlists/{id}/add_song/', {'song_id': single}, id=playlist_id)
+    session.post('/playlists/{id}/add_songs/', {'song_ids': batch}, id=playlist_id)
+    session.post('/playlists/{id}/move_songs/', {'song_ids': batch[:2], 'at_start': True}, id=playlist_id)
+    session.get('/playlists/{id}/songs/', id=playlist_id)
+    session.post('/playlists/{id}/remove_songs/', {'song_ids': batch}, id=playlist_id)
+    session.post('/playlists/{id}/remove_song/', {'song_id': single}, id=playlist_id)
+
+
+def chatbot(session):
+    """chatbot_api.dart: a two turn conversation with the local LLM"""
+    message = synthetic.chat_message(session.rng, session.song_titles, session.genres)
+    reply = session.post('/chatbot/chat/', {'message': message}).json()
+    message = synthetic.chat_message(session.rng, session.song_titles, session.genres)
+    session.post('/chatbot/chat/', {'message': message, 'conversation_id': reply['conversation_id']})
+
+
+def chat_history(session):
+    """chatbot_api.dart: the conversation list, a page of one conversation, then polling for new messages"""
+    conversations = session.get('/chatbot/conversations/').json()['results']
+    if not conversations:
+        return
+    conversation_id = session.rng.choice(conversations)['id']
+    messages = session.get('/chatbot/{id}/messages/', params={'page_size': 20}, id=conversation_id).json()['results']
+    if messages:
+        session.get('/chatbot/{id}/messages/', params={'since': messages[0]['id']}, id=conversation_id)
+
+
+# name: (scenario, relative weight in a mixed run)
+SCENARIOS = {
+    'albums': (browse_albums, 4),
+    'find_song': (find_song, 3),
+    'playlists': (edit_playlist, 2),
+    'chatbot': (chatbot, 1),
+    'chat_history': (chat_history, 2),
+}
@@ -0,0 +1,173 @@
+"""
+Seeded synthetic data for benchmarks and load tests.
+
+The same scale and seed always produce the same catalog, users, playlists
+and conversations, so runs on different commits measure the same data. The
+catalog goes through the bulk importer (search documents included);
+users, playlists and conversations are written with bulk_create. Song
+popularity is skewed, like real listening: a few songs appear in many
+playlists and chat recommendations, most in few.
+"""
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from chatbot.models import Conversation, Message, message_preview
+from playlists.models import POSITION_GAP, Playlist, PlaylistSong
+from songs.importer import CatalogImporter
+from songs.models import Song
+
+USERNAME_PREFIX = 'bench'
+
+SCALES = {
+    'tiny': {'artists': 20, 'albums': 50, 'songs': 500, 'genres': 10,
+             'users': 5, 'playlists': 20, 'conversations': 20},
+    'small': {'artists': 200, 'albums': 1000, 'songs': 10000, 'genres': 30,
+              'users': 50, 'playlists': 300, 'conversations': 300},
+    'medium': {'artists': 2000, 'albums': 10000, 'songs': 100000, 'genres': 60,
+               'users': 500, 'playlists': 3000, 'conversations': 3000},
+    'large': {'artists': 10000, 'albums': 50000, 'songs': 500000, 'genres': 100,
+              'users': 5000, 'playlists': 30000, 'conversations': 30000},
+}
+
+WORDS = [
+    'midnight', 'river', 'golden', 'echo', 'summer', 'neon', 'velvet', 'storm', 'silver', 'wild',
+    'heart', 'ocean', 'city', 'dream', 'fire', 'shadow', 'electric', 'paper', 'moon', 'highway',
+    'crystal', 'blue', 'honey', 'thunder', 'winter', 'garden', 'signal', 'sugar', 'broken', 'morning',
+    'desert', 'rain', 'glass', 'ghost', 'lucky', 'northern', 'lights', 'hollow', 'fever', 'satellite',
+]
+GENRES = [
+    'pop', 'rock', 'jazz', 'blues', 'hip hop', 'electronic', 'classical', 'country', 'folk', 'soul',
+    'funk', 'reggae', 'metal', 'punk', 'indie', 'ambient', 'house', 'techno', 'disco', 'gospel',
+]
+# Chat messages; {title}, {artist}, {genre} and {album} are filled from the catalog
+CHAT_TEMPLATES = [
+    'play some {genre} music',
+    'recommend {genre} songs for a rainy day',
+    'play {title}',
+    'play songs by {artist}',
+    'play the album {album}',
+    'find me songs like {title}',
+    'hello there',
+    'thanks, that was great',
+]
+
+
+def scale_counts(scale='small', **overrides):
+    counts = dict(SCALES[scale])
+    counts.update({key: value for key, value in overrides.items() if value is not None})
+    return counts
+
+
+def _name(rng, words, index, title=False):
+    name = ' '.join(rng.choice(WORDS) for _ in range(words))
+    # The index keeps generated names unique without changing their vocabulary
+    name = f'{name} {index}'
+    return name.title() if title else name.capitalize()
+
+
+def genre_name(index):
+    base = GENRES[index % len(GENRES)]
+    return base if index < len(GENRES) else f'{base} {index // len(GENRES) + 1}'
+
+
+def catalog_rows(counts, seed=0):
+    """Importer rows for the catalog part of a scale (generated lazily)"""
+    rng = random.Random(seed)
+    artists = [_name(rng, 2, i, title=True) for i in range(counts['artists'])]
+    genres = [genre_name(i) for i in range(counts['genres'])]
+    albums = [
+        (_name(rng, 2, i, title=True), artists[i % len(artists)], f'{1960 + rng.randrange(65)}-{rng.randrange(1, 13):02d}-01')
+        for i in range(counts['albums'])
+    ]
+    for i in range(counts['songs']):
+        album, album_artist, release_date = albums[i % len(albums)]
+        featured = [rng.choice(artists)] if rng.random() < 0.15 else []
+        yield {
+            'title': _name(rng, rng.randint(1, 3), i),
+            'album': album,
+            'album_artist': album_artist,
+            'artists': [album_artist] + [name for name in featured if name != album_artist],
+            'release_date': release_date,
+            'genres': rng.sample(genres, min(len(genres), rng.randint(1, 2))),
+        }
+
+
+def _popular(rng, ids):
+    # Squaring a uniform draw favours the head of the list (the most "popular" songs)
+    return ids[int(len(ids) * rng.random() ** 2)]
+
+
+def generate(scale='small', seed=0, batch_size=5000, stdout=None, **overrides):
+    """Create a synthetic data set; returns the counts that were used"""
+    counts = scale_counts(scale, **overrides)
+    rng = random.Random(seed)
+
+    def report(message):
+        if stdout is not None:
+            stdout.write(message)
+
+    importer = CatalogImporter(batch_size)
+    importer.run(catalog_rows(counts, seed))
+    report(f"Catalog: {importer.stats['songs']} songs, {importer.stats['albums']} albums, "
+           f"{importer.stats['artists']} artists, {importer.stats['genres']} genres")
+
+    song_ids = list(Song.objects.order_by('id').values_list('id', flat=True))
+    songs = list(Song.objects.order_by('id').values_list('title', 'album__title', 'album__artist__name'))
+    genres = [genre_name(i) for i in range(counts['genres'])]
+
+    with transaction.atomic():
+        password = make_password(None)
+        User.objects.bulk_create([
+            User(username=f'{USERNAME_PREFIX}{i}', password=password) for i in range(counts['users'])
+        ], batch_size=batch_size)
+        users = list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('id').values_list('id', flat=True))
+
+        playlists = Playlist.objects.bulk_create([
+            Playlist(user_id=users[i % len(users)], name=f'{_name(rng, 2, i, title=True)} Mix')
+            for i in range(counts['playlists'])
+        ], batch_size=batch_size)
+        entries = []
+        for playlist in playlists:
+            chosen = dict.fromkeys(_popular(rng, song_ids) for _ in range(rng.randint(10, 100)))
+            entries.extend(
+                PlaylistSong(playlist_id=playlist.id, song_id=song_id, position=position * POSITION_GAP)
+                for position, song_id in enumerate(chosen, 1)
+            )
+        PlaylistSong.objects.bulk_create(entries, batch_size=batch_size)
+        report(f'Users: {len(users)}, playlists: {len(playlists)} with {len(entries)} songs')
+
+        conversations = Conversation.objects.bulk_create([
+            Conversation(user_id=users[i % len(users)]) for i in range(counts['conversations'])
+        ], batch_size=batch_size)
+        messages = []
+        for conversation in conversations:
+            for turn in range(rng.randint(2, 10)):
+                messages.append(Message(
+                    conversation=conversation,
+                    role='user' if turn % 2 == 0 else 'assistant',
+                    content=chat_message(rng, songs, genres) if turn % 2 == 0 else 'Here are some songs you might like.',
+                ))
+            # bulk_create skips the signal that keeps conversation summaries
+            conversation.message_count = turn + 1
+            conversation.last_message_role = messages[-1].role
+            conversation.last_message_preview = message_preview(messages[-1].content)
+        messages = Message.objects.bulk_create(messages, batch_size=batch_size)
+        Conversation.objects.bulk_update(
+            conversations, ['message_count', 'last_message_role', 'last_message_preview'], batch_size=batch_size,
+        )
+        Recommended = Message.recommended_songs.through
+        Recommended.objects.bulk_create([
+            Recommended(message_id=message.id, song_id=song_id)
+            for message in messages if message.role == 'assistant'
+            for song_id in dict.fromkeys(_popular(rng, song_ids) for _ in range(5))
+        ], batch_size=batch_size, ignore_conflicts=True)
+        report(f'Conversations: {len(conversations)} with {len(messages)} messages')
+    return counts
+
+
+def chat_message(rng, songs, genres):
+    title, album, artist = rng.choice(songs)
+    return rng.choice(CHAT_TEMPLATES).format(title=title, album=album, artist=artist, genre=rng.choice(genres))
@@ -0,0 +1,60 @@
+from django.test import TestCase, override_settings
+
+from chatbot import intent_cache
+from chatbot.models import Conversation
+from playlists.models import Playlist
+from recommendations import sampling
+from songs.models import Song
+from . import runner, synthetic
+
+SCALE = {'artists': 5, 'albums': 10, 'songs': 60, 'genres': 4, 'users': 2, 'playlists': 4, 'conversations': 3}
+
+
+class SyntheticDataTests(TestCase):
+    def test_same_seed_same_catalog(self):
+        counts = synthetic.scale_counts('tiny', **SCALE)
+        self.assertEqual(list(synthetic.catalog_rows(counts, seed=3)), list(synthetic.catalog_rows(counts, seed=3)))
+        self.assertNotEqual(list(synthetic.catalog_rows(counts, seed=3)), list(synthetic.catalog_rows(counts, seed=4)))
+
+    def test_generate(self):
+        synthetic.generate('tiny', seed=1, **SCALE)
+        self.assertEqual(Song.objects.count(), 60)
+        self.assertEqual(Playlist.objects.count(), 4)
+        self.assertTrue(all(playlist.entries.exists() for playlist in Playlist.objects.all()))
+        for conversation in Conversation.objects.all():
+            self.assertEqual(conversation.message_count, conversation.messages.count())
+
+
+@override_settings(CHATBOT_LLM_BACKEND='local', CHATBOT_LOCAL_LLM_LATENCY=0, CHATBOT_LOCAL_LLM_TOKEN_LATENCY=0)
+class RunnerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        synthetic.generate('tiny', seed=0, **SCALE)
+
+    def setUp(self):
+        intent_cache.reset()
+        sampling.reset()
+
+    def test_every_scenario_runs_cleanly(self):
+        results = runner.run(iterations=12, seed=0)
+        self.assertEqual(results['failures'], {})
+        self.assertEqual(results['summary']['errors'], 0)
+        self.assertEqual(sum(results['meta']['scenarios'].values()), 12)
+        for endpoint in ('GET /albums/', 'GET /songs/find_song/', 'POST /playlists/{id}/add_songs/', 'POST /chatbot/chat/'):
+            self.assertIn(endpoint, results['endpoints'])
+        figures = results['endpoints']['GET /albums/']
+        self.assertLessEqual(figures['p50_ms'], figures['p95_ms'])
+        self.assertLessEqual(figures['p95_ms'], figures['p99_ms'])
+        self.assertGreater(figures['queries_mean'], 0)
+
+    def test_playlists_are_left_as_they_were(self):
+        before = {playlist.id: playlist.ordered_songs() for playlist in Playlist.objects.all()}
+        runner.run(['playlists'], iterations=5, seed=0, warmup=0)
+        self.assertEqual({playlist.id: playlist.ordered_songs() for playlist in Playlist.objects.all()}, before)
+
+    def test_compare(self):
+        baseline = runner.run(['albums'], iterations=3, seed=0)
+        results = runner.run(['albums', 'find_song'], iterations=3, seed=0)
+        lines = runner.compare(baseline, results)
+        self.assertTrue(any(line.startswith('GET /albums/: p95_ms') for line in lines))
+        self.assertTrue(any(line.startswith('GET /songs/find_song/: new') for line in lines))
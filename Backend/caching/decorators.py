@@ -0,0 +1,72 @@
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .metrics import stats
+from .tags import get_cache, get_versions
+
+
+def _cache_key(request):
+    renderer = getattr(request, 'accepted_renderer', None)
+    raw = json.dumps([
+        request.path,
+        sorted(request.query_params.lists()),
+        renderer.format if renderer else None,
+    ])
+    return 'response-cache:entry:' + hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _etag(data):
+    body = json.dumps(data, cls=JSONEncoder, sort_keys=True)
+    return quote_etag(hashlib.sha1(body.encode()).hexdigest())
+
+
+def _respond(request, entry, response=None):
+    if entry['etag'] in parse_etags(request.headers.get('If-None-Match', '')):
+        stats.increment('not_modified')
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    elif response is None:
+        response = Response(entry['data'], status=status.HTTP_200_OK)
+    response['ETag'] = entry['etag']
+    return response
+
+
+def cached_response(*tags, data_tags=None):
+    """
+    Cache a read-only viewset action keyed on path, query params and format.
+
+    ``tags`` are formatted with the URL kwargs (``'album:{pk}'``); ``data_tags``
+    derives further tags from the serialized data, e.g. the artists nested in
+    each song. The entry is served until any of those tags is bumped.
+    """
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            cache = get_cache()
+            key = _cache_key(request)
+            entry = cache.get(key)
+            if entry is not None and get_versions(entry['tags']) == entry['tags']:
+                stats.increment('hits')
+                return _respond(request, entry)
+
+            stats.increment('misses')
+            static_tags = {tag.format(**kwargs) for tag in tags}
+            # Read versions before running the view so a concurrent write invalidates what we store
+            versions = get_versions(static_tags)
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+
+            if data_tags:
+                versions.update(get_versions(set(data_tags(response.data)) - static_tags))
+            entry = {'data': response.data, 'etag': _etag(response.data), 'tags': versions}
+            cache.set(key, entry, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+            return _respond(request, entry, response)
+        return wrapper
+    return decorator
@@ -0,0 +1,28 @@
+import threading
+from collections import Counter
+
+
+class CacheStats:
+    """Process-local counters; each worker reports its own numbers"""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counts[name] += amount
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        lookups = counts.get('hits', 0) + counts.get('misses', 0)
+        counts['hit_rate'] = counts.get('hits', 0) / lookups if lookups else 0.0
+        return counts
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+stats = CacheStats()
@@ -0,0 +1,60 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from albums.models import Album
+from artists.models import Artist
+from genres.models import Genre
+from songs.models import Song
+from .tags import bump
+
+
+@receiver(post_save, sender=Album)
+@receiver(post_delete, sender=Album)
+def album_changed(sender, instance, **kwargs):
+    bump('albums', f'album:{instance.pk}')
+
+
+@receiver(post_save, sender=Artist)
+@receiver(post_delete, sender=Artist)
+def artist_changed(sender, instance, **kwargs):
+    bump('artists', f'artist:{instance.pk}')
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def genre_changed(sender, instance, **kwargs):
+    bump('genres', f'genre:{instance.pk}')
+
+
+@receiver(pre_save, sender=Song)
+def song_saving(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        # Moving a song changes the track list of the album it leaves, too
+        instance._cache_previous_album_id = (
+            Song.objects.filter(pk=instance.pk).values_list('album_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Song)
+@receiver(post_delete, sender=Song)
+def song_changed(sender, instance, **kwargs):
+    tags = {'songs', f'song:{instance.pk}', f'album:{instance.album_id}'}
+    previous_album_id = getattr(instance, '_cache_previous_album_id', None)
+    if previous_album_id:
+        tags.add(f'album:{previous_album_id}')
+    bump(*tags)
+
+
+@receiver(m2m_changed, sender=Song.artists.through)
+@receiver(m2m_changed, sender=Song.genres.through)
+def song_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            bump(f'song:{instance.pk}')
+        return
+    if action == 'pre_clear':
+        instance._cache_cleared_song_ids = list(instance.songs.values_list('id', flat=True))
+    elif action == 'post_clear':
+        bump(*(f'song:{pk}' for pk in getattr(instance, '_cache_cleared_song_ids', [])))
+    elif action in ('post_add', 'post_remove'):
+        bump(*(f'song:{pk}' for pk in pk_set))
@@ -0,0 +1,76 @@
+"""
+Tag versions for precise response invalidation.
+
+Every cached response records the version of each tag it depends on
+(``album:3``, ``artist:7``, ``albums`` for list membership, ...). Saving a
+model bumps only its own tags, so an entry is served only while all of the
+versions it was built from are still current.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def get_cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def _key(tag):
+    return f'response-cache:tag:{tag}'
+
+
+def get_versions(tags):
+    cache = get_cache()
+    keys = {_key(tag): tag for tag in tags}
+    found = cache.get_many(keys)
+    versions = {keys[key]: version for key, version in found.items()}
+    for key, tag in keys.items():
+        if tag not in versions:
+            # Never reuse an old number for an evicted tag, or stale entries would validate again
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[tag] = cache.get(key)
+    return versions
+
+
+def bump(*tags):
+    from .metrics import stats
+
+    version = time.time_ns()
+    get_cache().set_many({_key(tag): version for tag in tags}, timeout=None)
+    stats.increment('invalidations', len(tags))
+
+
+def results(data):
+    """The serialized objects of a response, whether paginated, a list or a single object"""
+    if isinstance(data, dict) and 'results' in data:
+        return data['results']
+    if isinstance(data, list):
+        return data
+    return [data] if isinstance(data, dict) else []
+
+
+def song_tags(data):
+    tags = set()
+    for song in results(data):
+        tags.add(f"song:{song['id']}")
+        tags.update(f"artist:{artist['id']}" for artist in song.get('artists', ()))
+        tags.update(f"genre:{genre['id']}" for genre in song.get('genres', ()))
+    return tags
+
+
+def album_tags(data):
+    tags = set()
+    for album in results(data):
+        tags.add(f"album:{album['id']}")
+        if album.get('artist_detail'):
+            tags.add(f"artist:{album['artist_detail']['id']}")
+    return tags
+
+
+def artist_tags(data):
+    return {f"artist:{artist['id']}" for artist in results(data)}
+
+
+def genre_tags(data):
+    return {f"genre:{genre['id']}" for genre in results(data)}
@@ -0,0 +1,83 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from genres.models import Genre
+from songs.tests import create_songs
+from .metrics import stats
+from .tags import get_cache
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        stats.reset()
+        self.client = APIClient()
+        self.songs = create_songs(3, title='Cached')
+        self.other_songs = create_songs(2, title='Other')
+        self.album = self.songs[0].album
+
+    def test_hit_skips_the_database(self):
+        url = f'/api/v1/albums/{self.album.id}/get_all_songs/'
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(stats.snapshot()['hits'], 1)
+
+    def test_query_params_are_part_of_the_key(self):
+        self.client.get('/api/v1/albums/')
+        response = self.client.get('/api/v1/albums/?page_size=1')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(stats.snapshot()['misses'], 2)
+
+    def test_etag_revalidation(self):
+        url = f'/api/v1/songs/{self.songs[0].id}/details/'
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_saving_an_album_evicts_only_its_entries(self):
+        own = f'/api/v1/albums/{self.album.id}/'
+        other = f'/api/v1/albums/{self.other_songs[0].album_id}/get_all_songs/'
+        for url in (own, other, '/api/v1/genres/'):
+            self.client.get(url)
+
+        self.album.title = 'Renamed'
+        self.album.save()
+
+        self.assertEqual(self.client.get(own).data['title'], 'Renamed')
+        with self.assertNumQueries(0):
+            self.client.get(other)
+            self.client.get('/api/v1/genres/')
+
+    def test_nested_changes_invalidate(self):
+        url = f'/api/v1/songs/{self.songs[0].id}/details/'
+        self.client.get(url)
+        artist = self.songs[0].artists.get()
+        artist.name = 'New Name'
+        artist.save()
+        self.assertEqual(self.client.get(url).data['artists'][0]['name'], 'New Name')
+
+        self.songs[0].genres.add(Genre.objects.create(name='Jazz'))
+        self.assertEqual(len(self.client.get(url).data['genres']), 2)
+
+    def test_moving_a_song_refreshes_both_albums(self):
+        source = f'/api/v1/albums/{self.album.id}/get_all_songs/'
+        target_album = self.other_songs[0].album
+        target = f'/api/v1/albums/{target_album.id}/get_all_songs/'
+        self.client.get(source)
+        self.client.get(target)
+
+        song = self.songs[0]
+        song.album = target_album
+        song.save()
+
+        self.assertEqual(len(self.client.get(source).data['results']), 2)
+        self.assertEqual(len(self.client.get(target).data['results']), 3)
+
+    def test_stats_endpoint_is_admin_only(self):
+        self.assertEqual(self.client.get('/api/v1/cache/').status_code, 403)
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='secret'))
+        self.assertIn('hit_rate', self.client.get('/api/v1/cache/').data)
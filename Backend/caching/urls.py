@@ -0,0 +1,10 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from .views import CacheStatsViewSet
+
+router = DefaultRouter()
+router.register(r'cache', CacheStatsViewSet, basename='cache')
+
+urlpatterns = [
+    path('', include(router.urls)),
+]
@@ -0,0 +1,12 @@
+from rest_framework import viewsets, permissions, status
+from rest_framework.response import Response
+
+from .metrics import stats
+
+
+class CacheStatsViewSet(viewsets.ViewSet):
+    permission_classes = [permissions.IsAdminUser]
+
+    def list(self, request):
+        """Response cache hit/miss counters of the worker serving this request"""
+        return Response(stats.snapshot(), status=status.HTTP_200_OK)
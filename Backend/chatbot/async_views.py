@@ -0,0 +1,265 @@
+"""
+Non-blocking chat endpoint for ASGI deployments (``uvicorn root.asgi:application``).
+
+LLM calls are awaited on the event loop instead of pinning a worker thread, and
+independent steps overlap: the user's message is stored while the first LLM
+call (or the conversation context query) is in flight, and with CHATBOT_SPECULATIVE_KEYWORDS the fallback keyword
+call runs alongside the catalog search. Catalog search reuses the sync helpers
+in services.py via sync_to_async.
+"""
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+
+from .governor import LLMUnavailable, deadline
+from .llm import get_llm
+from .models import Conversation, Message
+from .serializers import ChatInputSerializer
+from . import context, entities, intent_cache, services
+
+logger = logging.getLogger(__name__)
+
+
+async def _generate(llm, contents, default=''):
+    try:
+        return await llm.agenerate(contents)
+    except Exception as e:
+        logger.warning(f"Error calling LLM: {str(e)}")
+        return default
+
+
+def _search(search_params):
+    return list(services.find_songs(search_params))
+
+
+def _search_keywords(keywords):
+    return list(services.find_songs_by_keywords(keywords))
+
+
+def _similar_songs(songs):
+    return list(services.similar_songs(songs)) or songs
+
+
+def _random_songs():
+    return list(services.random_songs())
+
+
+async def _search_params(llm, query, save_user_message):
+    search_params = await sync_to_async(entities.extract)(query)
+    if search_params is not None:
+        await save_user_message
+        return search_params
+
+    cache = intent_cache.get_cache()
+    search_params = await cache.aget(intent_cache.PARAMS, query)
+    if search_params is not None:
+        await save_user_message
+        return search_params
+
+    extraction, _ = await asyncio.gather(
+        _generate(llm, services.user_contents(services.extraction_prompt(query))),
+        save_user_message,
+    )
+    search_params = services.parse_extraction(extraction)
+    if search_params is None:
+        return services.fallback_search_params(query)
+    await cache.aset(intent_cache.PARAMS, query, search_params)
+    return search_params
+
+
+async def _keywords(llm, query):
+    cache = intent_cache.get_cache()
+    keywords = await cache.aget(intent_cache.KEYWORDS, query)
+    if keywords is not None:
+        return keywords
+    try:
+        text = await llm.agenerate(services.user_contents(services.keyword_prompt(query)))
+    except Exception as e:
+        logger.warning(f"Error calling LLM: {str(e)}")
+        return []
+    keywords = services.parse_keywords(text)
+    await cache.aset(intent_cache.KEYWORDS, query, keywords)
+    return keywords
+
+
+async def select_songs(llm, query, save_user_message):
+    """Extract search params and pick the songs to recommend; returns (search_params, songs, songs_data)"""
+    search_params = await _search_params(llm, query, save_user_message)
+
+    keywords_task = None
+    if settings.CHATBOT_SPECULATIVE_KEYWORDS:
+        # Ask for fallback keywords while the structured search runs
+        keywords_task = asyncio.ensure_future(_keywords(llm, query))
+
+    songs = await sync_to_async(_search)(search_params)
+    if songs:
+        if keywords_task:
+            keywords_task.cancel()
+    else:
+        keywords = await (keywords_task or _keywords(llm, query))
+        songs = await sync_to_async(_search_keywords)(keywords)
+
+    if songs and services.is_similarity_request(query):
+        # "songs like X": X was matched, recommend its neighbours instead
+        songs = await sync_to_async(_similar_songs)(songs)
+
+    if not songs:
+        songs = await sync_to_async(_random_songs)()
+
+    songs_data = await sync_to_async(services.serialize_songs)(songs)
+    return search_params, songs, songs_data
+
+
+async def recommend(llm, query, conversation, save_user_message):
+    search_params, songs, songs_data = await select_songs(llm, query, save_user_message)
+    try:
+        reply = await llm.agenerate(
+            services.user_contents(services.reply_prompt(query, search_params, songs_data))
+        )
+    except LLMUnavailable as e:
+        logger.warning(f"Replying without the LLM: {str(e)}")
+        reply = services.catalog_reply(songs_data)
+    await sync_to_async(services.save_assistant_message)(conversation, reply, songs)
+    return {
+        'conversation_id': conversation.id,
+        'message': reply,
+        'songs': songs_data
+    }
+
+
+async def converse(llm, conversation, user_message, save_user_message):
+    contents, _ = await asyncio.gather(
+        context.aconversation_contents(conversation, llm, user_message),
+        save_user_message,
+    )
+    try:
+        reply = await llm.agenerate(contents)
+    except LLMUnavailable as e:
+        logger.warning(f"Replying without the LLM: {str(e)}")
+        reply = services.UNAVAILABLE_REPLY
+    await sync_to_async(services.save_assistant_message)(conversation, reply)
+    return {
+        'conversation_id': conversation.id,
+        'message': reply,
+        'songs': []  # No songs for regular conversation
+    }
+
+
+async def prepare_chat(request):
+    """Validate the request and open the conversation; returns (error_response, context)"""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=403), None
+
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400), None
+
+    serializer = ChatInputSerializer(data=payload)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400), None
+
+    message_content = serializer.validated_data['message']
+    conversation_id = serializer.validated_data.get('conversation_id')
+
+    # Get or create conversation
+    if conversation_id:
+        conversation = await Conversation.objects.filter(id=conversation_id, user=user).afirst()
+        if conversation is None:
+            return JsonResponse({'error': 'Conversation not found'}, status=404), None
+    else:
+        conversation = await Conversation.objects.acreate(user=user)
+
+    user_message = Message(conversation=conversation, role='user', content=message_content)
+    return None, (conversation, user_message)
+
+
+@require_POST
+async def chat(request):
+    error, context = await prepare_chat(request)
+    if error:
+        return error
+    conversation, user_message = context
+
+    llm = get_llm()
+    save_user_message = user_message.asave()
+    with deadline(settings.CHATBOT_REPLY_DEADLINE):
+        if services.is_song_recommendation_request(user_message.content):
+            data = await recommend(llm, user_message.content, conversation, save_user_message)
+        else:
+            data = await converse(llm, conversation, user_message, save_user_message)
+    return JsonResponse(data)
+
+
+def _sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+async def chat_events(llm, conversation, user_message):
+    """Server-Sent Events for one chat turn: conversation, songs, token..., done"""
+    yield _sse('conversation', {'conversation_id': conversation.id})
+
+    with deadline(settings.CHATBOT_REPLY_DEADLINE):
+        save_user_message = user_message.asave()
+        songs = []
+        if services.is_song_recommendation_request(user_message.content):
+            search_params, songs, songs_data = await select_songs(llm, user_message.content, save_user_message)
+            # Songs go out before the reply starts generating
+            yield _sse('songs', songs_data)
+            contents = services.user_contents(
+                services.reply_prompt(user_message.content, search_params, songs_data)
+            )
+            fallback = services.catalog_reply(songs_data)
+        else:
+            contents, _ = await asyncio.gather(
+                context.aconversation_contents(conversation, llm, user_message),
+                save_user_message,
+            )
+            fallback = services.UNAVAILABLE_REPLY
+
+        parts = []
+        try:
+            async for token in llm.astream(contents):
+                parts.append(token)
+                yield _sse('token', {'text': token})
+        except LLMUnavailable as e:
+            # Raised before the first token only
+            logger.warning(f"Replying without the LLM: {str(e)}")
+            parts.append(fallback)
+            yield _sse('token', {'text': fallback})
+        except Exception as e:
+            logger.warning(f"Error streaming LLM reply: {str(e)}")
+            yield _sse('error', {'error': 'The assistant reply could not be generated'})
+            return
+
+        # Persisted once the full reply exists, with the songs already sent
+        message = await sync_to_async(services.save_assistant_message)(conversation, ''.join(parts), songs)
+        yield _sse('done', {
+            'conversation_id': conversation.id,
+            'message_id': message.id,
+            'message': message.content,
+        })
+
+
+@require_POST
+async def chat_stream(request):
+    error, context = await prepare_chat(request)
+    if error:
+        return error
+    conversation, user_message = context
+
+    response = StreamingHttpResponse(
+        chat_events(get_llm(), conversation, user_message),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,214 @@
+"""
+Bounded LLM context for long conversations.
+
+A conversation turn sends the system prompt, a stored summary of the older
+turns and the most recent messages that fit in CHATBOT_CONTEXT_TOKENS, so
+the prompt stops growing with the conversation. The recent messages come
+from one indexed query for the conversation's tail (at most
+CHATBOT_CONTEXT_MAX_MESSAGES rows), never from the full history.
+
+Messages that fall out of the window are folded into the summary with one
+summarization call. Older window messages are folded along with them until
+the window is down to half the budget, so the next few turns need no
+summarization at all. The same happens when the unsummarized messages fill
+the whole tail. Unsummarized messages older than the tail (left by turns
+that never built a context, such as recommendations) are first added to the
+summary extractively, so nothing drops out of the prompt unsummarized.
+
+The summary and the id of the last message it covers are stored on the
+conversation. Token counts are estimated from the text length; the budget
+is a bound on prompt size, not an exact count.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import Conversation
+from . import services
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+SUMMARY_ACK = "Got it, I'll keep that in mind."
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _role(message):
+    return 'Assistant' if message.role == 'assistant' else 'User'
+
+
+def summary_prompt(summary, messages):
+    transcript = '\n'.join(f'{_role(message)}: {message.content}' for message in messages)
+    words = settings.CHATBOT_SUMMARY_TOKENS * 3 // 4
+    return f"""
+        Update the running summary of a conversation between a user and a music assistant.
+        Keep the user's tastes, requests and preferences and anything the assistant suggested.
+        Answer with the updated summary only, in at most {words} words.
+
+        Summary so far:
+        {summary or '(none)'}
+
+        Conversation to add:
+        {transcript}
+        """
+
+
+def extractive_summary(summary, messages):
+    """Summary without an LLM: the previous one followed by the new user messages, oldest dropped first"""
+    parts = [summary] if summary else []
+    parts += [f'User said: {message.content}' for message in messages if message.role == 'user']
+    return ' '.join(' '.join(parts).split())
+
+
+def _clip(summary):
+    # Keep the end: the most recent part of a summary is the most relevant
+    limit = settings.CHATBOT_SUMMARY_TOKENS * CHARS_PER_TOKEN
+    return summary if len(summary) <= limit else summary[-limit:].lstrip()
+
+
+def plan(messages, summarized_until, budget, max_window=None):
+    """
+    Split the conversation tail (oldest first) into (window, to_fold): the
+    unsummarized messages to send as they are, and the ones to add to the
+    summary first (empty when the summary is current). With ``max_window``
+    the window is also folded down to that many messages.
+    """
+    unsummarized = [
+        message for message in messages
+        if message.pk is None or summarized_until is None or message.pk > summarized_until
+    ]
+    start = len(unsummarized)
+    used = 0
+    while start > 0:
+        used += estimate_tokens(unsummarized[start - 1].content)
+        # The latest message is always sent, whatever its size
+        if used > budget and start < len(unsummarized):
+            break
+        start -= 1
+    to_fold, window = unsummarized[:start], unsummarized[start:]
+    if to_fold:
+        used = sum(estimate_tokens(message.content) for message in window)
+        # The last exchange is never folded
+        while len(window) > 2 and used > budget // 2:
+            used -= estimate_tokens(window[0].content)
+            to_fold.append(window.pop(0))
+    if max_window:
+        while len(window) > max(max_window, 2):
+            to_fold.append(window.pop(0))
+    return window, to_fold
+
+
+def contents(summary, window):
+    """Gemini contents for a conversation turn: system prompt, summary, recent messages"""
+    prefix = []
+    if summary:
+        prefix = [
+            {"role": "user", "parts": [f"Summary of our conversation so far: {summary}"]},
+            {"role": "model", "parts": [SUMMARY_ACK]},
+        ]
+    history = services.conversation_contents(window)
+    return history[:len(services.SYSTEM_PROMPT)] + prefix + history[len(services.SYSTEM_PROMPT):]
+
+
+def _tail(conversation):
+    # Newest first, read backwards along the (conversation, timestamp) index
+    return conversation.messages.order_by('-timestamp', '-id')[:settings.CHATBOT_CONTEXT_MAX_MESSAGES]
+
+
+def _outran_summary(conversation, tail):
+    """The tail (newest first) is full and all unsummarized: older messages may be missing from the summary"""
+    return len(tail) >= settings.CHATBOT_CONTEXT_MAX_MESSAGES and (
+        conversation.summarized_until is None or tail[-1].pk > conversation.summarized_until
+    )
+
+
+def _backlog(conversation, tail):
+    """Unsummarized messages older than the tail, oldest first"""
+    older = conversation.messages.filter(pk__lt=tail[-1].pk)
+    if conversation.summarized_until is not None:
+        older = older.filter(pk__gt=conversation.summarized_until)
+    return older.order_by('timestamp', 'id').only('id', 'role', 'content')
+
+
+def _max_window(conversation, tail):
+    # A tail full of unsummarized messages is folded down to half, so the next
+    # turns' tails start inside the summary again
+    return settings.CHATBOT_CONTEXT_MAX_MESSAGES // 2 if _outran_summary(conversation, tail) else None
+
+
+def _with_pending(tail, pending):
+    messages = list(reversed(tail))
+    # The unsaved message may have been saved (and fetched) while the tail was loading
+    if pending is not None and all(message.pk != pending.pk for message in messages):
+        messages.append(pending)
+    return messages
+
+
+def _store(conversation, summary, to_fold):
+    """Save a new summary unless a concurrent turn already moved it on"""
+    summarized_until = to_fold[-1].pk
+    updated = Conversation.objects.filter(
+        pk=conversation.pk, summarized_until=conversation.summarized_until,
+    ).update(summary=summary, summarized_until=summarized_until)
+    if not updated:
+        logger.debug(f"Summary of conversation {conversation.pk} was updated concurrently")
+    conversation.summary, conversation.summarized_until = summary, summarized_until
+
+
+def _new_summary(conversation, to_fold, reply=None, error=None):
+    """The summarizer's reply, or the extractive summary when it failed or is not used"""
+    if reply and reply.strip():
+        return _clip(reply.strip())
+    if error is not None:
+        logger.warning(f"Error summarizing conversation {conversation.pk}: {str(error)}")
+    return _clip(extractive_summary(conversation.summary, to_fold))
+
+
+def conversation_contents(conversation, llm, pending=None):
+    """
+    Contents for the next reply in ``conversation``. ``pending`` is the
+    user's new message when it is not saved yet.
+    """
+    tail = list(_tail(conversation))
+    max_window = _max_window(conversation, tail)
+    if max_window:
+        backlog = list(_backlog(conversation, tail))
+        if backlog:
+            # Any length, so no LLM call: the user's messages, clipped to the summary size
+            _store(conversation, _clip(extractive_summary(conversation.summary, backlog)), backlog)
+    messages = _with_pending(tail, pending)
+    window, to_fold = plan(messages, conversation.summarized_until, settings.CHATBOT_CONTEXT_TOKENS, max_window)
+    if to_fold:
+        reply = error = None
+        if settings.CHATBOT_CONTEXT_SUMMARIZER == 'llm':
+            try:
+                reply = llm.generate(services.user_contents(summary_prompt(conversation.summary, to_fold)))
+            except Exception as e:
+                error = e
+        _store(conversation, _new_summary(conversation, to_fold, reply, error), to_fold)
+    return contents(conversation.summary, window)
+
+
+async def aconversation_contents(conversation, llm, pending=None):
+    """conversation_contents for the async views (the summary call uses llm.agenerate)"""
+    tail = [message async for message in _tail(conversation)]
+    max_window = _max_window(conversation, tail)
+    if max_window:
+        backlog = [message async for message in _backlog(conversation, tail)]
+        if backlog:
+            await sync_to_async(_store)(conversation, _clip(extractive_summary(conversation.summary, backlog)), backlog)
+    messages = _with_pending(tail, pending)
+    window, to_fold = plan(messages, conversation.summarized_until, settings.CHATBOT_CONTEXT_TOKENS, max_window)
+    if to_fold:
+        reply = error = None
+        if settings.CHATBOT_CONTEXT_SUMMARIZER == 'llm':
+            try:
+                reply = await llm.agenerate(services.user_contents(summary_prompt(conversation.summary, to_fold)))
+            except Exception as e:
+                error = e
+        await sync_to_async(_store)(conversation, _new_summary(conversation, to_fold, reply, error), to_fold)
+    return contents(conversation.summary, window)
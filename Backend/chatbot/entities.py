@@ -0,0 +1,268 @@
+"""
+Local extraction of search params from recommendation requests.
+
+Song titles, album titles, artist names and genre names from the catalog are
+compiled into an Aho–Corasick automaton over normalized word tokens, so one
+pass over the message finds every catalog phrase it mentions. When every
+content word of the message is accounted for by unambiguous matches, the
+params are returned directly and the LLM extraction call is skipped;
+otherwise extract() returns None and the caller asks the LLM.
+
+The automaton is never built inside a request: a background thread builds a
+new one (at startup, on first use, after a catalog change or after
+CHATBOT_LOCAL_EXTRACTOR_TTL) and swaps it in when done. Until then requests
+keep using the previous one, or ask the LLM when there is none yet.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from albums.models import Album
+from artists.models import Artist
+from caching.metrics import CacheStats
+from genres.models import Genre
+from search.documents import tokenize
+from songs.models import Song
+from .intent_cache import FILLER_WORDS
+
+logger = logging.getLogger(__name__)
+
+TITLE = 'title'
+ARTIST = 'artist_name'
+ALBUM = 'album_title'
+GENRE = 'genre'
+
+# Words that say which field the following phrase belongs to
+CUES_BEFORE = {
+    'by': ARTIST, 'artist': ARTIST, 'singer': ARTIST, 'band': ARTIST,
+    'album': ALBUM, 'record': ALBUM,
+    'song': TITLE, 'track': TITLE, 'called': TITLE, 'named': TITLE, 'titled': TITLE,
+    'genre': GENRE,
+}
+CUES_AFTER = {
+    'album': ALBUM, 'record': ALBUM,
+    'music': GENRE, 'songs': GENRE, 'tracks': GENRE,
+}
+IGNORED_WORDS = FILLER_WORDS | set(CUES_BEFORE) | set(CUES_AFTER) | {
+    'and', 'with', 'from', 'is', 'it', 'that', 'this', 'something',
+}
+ARTICLES = {'the', 'a', 'an'}
+
+stats = CacheStats()
+
+
+class PhraseMatcher:
+    """Aho–Corasick automaton whose alphabet is word tokens rather than characters"""
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._depth = [0]
+        # node -> payload for nodes that end a phrase
+        self._payload = {}
+        # node -> phrase-ending nodes reachable through fail links (itself included)
+        self._outputs = [()]
+
+    def add(self, tokens, kind, name):
+        node = 0
+        for token in tokens:
+            child = self._goto[node].get(token)
+            if child is None:
+                child = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._depth.append(self._depth[node] + 1)
+                self._outputs.append(())
+                self._goto[node][token] = child
+            node = child
+        # First catalog spelling wins for each kind
+        self._payload.setdefault(node, {}).setdefault(kind, name)
+
+    def build(self):
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            own = (node,) if node in self._payload else ()
+            self._outputs[node] = own + self._outputs[self._fail[node]]
+            for token, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(token, 0)
+                queue.append(child)
+        return self
+
+    def __len__(self):
+        return len(self._payload)
+
+    def find(self, tokens):
+        """(start, end, {kind: name}) for every phrase occurrence in the token list"""
+        node = 0
+        for i, token in enumerate(tokens):
+            while node and token not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(token, 0)
+            for match in self._outputs[node]:
+                yield i + 1 - self._depth[match], i + 1, self._payload[match]
+
+
+class EntityExtractor:
+    def __init__(self, matcher):
+        self.matcher = matcher
+
+    @classmethod
+    def build(cls):
+        matcher = PhraseMatcher()
+        sources = (
+            (GENRE, Genre.objects.values_list('name', flat=True)),
+            (ARTIST, Artist.objects.values_list('name', flat=True)),
+            (ALBUM, Album.objects.values_list('title', flat=True)),
+            (TITLE, Song.objects.values_list('title', flat=True)),
+        )
+        for kind, names in sources:
+            for name in names.iterator(chunk_size=5000):
+                tokens = tokenize(name)
+                # Phrases made only of request words ("Play", "Songs") would match every message
+                if tokens and not all(token in IGNORED_WORDS for token in tokens):
+                    matcher.add(tokens, kind, name)
+        return cls(matcher.build())
+
+    def _kind(self, tokens, start, end, kinds):
+        cue = None
+        before = start - 1
+        while before >= 0 and tokens[before] in ARTICLES:
+            before -= 1
+        if before >= 0 and tokens[before] in CUES_BEFORE:
+            cue = CUES_BEFORE[tokens[before]]
+        elif end < len(tokens) and tokens[end] in CUES_AFTER:
+            cue = CUES_AFTER[tokens[end]]
+        if cue in kinds:
+            return cue
+        if len(kinds) == 1:
+            return next(iter(kinds))
+        return None
+
+    def extract(self, query):
+        """Search params when the message is fully explained by catalog phrases, else None"""
+        tokens = tokenize(query)
+        matches = sorted(self.matcher.find(tokens), key=lambda m: (m[0], m[0] - m[1]))
+
+        search_params = {TITLE: None, ARTIST: None, ALBUM: None, GENRE: None}
+        covered = set()
+        position = 0
+        # Leftmost-longest non-overlapping matches
+        for start, end, kinds in matches:
+            if start < position:
+                continue
+            kind = self._kind(tokens, start, end, kinds)
+            if kind is None:
+                return None
+            name = kinds[kind]
+            if search_params[kind] not in (None, name):
+                # Two different artists/titles/...: leave it to the LLM
+                return None
+            search_params[kind] = name
+            covered.update(range(start, end))
+            position = end
+
+        leftover = [token for i, token in enumerate(tokens) if i not in covered and token not in IGNORED_WORDS]
+        if leftover:
+            return None
+        return search_params
+
+
+_extractor = None
+_built_at = 0.0
+# Bumped by catalog changes; the extractor is current while _built_version matches
+_version = 0
+_built_version = 0
+_building = False
+_lock = threading.Lock()
+
+
+def enabled():
+    return getattr(settings, 'CHATBOT_LOCAL_EXTRACTOR', True)
+
+
+def refresh():
+    """Build an extractor from the catalog in this thread and swap it in; returns it"""
+    global _extractor, _built_at, _built_version
+    with _lock:
+        version = _version
+    extractor = EntityExtractor.build()
+    with _lock:
+        _extractor = extractor
+        _built_at = time.monotonic()
+        # A change made while building still needs another build
+        _built_version = version
+    return extractor
+
+
+def _refresh_in_background():
+    global _building
+    try:
+        refresh()
+    except Exception as e:
+        stats.increment('errors')
+        logger.warning(f"Error building the entity extractor: {str(e)}")
+    finally:
+        connection.close()
+        with _lock:
+            _building = False
+
+
+def _start_building():
+    global _building
+    with _lock:
+        if _building:
+            return
+        _building = True
+    threading.Thread(target=_refresh_in_background, name='entity-extractor', daemon=True).start()
+
+
+def warm():
+    """
+    Start building a new extractor in a background thread, unless one is
+    already being built. Inside a transaction this waits for the commit, so
+    the build sees its changes.
+    """
+    transaction.on_commit(_start_building)
+
+
+def get_extractor():
+    """
+    The worker's current extractor, or None before the first build. Never
+    builds in the caller: a stale one (catalog change, or older than
+    CHATBOT_LOCAL_EXTRACTOR_TTL seconds) keeps serving while warm() replaces it.
+    """
+    extractor = _extractor
+    if (extractor is None or _built_version != _version
+            or time.monotonic() - _built_at > settings.CHATBOT_LOCAL_EXTRACTOR_TTL):
+        warm()
+    return extractor
+
+
+def invalidate():
+    global _version
+    with _lock:
+        _version += 1
+
+
+def extract(query):
+    """Params from the local extractor, or None when the LLM should be asked"""
+    if not enabled():
+        return None
+    extractor = get_extractor()
+    if extractor is None:
+        stats.increment('not_ready')
+        return None
+    search_params = extractor.extract(query)
+    stats.increment('hits' if search_params is not None else 'misses')
+    return search_params
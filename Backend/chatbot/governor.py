@@ -0,0 +1,455 @@
+"""
+Governor for outbound LLM calls, shared by every provider of the process.
+
+- Concurrency: at most CHATBOT_LLM_MAX_CONCURRENCY calls in flight; the
+  others wait for a slot.
+- Rate: a token bucket refilled at CHATBOT_LLM_RATE calls per second,
+  holding up to CHATBOT_LLM_BURST.
+- Deadlines: a call gives up after CHATBOT_LLM_TIMEOUT seconds, or sooner
+  when the chat turn's deadline() is closer. Waiting for a slot or a token
+  counts against it, and a call that cannot start in time is not made. The
+  caller gets LLMUnavailable and degrades (catalog-only reply, heuristic
+  search params, extractive summary).
+- Coalescing: identical generate calls in flight at the same time share one
+  provider call (streams are never shared).
+
+Limits are per process: split a provider quota between worker processes.
+LLMProvider applies the governor to every provider method, so call sites
+only handle LLMUnavailable.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from caching.metrics import CacheStats
+
+SETTINGS = {
+    'CHATBOT_LLM_MAX_CONCURRENCY', 'CHATBOT_LLM_RATE', 'CHATBOT_LLM_BURST',
+    'CHATBOT_LLM_TIMEOUT', 'CHATBOT_LLM_COALESCE',
+}
+# Threads for timed blocking calls when concurrency is not capped
+UNCAPPED_THREADS = 32
+
+_deadline = contextvars.ContextVar('llm_deadline', default=None)
+# Set while a governed call runs, so provider methods calling each other are governed once
+_governed = contextvars.ContextVar('llm_governed', default=False)
+
+
+class LLMUnavailable(Exception):
+    """The LLM call was not made, or not finished, in time"""
+
+
+class LLMTimeout(LLMUnavailable):
+    pass
+
+
+class LLMOverloaded(LLMUnavailable):
+    """No concurrency slot or rate token became free before the deadline"""
+
+
+@contextmanager
+def deadline(seconds):
+    """Make every LLM call in the block end within ``seconds`` from now (0 or None: no bound)"""
+    if not seconds:
+        yield
+        return
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(at if current is None else min(current, at))
+    try:
+        yield
+    finally:
+        try:
+            _deadline.reset(token)
+        except ValueError:
+            # An async generator closed from another context; its own context is gone anyway
+            pass
+
+
+def time_left(timeout=None):
+    """Seconds until the nearer of ``timeout`` and the current deadline; None when neither is set"""
+    at = _deadline.get()
+    left = None if at is None else at - time.monotonic()
+    if timeout:
+        left = timeout if left is None else min(left, timeout)
+    return left
+
+
+def _since(budget, started):
+    return None if budget is None else budget - (time.monotonic() - started)
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.clock = clock
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait=None):
+        """
+        Take a token; returns how long to wait before using it, or None
+        (taking nothing) when that would be longer than ``max_wait``.
+        """
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+            if max_wait is not None and wait > max_wait:
+                return None
+            self.tokens -= 1
+            return wait
+
+
+def _wake_future(loop, future):
+    def wake():
+        if not future.done():
+            future.set_result(None)
+    try:
+        loop.call_soon_threadsafe(wake)
+    except RuntimeError:
+        # The waiting loop is closed
+        pass
+
+
+class Slots:
+    """A counting semaphore usable from threads and event loops alike (limit 0: unlimited)"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.peak = 0
+        self._waiters = []
+        self._lock = threading.Lock()
+
+    def try_acquire(self, waiter=None):
+        with self._lock:
+            if self.limit and self.active >= self.limit:
+                if waiter is not None:
+                    self._waiters.append(waiter)
+                return False
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            return True
+
+    def acquire(self, timeout=None):
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            event = threading.Event()
+            if self.try_acquire(event.set):
+                return True
+            left = None if end is None else end - time.monotonic()
+            if left is not None and left <= 0:
+                return False
+            event.wait(left)
+
+    async def aacquire(self, timeout=None):
+        loop = asyncio.get_running_loop()
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            future = loop.create_future()
+            if self.try_acquire(lambda: _wake_future(loop, future)):
+                return True
+            left = None if end is None else end - time.monotonic()
+            if left is not None and left <= 0:
+                return False
+            try:
+                await asyncio.wait_for(future, left)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+            # Every waiter retries; the ones that gave up ignore the wake-up
+            waiters, self._waiters = self._waiters, []
+        for wake in waiters:
+            wake()
+
+
+class Governor:
+    def __init__(self, max_concurrency=0, rate=0, burst=1, timeout=0, coalesce=True):
+        self.slots = Slots(max_concurrency)
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.timeout = timeout or None
+        self.coalesce = coalesce
+        self.stats = CacheStats()
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_concurrency or UNCAPPED_THREADS, thread_name_prefix='llm')
+
+    def _budget(self):
+        budget = time_left(self.timeout)
+        if budget is not None and budget <= 0:
+            self.stats.increment('timeouts')
+            raise LLMTimeout('The deadline passed before the LLM call')
+        return budget
+
+    def _admitted(self, started):
+        self.stats.increment('calls')
+        self.stats.increment('wait_ms', (time.monotonic() - started) * 1000)
+
+    def _overloaded(self, reason):
+        self.stats.increment('rejected')
+        return LLMOverloaded(f'{reason} before the deadline')
+
+    def _admit(self, budget):
+        """Wait for a rate token and a slot; returns the seconds left of ``budget``"""
+        started = time.monotonic()
+        if self.bucket is not None:
+            wait = self.bucket.reserve(budget)
+            if wait is None:
+                raise self._overloaded('No LLM call allowed by the rate limit')
+            if wait:
+                self.stats.increment('rate_limited')
+                time.sleep(wait)
+        if not self.slots.try_acquire():
+            self.stats.increment('queued')
+            if not self.slots.acquire(_since(budget, started)):
+                raise self._overloaded('No free LLM call slot')
+        self._admitted(started)
+        return _since(budget, started)
+
+    async def _aadmit(self, budget):
+        started = time.monotonic()
+        if self.bucket is not None:
+            wait = self.bucket.reserve(budget)
+            if wait is None:
+                raise self._overloaded('No LLM call allowed by the rate limit')
+            if wait:
+                self.stats.increment('rate_limited')
+                await asyncio.sleep(wait)
+        if not self.slots.try_acquire():
+            self.stats.increment('queued')
+            if not await self.slots.aacquire(_since(budget, started)):
+                raise self._overloaded('No free LLM call slot')
+        self._admitted(started)
+        return _since(budget, started)
+
+    def _timed_out(self, budget):
+        self.stats.increment('timeouts')
+        return LLMTimeout(f'The LLM call took longer than {budget:.2f}s')
+
+    def _follow(self, key):
+        """The in-flight call for ``key`` to wait on, or None after registering a new one"""
+        if not self.coalesce or key is None:
+            return None, None
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.stats.increment('coalesced')
+                return flight, None
+            self._flights[key] = Future()
+            return None, self._flights[key]
+
+    def _land(self, key, flight, result=None, error=None):
+        with self._lock:
+            self._flights.pop(key, None)
+        if error is not None:
+            flight.set_exception(error)
+        else:
+            flight.set_result(result)
+
+    def call(self, func, key=None):
+        """func() (a blocking provider call) under the limits; callers with the same ``key`` share it"""
+        if _governed.get():
+            return func()
+        flight, leading = self._follow(key)
+        if flight is not None:
+            budget = time_left(self.timeout)
+            try:
+                return flight.result(budget)
+            except FutureTimeout:
+                raise self._timed_out(budget)
+        try:
+            result = self._call(func)
+        except BaseException as e:
+            if leading is not None:
+                self._land(key, leading, error=e)
+            raise
+        if leading is not None:
+            self._land(key, leading, result)
+        return result
+
+    def _call(self, func):
+        budget = self._budget()
+        left = self._admit(budget)
+        context = contextvars.copy_context()
+        context.run(_governed.set, True)
+        if left is None:
+            try:
+                return context.run(func)
+            finally:
+                self.slots.release()
+        # The slot is held until the provider call returns, even when the caller stops waiting
+        future = self._pool.submit(context.run, func)
+        future.add_done_callback(lambda _: self.slots.release())
+        try:
+            return future.result(left)
+        except FutureTimeout:
+            raise self._timed_out(budget)
+
+    async def acall(self, func, key=None):
+        """await func() (a provider coroutine) under the limits; callers with the same ``key`` share it"""
+        if _governed.get():
+            return await func()
+        flight, leading = self._follow(key)
+        if flight is not None:
+            budget = time_left(self.timeout)
+            try:
+                # Shielded: a follower giving up must not cancel the shared call
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(flight)), budget)
+            except asyncio.TimeoutError:
+                raise self._timed_out(budget)
+        try:
+            result = await self._acall(func)
+        except BaseException as e:
+            if leading is not None:
+                self._land(key, leading, error=e)
+            raise
+        if leading is not None:
+            self._land(key, leading, result)
+        return result
+
+    async def _acall(self, func):
+        budget = self._budget()
+        left = await self._aadmit(budget)
+        token = _governed.set(True)
+        try:
+            return await asyncio.wait_for(func(), left)
+        except asyncio.TimeoutError:
+            raise self._timed_out(budget)
+        finally:
+            _governed.reset(token)
+            self.slots.release()
+
+    def stream(self, func):
+        """Chunks of func() (a provider generator); the deadline bounds the wait for the first chunk"""
+        if _governed.get():
+            yield from func()
+            return
+        budget = self._budget()
+        left = self._admit(budget)
+        # Each chunk is produced in this context, whichever context iterates the stream
+        context = contextvars.copy_context()
+        context.run(_governed.set, True)
+        chunks = None
+        abandoned = False
+        try:
+            chunks = context.run(func)
+            if left is not None:
+                # As in _call, the first chunk is produced in the pool so the wait for it can be cut short
+                first = self._pool.submit(context.run, next, chunks)
+                try:
+                    chunk = first.result(left)
+                except StopIteration:
+                    return
+                except FutureTimeout:
+                    # The provider call is still running: close it and free the slot when it returns
+                    abandoned = True
+                    first.add_done_callback(lambda _: self._abandon(context, chunks))
+                    raise self._timed_out(budget)
+                yield chunk
+            while True:
+                try:
+                    chunk = context.run(next, chunks)
+                except StopIteration:
+                    return
+                yield chunk
+        finally:
+            if not abandoned:
+                if chunks is not None:
+                    context.run(chunks.close)
+                self.slots.release()
+
+    def _abandon(self, context, chunks):
+        try:
+            context.run(chunks.close)
+        finally:
+            self.slots.release()
+
+    async def astream(self, func):
+        """Chunks of func() (a provider async generator); the deadline bounds the wait for the first chunk"""
+        if _governed.get():
+            async for chunk in func():
+                yield chunk
+            return
+        budget = self._budget()
+        left = await self._aadmit(budget)
+        context = contextvars.copy_context()
+        context.run(_governed.set, True)
+        chunks = None
+        try:
+            chunks = context.run(func)
+            first = True
+            while True:
+                step = asyncio.create_task(chunks.__anext__(), context=context)
+                try:
+                    chunk = await asyncio.wait_for(step, left if first else None)
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    raise self._timed_out(budget)
+                first = False
+                yield chunk
+        finally:
+            if chunks is not None:
+                await chunks.aclose()
+            self.slots.release()
+
+    def snapshot(self):
+        counts = self.stats.snapshot()
+        counts.pop('hit_rate', None)
+        calls = counts.get('calls', 0)
+        counts['wait_ms'] = round(counts.get('wait_ms', 0), 3)
+        counts['mean_wait_ms'] = round(counts['wait_ms'] / calls, 3) if calls else 0.0
+        counts.update({
+            'active': self.slots.active,
+            'peak_active': self.slots.peak,
+            'in_flight_prompts': len(self._flights),
+            'max_concurrency': self.slots.limit,
+            'rate': self.bucket.rate if self.bucket else 0,
+            'burst': self.bucket.capacity if self.bucket else 0,
+            'timeout': self.timeout or 0,
+        })
+        return counts
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor():
+    global _governor
+    if _governor is None:
+        with _governor_lock:
+            if _governor is None:
+                _governor = Governor(
+                    settings.CHATBOT_LLM_MAX_CONCURRENCY,
+                    settings.CHATBOT_LLM_RATE,
+                    settings.CHATBOT_LLM_BURST,
+                    settings.CHATBOT_LLM_TIMEOUT,
+                    settings.CHATBOT_LLM_COALESCE,
+                )
+    return _governor
+
+
+def reset():
+    global _governor
+    _governor = None
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    if setting in SETTINGS:
+        reset()
@@ -0,0 +1,148 @@
+"""
+Cache for the LLM extraction and keyword calls of song recommendation requests.
+
+Requests are keyed on their normalized content words, so "play some jazz" and
+"recommend jazz songs" share an entry. A bounded in-process LRU with a TTL
+answers most lookups; when CHATBOT_INTENT_CACHE_ALIAS names a Django cache,
+entries are also written there so they survive restarts and are shared
+between workers.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from caching.metrics import CacheStats
+from search.documents import tokenize
+
+PARAMS = 'params'
+KEYWORDS = 'keywords'
+
+# Bump when the extraction or keyword prompts change so old answers are not reused
+VERSION = 1
+
+# Words that only say "give me music", not which music
+FILLER_WORDS = {
+    'a', 'an', 'the', 'some', 'any', 'me', 'my', 'i', 'im', 'to', 'for', 'of', 'please', 'pls',
+    'can', 'could', 'would', 'you', 'want', 'wanna', 'need', 'give', 'show', 'get', 'let', 'lets',
+    'play', 'recommend', 'suggest', 'find', 'listen', 'hear', 'put', 'on',
+    'song', 'songs', 'track', 'tracks', 'music', 'tune', 'tunes',
+}
+
+stats = CacheStats()
+
+
+def normalize_query(query):
+    tokens = {token for token in tokenize(query) if token not in FILLER_WORDS}
+    return ' '.join(sorted(tokens))
+
+
+class IntentCache:
+    def __init__(self, max_entries, ttl, alias=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.alias = alias
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, kind, query):
+        digest = hashlib.sha1(normalize_query(query).encode()).hexdigest()
+        return f'chatbot-intent:v{VERSION}:{kind}:{digest}'
+
+    def _local_get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                stats.increment('expired')
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _local_set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                stats.increment('evictions')
+
+    def get(self, kind, query):
+        """The cached search params / keyword list for the query, or None"""
+        if not self.max_entries:
+            return None
+        key = self.key(kind, query)
+        value = self._local_get(key)
+        if value is None and self.alias:
+            value = caches[self.alias].get(key)
+            if value is not None:
+                stats.increment('store_hits')
+                self._local_set(key, value)
+        stats.increment('hits' if value is not None else 'misses')
+        stats.increment(f'{kind}_hits' if value is not None else f'{kind}_misses')
+        return value
+
+    def set(self, kind, query, value):
+        if not self.max_entries:
+            return
+        key = self.key(kind, query)
+        self._local_set(key, value)
+        if self.alias:
+            caches[self.alias].set(key, value, timeout=self.ttl)
+
+    async def aget(self, kind, query):
+        if self.alias:
+            return await sync_to_async(self.get)(kind, query)
+        return self.get(kind, query)
+
+    async def aset(self, kind, query, value):
+        if self.alias:
+            return await sync_to_async(self.set)(kind, query, value)
+        return self.set(kind, query, value)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def snapshot(self):
+        counts = stats.snapshot()
+        counts['entries'] = len(self)
+        counts['max_entries'] = self.max_entries
+        return counts
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = IntentCache(
+                    settings.CHATBOT_INTENT_CACHE_SIZE,
+                    settings.CHATBOT_INTENT_CACHE_TTL,
+                    settings.CHATBOT_INTENT_CACHE_ALIAS,
+                )
+    return _cache
+
+
+def reset():
+    global _cache
+    _cache = None
+    stats.reset()
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    if setting.startswith('CHATBOT_INTENT_CACHE_'):
+        reset()
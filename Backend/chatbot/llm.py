@@ -0,0 +1,271 @@
+"""
+LLM providers for the chatbot, selected with settings.CHATBOT_LLM_BACKEND.
+
+The backend is either a name from PROVIDERS or the dotted path of an
+LLMProvider subclass. Every provider takes Gemini-style contents (a role/parts
+dict or a list of them) and offers generate/agenerate and stream/astream.
+"""
+import asyncio
+import hashlib
+import inspect
+import json
+import re
+import time
+from functools import lru_cache, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from instrumentation.recorder import timed
+from . import governor, services
+
+PROVIDERS = {
+    'gemini': 'chatbot.llm.GeminiProvider',
+    'local': 'chatbot.llm.LocalLLMProvider',
+}
+
+_TOKEN = re.compile(r'\S+\s*')
+
+
+def _timed_call(method):
+    """
+    Wrap a provider method so its time is reported as an LLM call of the
+    current request. Streams count the time spent waiting for each chunk,
+    not the time the caller takes between chunks.
+    """
+    if inspect.isasyncgenfunction(method):
+        @wraps(method)
+        async def wrapper(self, contents):
+            chunks = method(self, contents)
+            first = True
+            try:
+                while True:
+                    with timed('llm', outermost_only=True, count=first):
+                        try:
+                            chunk = await chunks.__anext__()
+                        except StopAsyncIteration:
+                            return
+                    first = False
+                    yield chunk
+            finally:
+                await chunks.aclose()
+    elif inspect.iscoroutinefunction(method):
+        @wraps(method)
+        async def wrapper(self, contents):
+            with timed('llm', outermost_only=True):
+                return await method(self, contents)
+    elif inspect.isgeneratorfunction(method):
+        @wraps(method)
+        def wrapper(self, contents):
+            chunks = method(self, contents)
+            first = True
+            try:
+                while True:
+                    with timed('llm', outermost_only=True, count=first):
+                        try:
+                            chunk = next(chunks)
+                        except StopIteration:
+                            return
+                    first = False
+                    yield chunk
+            finally:
+                chunks.close()
+    else:
+        @wraps(method)
+        def wrapper(self, contents):
+            with timed('llm', outermost_only=True):
+                return method(self, contents)
+    return wrapper
+
+
+def _governed_call(method):
+    """Wrap a provider method so it runs under the outbound call governor"""
+    if inspect.isasyncgenfunction(method):
+        @wraps(method)
+        async def wrapper(self, contents):
+            async for chunk in governor.get_governor().astream(lambda: method(self, contents)):
+                yield chunk
+    elif inspect.iscoroutinefunction(method):
+        @wraps(method)
+        async def wrapper(self, contents):
+            return await governor.get_governor().acall(lambda: method(self, contents), self.coalescing_key(contents))
+    elif inspect.isgeneratorfunction(method):
+        @wraps(method)
+        def wrapper(self, contents):
+            yield from governor.get_governor().stream(lambda: method(self, contents))
+    else:
+        @wraps(method)
+        def wrapper(self, contents):
+            return governor.get_governor().call(lambda: method(self, contents), self.coalescing_key(contents))
+    return wrapper
+
+
+def _prompt_text(contents):
+    """The text of the last turn of a Gemini-style contents payload"""
+    if isinstance(contents, list):
+        contents = contents[-1] if contents else {}
+    if isinstance(contents, dict):
+        return ' '.join(str(part) for part in contents.get('parts', []))
+    return str(contents)
+
+
+class LLMProvider:
+    """
+    Base provider. Subclasses implement generate; the other methods fall back
+    to it (async variants in a worker thread, streams as a single chunk).
+    Every implementation runs under the governor (and so can raise
+    governor.LLMUnavailable) and is timed for the request instrumentation.
+    """
+    CALLS = ('generate', 'agenerate', 'stream', 'astream')
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in cls.CALLS:
+            if name in cls.__dict__:
+                setattr(cls, name, _timed_call(_governed_call(cls.__dict__[name])))
+
+    @classmethod
+    def from_settings(cls):
+        return cls()
+
+    def coalescing_key(self, contents):
+        """Identical in-flight calls with the same key share one reply"""
+        prompt = json.dumps(contents, sort_keys=True, default=str)
+        digest = hashlib.sha1(prompt.encode()).hexdigest()
+        return f'{type(self).__module__}.{type(self).__qualname__}:{getattr(self, "model_name", "")}:{digest}'
+
+    def generate(self, contents):
+        raise NotImplementedError
+
+    async def agenerate(self, contents):
+        return await sync_to_async(self.generate, thread_sensitive=False)(contents)
+
+    def stream(self, contents):
+        yield self.generate(contents)
+
+    async def astream(self, contents):
+        yield await self.agenerate(contents)
+
+
+class GeminiProvider(LLMProvider):
+    def __init__(self, model_name, api_key):
+        # Imported lazily: the SDK is slow to import and not needed by the local provider
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(settings.CHATBOT_LLM_MODEL, settings.GEMINI_API_KEY)
+
+    def generate(self, contents):
+        return self.model.generate_content(contents).text
+
+    async def agenerate(self, contents):
+        response = await self.model.generate_content_async(contents)
+        return response.text
+
+    def stream(self, contents):
+        for chunk in self.model.generate_content(contents, stream=True):
+            yield chunk.text
+
+    async def astream(self, contents):
+        response = await self.model.generate_content_async(contents, stream=True)
+        async for chunk in response:
+            yield chunk.text
+
+
+@lru_cache(maxsize=None)
+def load_rules(path):
+    """Rules file: a JSON list of {"pattern": regex, "response": template}"""
+    with open(path) as f:
+        return tuple((re.compile(rule['pattern'], re.IGNORECASE | re.DOTALL), rule['response'])
+                     for rule in json.load(f))
+
+
+class LocalLLMProvider(LLMProvider):
+    """
+    Deterministic offline provider for load tests and latency benchmarks.
+
+    Replies come from the first matching rule (the regex is searched in the
+    last turn's text and the response is expanded with its groups), then from
+    built-in answers to the extraction, keyword and summary prompts, then
+    DEFAULT_REPLY.
+    ``latency`` is paid before the first token and ``token_latency`` after
+    each streamed token.
+    """
+    DEFAULT_REPLY = 'Here is what I found for you.'
+
+    def __init__(self, latency=0.0, token_latency=0.0, rules=()):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.rules = rules
+
+    @classmethod
+    def from_settings(cls):
+        path = settings.CHATBOT_LOCAL_LLM_RULES
+        return cls(
+            latency=settings.CHATBOT_LOCAL_LLM_LATENCY,
+            token_latency=settings.CHATBOT_LOCAL_LLM_TOKEN_LATENCY,
+            rules=load_rules(path) if path else (),
+        )
+
+    def reply(self, contents):
+        prompt = _prompt_text(contents)
+        for pattern, response in self.rules:
+            match = pattern.search(prompt)
+            if match:
+                return match.expand(response)
+
+        match = re.search(r'Extract search parameters from this music request: "(.*)"', prompt)
+        if match:
+            return json.dumps(services.fallback_search_params(match.group(1)))
+        match = re.search(r'search terms for finding music from this request: "(.*)"', prompt)
+        if match:
+            words = re.findall(r'\w+', match.group(1).lower())
+            return ', '.join(word for word in words if len(word) > 3)
+        match = re.search(r'Summary so far:\s*(.*?)\s*Conversation to add:\s*(.*)', prompt, re.DOTALL)
+        if match:
+            previous = '' if match.group(1) == '(none)' else match.group(1)
+            said = [line.strip()[len('User: '):] for line in match.group(2).splitlines() if line.strip().startswith('User: ')]
+            return ' '.join([previous] + [f'User said: {text}' for text in said]).strip()
+        return self.DEFAULT_REPLY
+
+    def generate(self, contents):
+        time.sleep(self.latency)
+        return self.reply(contents)
+
+    async def agenerate(self, contents):
+        await asyncio.sleep(self.latency)
+        return self.reply(contents)
+
+    def stream(self, contents):
+        time.sleep(self.latency)
+        for token in _TOKEN.findall(self.reply(contents)):
+            yield token
+            time.sleep(self.token_latency)
+
+    async def astream(self, contents):
+        await asyncio.sleep(self.latency)
+        for token in _TOKEN.findall(self.reply(contents)):
+            yield token
+            await asyncio.sleep(self.token_latency)
+
+
+def get_provider_class(backend=None):
+    backend = backend or settings.CHATBOT_LLM_BACKEND
+    try:
+        provider_class = import_string(PROVIDERS.get(backend, backend))
+    except ImportError as e:
+        raise ImproperlyConfigured(f'Unknown CHATBOT_LLM_BACKEND {backend!r}') from e
+    if not (isinstance(provider_class, type) and issubclass(provider_class, LLMProvider)):
+        raise ImproperlyConfigured(f'CHATBOT_LLM_BACKEND {backend!r} is not an LLMProvider')
+    return provider_class
+
+
+def get_llm(backend=None):
+    return get_provider_class(backend).from_settings()
@@ -0,0 +1,107 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from albums.models import Album
+from artists.models import Artist
+from genres.models import Genre
+from songs.models import Song
+from chatbot import services
+from chatbot.entities import EntityExtractor
+from chatbot.models import Message
+
+# (template, fields the local extractor should fill); None means the LLM should be asked
+TEMPLATES = [
+    ('play {title}', ('title',)),
+    ('I want to listen to {title}', ('title',)),
+    ('can I hear the song {title} by {artist}', ('title', 'artist_name')),
+    ('play songs by {artist}', ('artist_name',)),
+    ('recommend some {genre} music', ('genre',)),
+    ('play the album {album}', ('album_title',)),
+    ('find me songs like {title}', None),
+    ('recommend upbeat {genre} songs for running', None),
+    ('suggest music that sounds like {artist} but more acoustic', None),
+    ('play something relaxing to study to', None),
+]
+
+
+class Command(BaseCommand):
+    help = 'Measure how many LLM extraction calls the local entity extractor avoids on a sample corpus'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', help='File with one chat message per line')
+        parser.add_argument('--history', type=int, help='Use the N most recent user chat messages')
+        parser.add_argument('--samples', type=int, default=500, help='Messages to synthesize from the catalog')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def synthesize(self, count, seed):
+        rng = random.Random(seed)
+        songs = list(Song.objects.values_list('id', 'title', 'album_id')[:5000])
+        if not songs:
+            raise CommandError('The catalog is empty; pass --corpus or --history instead')
+        albums = dict(Album.objects.values_list('id', 'title'))
+        artists = list(Artist.objects.values_list('name', flat=True)[:5000])
+        genres = list(Genre.objects.values_list('name', flat=True)) or ['pop']
+
+        samples = []
+        for _ in range(count):
+            template, fields = rng.choice(TEMPLATES)
+            _, title, album_id = rng.choice(songs)
+            values = {
+                'title': title,
+                'artist': rng.choice(artists) if artists else '',
+                'album': albums.get(album_id, title),
+                'genre': rng.choice(genres),
+            }
+            samples.append((template.format(**values), fields))
+        return samples
+
+    def handle(self, *args, **options):
+        if options['corpus']:
+            with open(options['corpus']) as f:
+                samples = [(line.strip(), None) for line in f if line.strip()]
+            labelled = False
+        elif options['history']:
+            messages = Message.objects.filter(role='user').order_by('-timestamp')[:options['history']]
+            samples = [(content, None) for content in messages.values_list('content', flat=True)]
+            labelled = False
+        else:
+            samples = self.synthesize(options['samples'], options['seed'])
+            labelled = True
+
+        started = time.perf_counter()
+        extractor = EntityExtractor.build()
+        build_time = time.perf_counter() - started
+
+        requests = resolved = expected_local = correct = 0
+        timings = []
+        for message, fields in samples:
+            if not services.is_song_recommendation_request(message):
+                continue
+            requests += 1
+            started = time.perf_counter()
+            search_params = extractor.extract(message)
+            timings.append(time.perf_counter() - started)
+            if search_params is not None:
+                resolved += 1
+            if labelled and fields is not None:
+                expected_local += 1
+                if search_params is not None and all(search_params[field] for field in fields):
+                    correct += 1
+
+        self.stdout.write(f'Dictionary: {len(extractor.matcher)} phrases, built in {build_time * 1000:.1f} ms')
+        self.stdout.write(f'Messages: {len(samples)}, recommendation requests: {requests}')
+        if not requests:
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'LLM extraction calls avoided: {resolved}/{requests} ({resolved / requests:.1%})'
+        ))
+        timings.sort()
+        self.stdout.write(
+            f'Extraction time: mean {statistics.mean(timings) * 1e6:.1f} us, '
+            f'p95 {timings[int(len(timings) * 0.95)] * 1e6:.1f} us'
+        )
+        if labelled and expected_local:
+            self.stdout.write(f'Simple requests resolved with the expected fields: {correct}/{expected_local}')
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:53
+
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+PREVIEW_LENGTH = 120
+
+
+def message_preview(content):
+    return Truncator(' '.join(content.split())).chars(PREVIEW_LENGTH)
+
+
+def summarize_existing_conversations(apps, schema_editor):
+    Conversation = apps.get_model('chatbot', 'Conversation')
+    Message = apps.get_model('chatbot', 'Message')
+    summaries = []
+    current = None
+    messages = Message.objects.order_by('conversation_id', 'timestamp', 'id').values_list('conversation_id', 'role', 'content')
+    for conversation_id, role, content in messages.iterator(chunk_size=5000):
+        if current is None or current.id != conversation_id:
+            current = Conversation(id=conversation_id, message_count=0)
+            summaries.append(current)
+        current.message_count += 1
+        current.last_message_role = role
+        current.last_message_preview = message_preview(content)
+        if len(summaries) >= 1000:
+            # The last one may still get messages
+            Conversation.objects.bulk_update(summaries[:-1], ['message_count', 'last_message_role', 'last_message_preview'])
+            summaries = summaries[-1:]
+    Conversation.objects.bulk_update(summaries, ['message_count', 'last_message_role', 'last_message_preview'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0002_conversation_message_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_preview',
+            field=models.CharField(blank=True, max_length=120),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_role',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(summarize_existing_conversations, migrations.RunPython.noop),
+    ]
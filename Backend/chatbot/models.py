@@ -1,11 +1,50 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils.text import Truncator
 from songs.models import Song  # Import Song model
 
+# Characters of the last message shown in the conversation list
+PREVIEW_LENGTH = 120
+
+
+def message_preview(content):
+    return Truncator(' '.join(content.split())).chars(PREVIEW_LENGTH)
+
+class ConversationQuerySet(models.QuerySet):
+    def with_messages(self):
+        return self.prefetch_related(
+            models.Prefetch('messages', queryset=Message.objects.with_songs())
+        )
+
+class MessageQuerySet(models.QuerySet):
+    def with_songs(self):
+        return self.prefetch_related(
+            models.Prefetch('recommended_songs', queryset=Song.objects.with_related())
+        )
+
+    def after(self, message):
+        """Messages newer than ``message`` (in timestamp, id order)"""
+        return self.filter(
+            models.Q(timestamp__gt=message.timestamp) | models.Q(timestamp=message.timestamp, id__gt=message.id)
+        )
+
 class Conversation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Kept up to date by a signal as messages are added, so the list never reads messages
+    message_count = models.PositiveIntegerField(default=0)
+    last_message_role = models.CharField(max_length=10, blank=True)
+    last_message_preview = models.CharField(max_length=PREVIEW_LENGTH, blank=True)
+    # Rolling summary of the messages up to summarized_until (a message id), see chatbot/context.py
+    summary = models.TextField(blank=True)
+    summarized_until = models.BigIntegerField(null=True, blank=True)
+
+    objects = ConversationQuerySet.as_manager()
+
+    class Meta:
+        # A user's conversations, most recently active first (the list endpoint's cursor order)
+        indexes = [models.Index(fields=['user', '-updated_at', '-id'], name='conversation_user_recent')]
     
     def __str__(self):
         return f"Conversation with {self.user.username} on {self.created_at.strftime('%Y-%m-%d')}"
@@ -21,9 +60,12 @@ class Message(models.Model):
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
     recommended_songs = models.ManyToManyField(Song, blank=True, related_name='recommendations')
+
+    objects = MessageQuerySet.as_manager()
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [models.Index(fields=['conversation', 'timestamp'], name='message_conversation_time')]
         
     def __str__(self):
         return f"{self.role}: {self.content}"
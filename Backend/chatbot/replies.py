@@ -0,0 +1,90 @@
+"""
+The synchronous chat pipeline: the assistant's reply to a saved user message.
+
+Used by ChatbotViewSet.chat in the request and by the chatbot.generate_reply
+job when the client asks for a background reply.
+"""
+import logging
+
+from django.conf import settings
+
+from .governor import LLMUnavailable, deadline
+from . import context, services
+
+logger = logging.getLogger(__name__)
+
+
+def recommend(model, query, conversation):
+    # Use Gemini to extract search parameters from the query
+    search_params = services.extract_search_params(model, query)
+
+    # Debug what was extracted
+    logger.debug(f"Final search params: {search_params}")
+
+    songs = list(services.find_songs(search_params))
+
+    # If no songs found with specific criteria, look for keywords
+    if not songs:
+        logger.debug("No direct matches found, trying keyword search")
+        try:
+            keywords = services.extract_keywords(model, query)
+            logger.debug(f"Extracted keywords: {keywords}")
+            songs = list(services.find_songs_by_keywords(keywords))
+        except Exception as e:
+            logger.warning(f"Error in keyword extraction: {str(e)}")
+
+    if songs and services.is_similarity_request(query):
+        # "songs like X": X was matched, recommend its neighbours instead
+        songs = list(services.similar_songs(songs)) or songs
+
+    # If still no songs found, use random selection
+    if not songs:
+        songs = list(services.random_songs())
+
+    # Generate response message with Gemini
+    songs_data = services.serialize_songs(songs)
+    try:
+        reply = model.generate(services.user_contents(services.reply_prompt(query, search_params, songs_data)))
+    except LLMUnavailable as e:
+        logger.warning(f"Replying without the LLM: {str(e)}")
+        reply = services.catalog_reply(songs_data)
+
+    services.save_assistant_message(conversation, reply, songs)
+
+    return {
+        'conversation_id': conversation.id,
+        'message': reply,
+        'songs': songs_data
+    }
+
+
+def respond(model, conversation, message_content):
+    """Answer the user's latest message; returns the chat response data"""
+    with deadline(settings.CHATBOT_REPLY_DEADLINE):
+        return _respond(model, conversation, message_content)
+
+
+def _respond(model, conversation, message_content):
+    # Check if message is about song recommendations
+    is_recommendation = services.is_song_recommendation_request(message_content)
+    logger.debug(f"Is recommendation request: {is_recommendation} for message: '{message_content}'")
+
+    if is_recommendation:
+        logger.debug("Handling as song recommendation")
+        return recommend(model, message_content, conversation)
+
+    # Regular conversation with Gemini: recent messages plus a summary of the older ones
+    try:
+        reply = model.generate(context.conversation_contents(conversation, model))
+    except LLMUnavailable as e:
+        logger.warning(f"Replying without the LLM: {str(e)}")
+        reply = services.UNAVAILABLE_REPLY
+
+    # Save assistant response
+    assistant_message = services.save_assistant_message(conversation, reply)
+
+    return {
+        'conversation_id': conversation.id,
+        'message': assistant_message.content,
+        'songs': []  # No songs for regular conversation
+    }
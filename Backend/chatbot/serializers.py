@@ -16,9 +16,18 @@ class ConversationSerializer(serializers.ModelSerializer):
         model = Conversation
         fields = ['id', 'user', 'created_at', 'updated_at', 'messages']
 
+class ConversationSummarySerializer(serializers.ModelSerializer):
+    """A conversation without its messages, for the conversation list"""
+
+    class Meta:
+        model = Conversation
+        fields = ['id', 'created_at', 'updated_at', 'message_count', 'last_message_role', 'last_message_preview']
+
 class ChatInputSerializer(serializers.Serializer):
     message = serializers.CharField(required=True)
     conversation_id = serializers.IntegerField(required=False, allow_null=True)
+    # Answer 202 with a job id instead of waiting for the reply
+    background = serializers.BooleanField(required=False, default=False)
 
 class ChatResponseSerializer(serializers.Serializer):
     conversation_id = serializers.IntegerField()
@@ -0,0 +1,421 @@
+"""
+Chat pipeline steps shared by the synchronous ChatbotViewSet and the async views.
+
+Everything here is either pure (prompt building, parsing) or plain sync ORM
+work; the async views run the latter through sync_to_async.
+"""
+import json
+import logging
+
+from django.conf import settings
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from songs.models import Song
+from songs.serializers import SongSerializer
+from recommendations.embeddings import similar_song_ids
+from recommendations.sampling import sample_song_ids
+from search.backends import get_backend
+from .models import Message
+from . import entities, intent_cache
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDATION_LIMIT = 5
+
+SYSTEM_PROMPT = [
+    # Add system prompt as a user message followed by model response
+    {
+        "role": "user",
+        "parts": ["You are a helpful music assistant for SpotifAI. You can discuss music, artists, genres, and provide recommendations."]
+    },
+    {
+        "role": "model",
+        "parts": ["I'll be your music assistant for SpotifAI. How can I help you today?"]
+    },
+]
+
+# Replies used when the LLM is unavailable (see governor.py)
+CATALOG_REPLY = "Here are some songs I found for you:"
+CATALOG_REPLY_EMPTY = "I couldn't find any songs for that right now. Please try again in a moment."
+UNAVAILABLE_REPLY = "Sorry, I'm getting a lot of requests right now. Please try again in a moment."
+
+# Requests answered with songs like the matched ones rather than the matches themselves
+SIMILARITY_PHRASES = ["similar to", "songs like", "music like", "tracks like", "sounds like"]
+
+EMPTY_SEARCH_PARAMS = {
+    'title': None,
+    'artist_name': None,
+    'album_title': None,
+    'genre': None
+}
+
+
+def is_song_recommendation_request(message):
+    message_lower = message.lower()
+
+    # Expanded phrases that clearly indicate music requests
+    recommendation_phrases = [
+        # Recommendation requests
+        "recommend music", "recommend me a song", "suggest a song",
+        "recommend songs", "song recommendation", "music recommendation",
+        "suggest music", "recommend tracks", "recommend some songs",
+        "looking for music like", "find me songs", "songs similar to",
+        "songs like", "music like",
+
+        # Direct song requests - add these
+        "listen to", "want to hear", "play the song", "play song",
+        "want to listen", "can i hear", "play music", "play a song"
+    ]
+
+    # Check for explicit phrases first
+    for phrase in recommendation_phrases:
+        if phrase in message_lower:
+            return True
+
+    # Direct song title pattern: "song named X", "song called X", etc.
+    direct_patterns = [
+        "song named", "song called", "track called", "track named",
+        "titled", "title", "song title"
+    ]
+
+    for pattern in direct_patterns:
+        if pattern in message_lower:
+            return True
+
+    # More conservative check as before
+    request_verbs = ["recommend", "suggest", "find", "looking for",
+                    "listen", "play", "hear", "want"]  # Added more verbs
+    music_nouns = ["song", "track", "music", "album", "artist"]
+
+    # Check proximity
+    words = message_lower.split()
+    for i, word in enumerate(words):
+        if any(verb in word for verb in request_verbs):
+            start = max(0, i-5)
+            end = min(len(words), i+6)
+            context_words = words[start:end]
+            if any(noun in context_word for context_word in context_words for noun in music_nouns):
+                return True
+
+    return False
+
+
+def is_similarity_request(message):
+    message_lower = message.lower()
+    return any(phrase in message_lower for phrase in SIMILARITY_PHRASES)
+
+
+def conversation_contents(messages):
+    """Conversation history in Gemini's role/parts format, behind the system prompt"""
+    contents = list(SYSTEM_PROMPT)
+    for msg in messages:
+        # Map 'assistant' role to 'model' for Gemini API
+        role = "model" if msg.role == "assistant" else "user"
+        contents.append({
+            "role": role,
+            "parts": [msg.content]
+        })
+    return contents
+
+
+def user_contents(prompt):
+    return {
+        "role": "user",
+        "parts": [prompt]
+    }
+
+
+def extraction_prompt(query):
+    return f"""
+        Extract search parameters from this music request: "{query}"
+
+        Return a JSON with these fields:
+        - title (string or null): The song title the user wants to hear or is asking about
+        - artist_name (string or null): The artist name mentioned
+        - album_title (string or null): The album title mentioned
+        - genre (string or null): The music genre mentioned
+
+        For the title field:
+        - If the user asks for a specific song (e.g., "I want to listen to Song Name" or "play Song Name"), extract "Song Name" as the title
+        - If they say "a song named/called X", extract "X" as the title
+        - If they mention a song title in any other way, extract it
+
+        Only include fields that are explicitly mentioned. If a field is not mentioned, set it to null.
+        Format the response as valid JSON only, with no additional text.
+        """
+
+
+def _strip_code_fence(text):
+    text = text.strip()
+    if text.startswith('```'):
+        text = text.split('\n', 1)[1] if '\n' in text else ''
+        text = text.rsplit('```', 1)[0]
+    return text.strip()
+
+
+def fallback_search_params(query):
+    search_params = dict(EMPTY_SEARCH_PARAMS)
+
+    # Fallback extraction for direct title requests
+    title_indicators = ["song named", "song called", "listen to", "play", "hear"]
+    for indicator in title_indicators:
+        if indicator in query.lower():
+            # Try to extract what comes after the indicator
+            parts = query.lower().split(indicator, 1)
+            if len(parts) > 1:
+                potential_title = parts[1].strip()
+                # Remove common stopwords at the beginning
+                for stopword in ["the", "a", "an"]:
+                    if potential_title.startswith(stopword + " "):
+                        potential_title = potential_title[len(stopword)+1:]
+
+                # Cut off at the first punctuation or end of string
+                for punct in [",", ".", "!", "?", ";"]:
+                    if punct in potential_title:
+                        potential_title = potential_title.split(punct)[0]
+
+                search_params['title'] = potential_title.strip()
+                logger.debug(f"Fallback extraction found title: {search_params['title']}")
+                break
+    return search_params
+
+
+def parse_extraction(text):
+    """The extraction reply as a dict, or None if it is not a JSON object"""
+    try:
+        search_params = json.loads(_strip_code_fence(text))
+        if not isinstance(search_params, dict):
+            raise ValueError('Extraction reply is not a JSON object')
+        logger.debug(f"Extracted search params: {search_params}")
+        return search_params
+    except Exception as e:
+        logger.warning(f"Error parsing search parameters: {str(e)}")
+        return None
+
+
+def parse_search_params(text, query):
+    """Search params from the extraction reply, or the heuristic fallback if it is not JSON"""
+    search_params = parse_extraction(text)
+    if search_params is None:
+        return fallback_search_params(query)
+    return search_params
+
+
+def extract_search_params(llm, query):
+    """Search params for the query, from the local extractor, the intent cache or an extraction call"""
+    search_params = entities.extract(query)
+    if search_params is not None:
+        logger.debug(f"Locally extracted search params: {search_params}")
+        return search_params
+    cache = intent_cache.get_cache()
+    search_params = cache.get(intent_cache.PARAMS, query)
+    if search_params is not None:
+        logger.debug(f"Cached search params: {search_params}")
+        return search_params
+    try:
+        extraction = llm.generate(user_contents(extraction_prompt(query)))
+    except Exception as e:
+        logger.warning(f"Error extracting search parameters: {str(e)}")
+        extraction = ''
+    search_params = parse_extraction(extraction)
+    if search_params is None:
+        # Heuristic params are not cached so the LLM gets another chance next time
+        return fallback_search_params(query)
+    cache.set(intent_cache.PARAMS, query, search_params)
+    return search_params
+
+
+def keyword_prompt(query):
+    return f"""
+            Extract ONLY the most important 3-5 search terms for finding music from this request: "{query}"
+            Return ONLY a comma-separated list of keywords, no other text.
+            Example output: rock, 80s, upbeat, guitar
+            """
+
+
+def parse_keywords(text):
+    return [k.strip() for k in text.split(',') if k.strip()]
+
+
+def extract_keywords(llm, query):
+    cache = intent_cache.get_cache()
+    keywords = cache.get(intent_cache.KEYWORDS, query)
+    if keywords is None:
+        # Errors propagate so a failed call is not cached as "no keywords"
+        keywords = parse_keywords(llm.generate(user_contents(keyword_prompt(query))))
+        cache.set(intent_cache.KEYWORDS, query, keywords)
+    return keywords
+
+
+def find_songs(search_params):
+    """Songs matching the extracted params: exact title, then all title words, then field filters"""
+    search_fields = {}
+
+    # Apply filters with broader matching for titles
+    title_query = (search_params.get('title') or '').strip()
+    if len(title_query) > 1:  # Avoid single character searches
+        search_fields['title'] = title_query
+        logger.debug(f"Searching for title containing: '{title_query}'")
+
+        # Try case-insensitive exact match first
+        exact_matches = Song.objects.with_related().filter(title__iexact=title_query)[:RECOMMENDATION_LIMIT]
+        if exact_matches.exists():
+            logger.debug("Found exact title matches")
+            return exact_matches
+
+        # Try word-by-word matching
+        words = title_query.lower().split()
+        if len(words) > 1:  # Multi-word title
+            query_filter = Q()
+            for word in words:
+                if len(word) > 2:  # Only use words longer than 2 chars
+                    query_filter &= Q(title__icontains=word)
+
+            if query_filter:
+                word_matches = Song.objects.with_related().filter(query_filter)[:RECOMMENDATION_LIMIT]
+                if word_matches.exists():
+                    logger.debug("Found word-by-word matches")
+                    return word_matches
+
+    # Apply filters based on extracted parameters
+    if search_params.get('artist_name'):
+        search_fields['artists'] = search_params['artist_name']
+
+    if search_params.get('album_title'):
+        search_fields['album'] = search_params['album_title']
+
+    if search_params.get('genre'):
+        search_fields['genres'] = search_params['genre']
+
+    if not search_fields:
+        return Song.objects.none()
+
+    # Matched against the search documents instead of icontains joins
+    songs_query = get_backend().filter_songs_by_fields(Song.objects.with_related(), **search_fields)
+    return songs_query.distinct()[:RECOMMENDATION_LIMIT]
+
+
+def find_songs_by_keywords(keywords):
+    # Try each keyword individually
+    for keyword in keywords:
+        if len(keyword) > 2:  # Skip very short keywords
+            logger.debug(f"Searching with keyword: '{keyword}'")
+            # The search document already covers title, artists, album and genres
+            keyword_songs = get_backend().search_songs(keyword, RECOMMENDATION_LIMIT)
+            if keyword_songs.exists():
+                logger.debug(f"Found songs with keyword '{keyword}'")
+                return keyword_songs
+    return Song.objects.none()
+
+
+def random_songs():
+    logger.debug("No matches found, using random selection with randomized ordering")
+    # O(k) sample instead of loading and shuffling every song id
+    selected_ids = sample_song_ids(RECOMMENDATION_LIMIT, popularity=settings.CHATBOT_FALLBACK_POPULARITY)
+    return songs_in_order(selected_ids)
+
+
+def similar_songs(seed_songs):
+    """Songs like the seeds (as a group) from the embedding index, most similar first"""
+    return songs_in_order(similar_song_ids([song.id for song in seed_songs], RECOMMENDATION_LIMIT))
+
+
+def songs_in_order(song_ids):
+    if not song_ids:
+        return Song.objects.none()
+    # Query by ID to preserve the given order
+    preserved_order = Case(
+        *[When(id=id, then=Value(i)) for i, id in enumerate(song_ids)],
+        output_field=IntegerField()
+    )
+    return Song.objects.with_related().filter(id__in=song_ids).order_by(preserved_order)
+
+
+def serialize_songs(songs):
+    return SongSerializer(list(songs), many=True).data
+
+
+def describe_song(song):
+    return f"{song['title']} by {', '.join([artist['name'] for artist in song['artists']])}"
+
+
+def catalog_reply(songs_data):
+    """The reply to a song request when the LLM is unavailable: just the songs found"""
+    if not songs_data:
+        return CATALOG_REPLY_EMPTY
+    return CATALOG_REPLY + '\n' + '\n'.join(f'- {describe_song(song)}' for song in songs_data)
+
+
+def reply_prompt(query, search_params, songs_data):
+    song_descriptions = "\n".join([
+        f"- {describe_song(song)}"
+        for song in songs_data
+    ])
+
+    # Create a more specific prompt using the search parameters
+    recommendation_context = ""
+    if search_params.get('title'):
+        recommendation_context += f" song title '{search_params['title']}'"
+    if search_params.get('artist_name'):
+        recommendation_context += f" artist '{search_params['artist_name']}'"
+    if search_params.get('album_title'):
+        recommendation_context += f" album '{search_params['album_title']}'"
+    if search_params.get('genre'):
+        recommendation_context += f" genre '{search_params['genre']}'"
+
+    if not recommendation_context:
+        recommendation_context = "your music interests"
+
+    # Detect if this was a direct song request or a recommendation request
+    is_direct_request = False
+    direct_request_phrases = ["listen to", "play", "hear", "song named", "song called"]
+    for phrase in direct_request_phrases:
+        if phrase in query.lower():
+            is_direct_request = True
+            break
+
+    # Customize the prompt based on request type
+    if is_direct_request:
+        return f"""
+            The user asked to hear the song: "{query}"
+
+            Here are the closest matches I found:
+
+            {song_descriptions}
+
+            Please generate a friendly response that:
+            1. Acknowledges their request to hear the specific song
+            2. Presents the found songs as potential matches
+            3. For exact matches, be confident. For partial matches, acknowledge they might not be exactly what was requested
+            4. Ask if any of these songs are what they were looking for
+
+            Be conversational and helpful.
+            """
+
+    # Use the original recommendation prompt
+    return f"""
+            Based on the request for {recommendation_context.strip()}: "{query}", here are some recommended songs:
+
+            {song_descriptions}
+
+            Please generate a friendly and helpful response that:
+            1. Acknowledges the user's specific request
+            2. Introduces these song recommendations and explains why each might be a good match
+            3. Asks if they'd like to hear any of these or need other recommendations
+
+            Be conversational and natural.
+            """
+
+
+def save_assistant_message(conversation, content, songs=()):
+    # Save assistant response with associated songs
+    assistant_message = Message.objects.create(
+        conversation=conversation,
+        role='assistant',
+        content=content
+    )
+
+    # Add the recommended songs to the message
+    if songs:
+        assistant_message.recommended_songs.add(*songs)
+    return assistant_message
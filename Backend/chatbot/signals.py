@@ -0,0 +1,36 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from albums.models import Album
+from artists.models import Artist
+from genres.models import Genre
+from songs.models import Song
+from . import entities
+from .models import Conversation, Message, message_preview
+
+
+@receiver(post_save, sender=Song)
+@receiver(post_save, sender=Album)
+@receiver(post_save, sender=Artist)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Song)
+@receiver(post_delete, sender=Album)
+@receiver(post_delete, sender=Artist)
+@receiver(post_delete, sender=Genre)
+def catalog_changed(sender, **kwargs):
+    # Rebuilt in the background on the next request; other workers pick changes up after CHATBOT_LOCAL_EXTRACTOR_TTL
+    entities.invalidate()
+
+
+@receiver(post_save, sender=Message)
+def message_created(sender, instance, created, **kwargs):
+    # Messages are only ever added, so the summary is updated in place
+    if created:
+        Conversation.objects.filter(pk=instance.conversation_id).update(
+            message_count=F('message_count') + 1,
+            last_message_role=instance.role,
+            last_message_preview=message_preview(instance.content),
+            updated_at=timezone.now(),
+        )
@@ -0,0 +1,24 @@
+from django.conf import settings
+
+from jobs.queue import task
+from .llm import get_llm
+from .models import Message
+from . import replies, services
+
+
+@task(queue='llm', max_attempts=2, concurrency=settings.CHATBOT_JOB_CONCURRENCY)
+def generate_reply(conversation_id, message_id):
+    """
+    The reply to a saved user message (chat with background=true). A retry
+    after the reply was saved (or of a job requeued while running) returns
+    that reply instead of adding a second one.
+    """
+    message = Message.objects.select_related('conversation').get(id=message_id, conversation_id=conversation_id)
+    following = message.conversation.messages.after(message).with_songs().order_by('timestamp', 'id').first()
+    if following is not None and following.role == 'assistant':
+        return {
+            'conversation_id': conversation_id,
+            'message': following.content,
+            'songs': services.serialize_songs(following.recommended_songs.all()),
+        }
+    return replies.respond(get_llm(), message.conversation, message.content)
@@ -1,3 +1,640 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from albums.models import Album
+from artists.models import Artist
+from genres.models import Genre
+from recommendations import sampling
+from songs.tests import create_songs
+from .llm import LLMProvider, LocalLLMProvider, get_llm
+from .models import PREVIEW_LENGTH, Conversation, Message
+from . import context, entities, governor, intent_cache, services
+
+
+class ConversationQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('listener', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_conversation(self, message_count):
+        conversation = Conversation.objects.create(user=self.user)
+        songs = create_songs(3, title=f'Chat {message_count}')
+        for i in range(message_count):
+            message = Message.objects.create(conversation=conversation, role='assistant', content=f'Reply {i}')
+            message.recommended_songs.add(*songs)
+        return conversation
+
+    def test_conversations(self):
+        self.create_conversation(1)
+        with self.assertNumQueries(1):
+            self.client.get('/api/v1/chatbot/conversations/')
+        self.create_conversation(5)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/chatbot/conversations/')
+        self.assertEqual(len(response.data['results']), 2)
+        latest = response.data['results'][0]
+        self.assertEqual(latest['message_count'], 5)
+        self.assertEqual(latest['last_message_preview'], 'Reply 4')
+        self.assertNotIn('messages', latest)
+
+    def test_conversation_detail(self):
+        conversation = self.create_conversation(5)
+        with self.assertNumQueries(5):
+            response = self.client.get(f'/api/v1/chatbot/{conversation.id}/conversation_detail/')
+        self.assertEqual(len(response.data['messages']), 5)
+
+
+class MessageHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('listener', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.conversation = Conversation.objects.create(user=self.user)
+        self.messages = [
+            Message.objects.create(conversation=self.conversation, role='user' if i % 2 == 0 else 'assistant', content=f'Message {i}')
+            for i in range(7)
+        ]
+        self.url = f'/api/v1/chatbot/{self.conversation.id}/messages/'
+
+    def test_pages_go_back_in_time(self):
+        first = self.client.get(self.url, {'page_size': 3}).data
+        self.assertEqual([m['content'] for m in first['results']], ['Message 6', 'Message 5', 'Message 4'])
+        second = self.client.get(first['next']).data
+        self.assertEqual([m['content'] for m in second['results']], ['Message 3', 'Message 2', 'Message 1'])
+
+    def test_since_returns_only_newer_messages(self):
+        response = self.client.get(self.url, {'since': self.messages[4].id})
+        self.assertEqual([m['content'] for m in response.data['results']], ['Message 5', 'Message 6'])
+        response = self.client.get(self.url, {'since': self.messages[6].id})
+        self.assertEqual(response.data['results'], [])
+
+    def test_since_must_belong_to_the_conversation(self):
+        other = Conversation.objects.create(user=self.user)
+        message = Message.objects.create(conversation=other, role='user', content='Elsewhere')
+        self.assertEqual(self.client.get(self.url, {'since': message.id}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'since': 'latest'}).status_code, 400)
+
+    def test_other_users_conversations_are_hidden(self):
+        self.client.force_authenticate(User.objects.create_user('someone'))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_query_count_does_not_grow_with_history(self):
+        with self.assertNumQueries(3):
+            self.client.get(self.url, {'page_size': 2})
+        for i in range(20):
+            Message.objects.create(conversation=self.conversation, role='user', content=f'More {i}')
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_summary_follows_new_messages(self):
+        Message.objects.create(conversation=self.conversation, role='assistant', content='  A   long\nreply ' + 'x' * 200)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.message_count, 8)
+        self.assertEqual(self.conversation.last_message_role, 'assistant')
+        self.assertTrue(self.conversation.last_message_preview.startswith('A long reply x'))
+        self.assertEqual(len(self.conversation.last_message_preview), PREVIEW_LENGTH)
+
+
+@override_settings(CHATBOT_LLM_BACKEND='local', CHATBOT_LOCAL_LLM_LATENCY=0)
+class ChatTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('listener', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.songs = create_songs(3, title='Blue')
+        intent_cache.reset()
+        sampling.reset()
+
+    def test_conversation_turn(self):
+        response = self.client.post('/api/v1/chatbot/chat/', {'message': 'hello there'}, format='json')
+        self.assertEqual(response.data['songs'], [])
+        conversation = Conversation.objects.get(id=response.data['conversation_id'])
+        self.assertEqual(conversation.messages.count(), 2)
+
+    def test_title_request_prefers_exact_match(self):
+        with mock.patch('chatbot.llm.LocalLLMProvider.reply', side_effect=[
+            json.dumps({'title': 'Blue Song 1', 'artist_name': None, 'album_title': None, 'genre': None}),
+            'Enjoy!',
+        ]):
+            response = self.client.post('/api/v1/chatbot/chat/', {'message': 'play the song Blue Song 1'}, format='json')
+        self.assertEqual([song['id'] for song in response.data['songs']], [self.songs[1].id])
+        message = Message.objects.get(role='assistant')
+        self.assertEqual(list(message.recommended_songs.all()), [self.songs[1]])
+
+
+@override_settings(
+    CHATBOT_LLM_BACKEND='local', CHATBOT_LOCAL_LLM_LATENCY=0, CHATBOT_LOCAL_LLM_TOKEN_LATENCY=0,
+    CHATBOT_CONTEXT_TOKENS=100, CHATBOT_CONTEXT_MAX_MESSAGES=20, CHATBOT_SUMMARY_TOKENS=60,
+)
+class ContextWindowTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('listener', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.conversation = Conversation.objects.create(user=self.user)
+        intent_cache.reset()
+
+    def add_turns(self, count, start=0):
+        for i in range(start, start + count):
+            Message.objects.create(conversation=self.conversation, role='user', content=f'I like band number {i} a lot')
+            Message.objects.create(conversation=self.conversation, role='assistant', content='Noted, ' + 'la ' * 20)
+
+    def chat(self, message='tell me more'):
+        with mock.patch('chatbot.llm.LocalLLMProvider.reply', wraps=LocalLLMProvider().reply) as reply:
+            response = self.client.post(
+                '/api/v1/chatbot/chat/', {'message': message, 'conversation_id': self.conversation.id}, format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.conversation.refresh_from_db()
+        return [call.args[0] for call in reply.call_args_list]
+
+    def prompt_tokens(self, contents):
+        return sum(context.estimate_tokens(part) for turn in contents for part in turn['parts'])
+
+    def test_short_conversations_are_sent_whole(self):
+        self.add_turns(1)
+        (contents,) = self.chat()
+        self.assertEqual(len(contents), len(services.SYSTEM_PROMPT) + 3)
+        self.assertEqual(self.conversation.summary, '')
+
+    def test_prompt_size_is_bounded(self):
+        sizes = []
+        for turns in (5, 20, 40):
+            self.add_turns(turns)
+            *_, contents = self.chat()
+            sizes.append(self.prompt_tokens(contents))
+        system = self.prompt_tokens(services.SYSTEM_PROMPT)
+        summary = 60 + context.estimate_tokens(context.SUMMARY_ACK) + 10
+        self.assertTrue(all(size <= system + 100 + summary for size in sizes), sizes)
+        self.assertIn('band number', self.conversation.summary)
+
+    def test_summary_is_updated_incrementally(self):
+        self.add_turns(6)
+        summary_call, _ = self.chat()
+        first_until = self.conversation.summarized_until
+        self.assertIn('Summary so far:\n        (none)', summary_call['parts'][0])
+        # The window was folded down to half the budget: the next turn needs no summary call
+        self.assertEqual(len(self.chat()), 1)
+        self.add_turns(3, start=100)
+        summary_call, _ = self.chat()
+        prompt = summary_call['parts'][0]
+        self.assertGreater(self.conversation.summarized_until, first_until)
+        # Only messages newer than the stored summary are sent to the summarizer
+        self.assertNotIn('band number 0 ', prompt.split('Conversation to add:')[1])
+        self.assertIn('band number 100 ', prompt)
+
+    def test_each_turn_reads_only_the_tail(self):
+        self.add_turns(5)
+        self.chat()
+        with CaptureQueriesContext(connection) as short:
+            self.chat()
+        self.add_turns(100)
+        self.chat()
+        with CaptureQueriesContext(connection) as long:
+            self.chat()
+        message_reads = [query['sql'] for query in long.captured_queries if query['sql'].startswith('SELECT') and 'chatbot_message' in query['sql']]
+        self.assertEqual(len(message_reads), 1)
+        self.assertIn('LIMIT 20', message_reads[0])
+        self.assertEqual(len(long.captured_queries), len(short.captured_queries))
+
+    @override_settings(CHATBOT_CONTEXT_SUMMARIZER='extractive')
+    def test_extractive_summarizer_makes_no_llm_call(self):
+        self.add_turns(10)
+        self.assertEqual(len(self.chat()), 1)
+        self.assertTrue(self.conversation.summary.endswith('User said: I like band number 8 a lot'), self.conversation.summary)
+
+    @override_settings(CHATBOT_CONTEXT_SUMMARIZER='extractive', CHATBOT_CONTEXT_TOKENS=100000, CHATBOT_SUMMARY_TOKENS=2000)
+    def test_short_messages_beyond_the_tail_are_summarized(self):
+        # Far under the token budget, but more messages than the tail holds
+        for i in range(40):
+            Message.objects.create(conversation=self.conversation, role='user', content=f'band {i}')
+            Message.objects.create(conversation=self.conversation, role='assistant', content='ok')
+        (contents,) = self.chat()
+        self.assertIsNotNone(self.conversation.summarized_until)
+        for i in (0, 29, 35):
+            self.assertIn(f'User said: band {i} ', self.conversation.summary + ' ')
+        # The window is folded to half the tail, leaving room before the next fold
+        self.assertLessEqual(len(contents), len(services.SYSTEM_PROMPT) + 2 + 10)
+        summarized_until = self.conversation.summarized_until
+        self.chat()
+        self.assertEqual(self.conversation.summarized_until, summarized_until)
+
+    def test_failed_summary_falls_back_to_extractive(self):
+        self.add_turns(10)
+        with mock.patch('chatbot.llm.LocalLLMProvider.generate', side_effect=[RuntimeError('quota'), 'Sure!']), \
+                self.assertLogs('chatbot.context', 'WARNING'):
+            self.client.post('/api/v1/chatbot/chat/', {'message': 'hi', 'conversation_id': self.conversation.id}, format='json')
+        self.conversation.refresh_from_db()
+        self.assertIn('User said: I like band number', self.conversation.summary)
+
+    async def test_async_chat_uses_the_window(self):
+        await sync_to_async(self.add_turns)(20)
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        with mock.patch('chatbot.llm.LocalLLMProvider.reply', wraps=LocalLLMProvider().reply) as reply:
+            response = await client.post('/api/v1/chatbot/async/chat/', data=json.dumps({
+                'message': 'what else?', 'conversation_id': self.conversation.id,
+            }), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        contents = reply.call_args_list[-1].args[0]
+        self.assertEqual(contents[-1]['parts'], ['what else?'])
+        self.assertLessEqual(self.prompt_tokens(contents), self.prompt_tokens(services.SYSTEM_PROMPT) + 180)
+        conversation = await Conversation.objects.aget(id=self.conversation.id)
+        self.assertIn('band number', conversation.summary)
+
+
+@override_settings(CHATBOT_LLM_BACKEND='local', CHATBOT_LOCAL_LLM_LATENCY=0.2)
+class AsyncChatTests(TestCase):
+    url = '/api/v1/chatbot/async/chat/'
+
+    def setUp(self):
+        self.user = User.objects.create_user('listener', password='secret')
+        self.songs = create_songs(3, title='Async')
+        intent_cache.reset()
+        sampling.reset()
+
+    async def post(self, client, **data):
+        return await client.post(self.url, data=json.dumps(data), content_type='application/json')
+
+    async def test_recommendation(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        response = await self.post(client, message='recommend some songs')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['message'], 'Here is what I found for you.')
+        self.assertEqual(len(data['songs']), 3)
+        roles = [m.role async for m in Message.objects.filter(conversation_id=data['conversation_id']).order_by('timestamp')]
+        self.assertEqual(roles, ['user', 'assistant'])
+
+    async def test_requests_overlap_while_waiting_on_the_llm(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        started = time.monotonic()
+        responses = await asyncio.gather(*(self.post(client, message=f'hello {i}') for i in range(10)))
+        elapsed = time.monotonic() - started
+        self.assertTrue(all(r.status_code == 200 for r in responses))
+        # Ten sequential LLM round-trips would take at least 2s
+        self.assertLess(elapsed, 1.5)
+
+    async def test_requires_login(self):
+        response = await self.post(AsyncClient(), message='hello')
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(CHATBOT_LLM_BACKEND='local', CHATBOT_LOCAL_LLM_LATENCY=0, CHATBOT_LOCAL_LLM_TOKEN_LATENCY=0)
+class ChatStreamTests(TestCase):
+    url = '/api/v1/chatbot/async/chat/stream/'
+
+    def setUp(self):
+        self.user = User.objects.create_user('listener', password='secret')
+        self.songs = create_songs(3, title='Stream')
+        intent_cache.reset()
+        sampling.reset()
+
+    async def stream(self, message):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        response = await client.post(self.url, data=json.dumps({'message': message}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        events = []
+        for block in body.strip().split('\n\n'):
+            event, data = block.split('\n')
+            events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+        return events
+
+    async def test_songs_arrive_before_the_reply(self):
+        events = await self.stream('recommend some songs')
+        names = [name for name, _ in events]
+        self.assertEqual(names[:2], ['conversation', 'songs'])
+        self.assertEqual(names[-1], 'done')
+        self.assertTrue(all(name == 'token' for name in names[2:-1]))
+        self.assertEqual(len(events[1][1]), 3)
+
+        tokens = ''.join(data['text'] for name, data in events if name == 'token')
+        done = events[-1][1]
+        self.assertEqual(tokens, 'Here is what I found for you.')
+        self.assertEqual(done['message'], tokens)
+
+        message = await Message.objects.aget(id=done['message_id'])
+        self.assertEqual(message.role, 'assistant')
+        self.assertEqual(await message.recommended_songs.acount(), 3)
+
+    async def test_conversation_turn_streams_without_songs(self):
+        events = await self.stream('hello there')
+        names = [name for name, _ in events]
+        self.assertNotIn('songs', names)
+        roles = [m.role async for m in Message.objects.filter(conversation_id=events[0][1]['conversation_id']).order_by('timestamp')]
+        self.assertEqual(roles, ['user', 'assistant'])
+
+
+@override_settings(CHATBOT_LLM_BACKEND='local', CHATBOT_LOCAL_LLM_LATENCY=0, CHATBOT_LOCAL_LLM_TOKEN_LATENCY=0)
+class ProviderTests(TestCase):
+    def test_backend_selection(self):
+        self.assertIsInstance(get_llm(), LocalLLMProvider)
+        self.assertIsInstance(get_llm('chatbot.llm.LocalLLMProvider'), LocalLLMProvider)
+        with self.assertRaises(ImproperlyConfigured):
+            get_llm('chatbot.llm.missing')
+
+    def test_local_provider_is_deterministic(self):
+        llm = get_llm()
+        extraction = services.user_contents(services.extraction_prompt('play the song Blue Moon'))
+        self.assertEqual(json.loads(llm.generate(extraction))['title'], 'song blue moon')
+        keywords = services.user_contents(services.keyword_prompt('upbeat rock for running'))
+        self.assertEqual(llm.generate(keywords), 'upbeat, rock, running')
+        self.assertEqual(llm.generate(keywords), llm.generate(keywords))
+
+    def test_rules_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump([{'pattern': r'who sang (\w+)', 'response': r'\1 was sung by the local model.'}], f)
+        self.addCleanup(os.remove, f.name)
+        with override_settings(CHATBOT_LOCAL_LLM_RULES=f.name):
+            llm = get_llm()
+        contents = services.user_contents('Who sang Yesterday?')
+        self.assertEqual(llm.generate(contents), 'Yesterday was sung by the local model.')
+        self.assertEqual(''.join(llm.stream(contents)), 'Yesterday was sung by the local model.')
+
+    async def test_default_async_methods_use_generate(self):
+        class EchoProvider(LLMProvider):
+            def generate(self, contents):
+                return 'echo'
+
+        llm = EchoProvider()
+        self.assertEqual(await llm.agenerate('hi'), 'echo')
+        self.assertEqual([token async for token in llm.astream('hi')], ['echo'])
+
+
+class IntentCacheTests(TestCase):
+    def setUp(self):
+        intent_cache.reset()
+        sampling.reset()
+
+    def test_equivalent_requests_share_a_key(self):
+        cache = intent_cache.IntentCache(10, 60)
+        self.assertEqual(cache.key('params', 'play some jazz'), cache.key('params', 'Recommend jazz songs!'))
+        self.assertNotEqual(cache.key('params', 'play some jazz'), cache.key('params', 'play some blues'))
+        self.assertNotEqual(cache.key('params', 'play some jazz'), cache.key('keywords', 'play some jazz'))
+
+    def test_lru_eviction_and_ttl(self):
+        cache = intent_cache.IntentCache(2, 60)
+        cache.set('params', 'jazz', {'genre': 'jazz'})
+        cache.set('params', 'rock', {'genre': 'rock'})
+        cache.get('params', 'jazz')
+        cache.set('params', 'pop', {'genre': 'pop'})
+        self.assertIsNone(cache.get('params', 'rock'))
+        self.assertEqual(cache.get('params', 'jazz'), {'genre': 'jazz'})
+
+        with mock.patch('chatbot.intent_cache.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get('params', 'jazz'))
+        self.assertEqual(intent_cache.stats.snapshot()['evictions'], 1)
+
+    def test_persistent_store(self):
+        IntentCache = intent_cache.IntentCache
+        IntentCache(10, 60, alias='default').set('keywords', 'jazz', ['jazz', 'swing'])
+        # A fresh process-local LRU falls back to the shared store
+        self.assertEqual(IntentCache(10, 60, alias='default').get('keywords', 'jazz'), ['jazz', 'swing'])
+        self.assertEqual(intent_cache.stats.snapshot()['store_hits'], 1)
+
+
+@override_settings(CHATBOT_LLM_BACKEND='local', CHATBOT_LOCAL_LLM_LATENCY=0, CHATBOT_LOCAL_LLM_TOKEN_LATENCY=0)
+class IntentCacheChatTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('listener', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        create_songs(3, title='Jazz')
+        intent_cache.reset()
+        sampling.reset()
+
+    def test_repeated_requests_skip_the_extraction_call(self):
+        with mock.patch('chatbot.llm.LocalLLMProvider.reply', wraps=LocalLLMProvider().reply) as reply:
+            self.client.post('/api/v1/chatbot/chat/', {'message': 'play some jazz music'}, format='json')
+            first_calls = reply.call_count
+            response = self.client.post('/api/v1/chatbot/chat/', {'message': 'recommend jazz songs'}, format='json')
+        self.assertEqual(len(response.data['songs']), 3)
+        # Extraction, keywords and reply the first time; only the reply the second time
+        self.assertEqual(first_calls, 3)
+        self.assertEqual(reply.call_count - first_calls, 1)
+
+        snapshot = intent_cache.get_cache().snapshot()
+        self.assertEqual(snapshot['params_hits'], 1)
+        self.assertEqual(snapshot['params_misses'], 1)
+
+    async def test_async_chat_uses_the_cache(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        with mock.patch('chatbot.llm.LocalLLMProvider.reply', wraps=LocalLLMProvider().reply) as reply:
+            for message in ('play some jazz music', 'play jazz music please'):
+                await client.post('/api/v1/chatbot/async/chat/', data=json.dumps({'message': message}),
+                                  content_type='application/json')
+        self.assertEqual(reply.call_count, 4)
+
+    def test_stats_endpoint_requires_admin(self):
+        response = self.client.get('/api/v1/chatbot/intent-cache/')
+        self.assertEqual(response.status_code, 403)
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='secret'))
+        response = self.client.get('/api/v1/chatbot/intent-cache/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('hit_rate', response.data)
+
+
+@override_settings(
+    CHATBOT_LLM_BACKEND='local', CHATBOT_LOCAL_LLM_LATENCY=0.1, CHATBOT_LOCAL_LLM_TOKEN_LATENCY=0,
+    CHATBOT_LLM_MAX_CONCURRENCY=2, CHATBOT_LLM_RATE=0, CHATBOT_LLM_TIMEOUT=5, CHATBOT_LLM_COALESCE=True,
+)
+class GovernorTests(TestCase):
+    def setUp(self):
+        governor.reset()
+        intent_cache.reset()
+        sampling.reset()
+        self.user = User.objects.create_user('listener', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        create_songs(3, title='Jazz')
+
+    def in_threads(self, func, count):
+        barrier = threading.Barrier(count)
+
+        def call(i):
+            barrier.wait()
+            return func(i)
+
+        with ThreadPoolExecutor(count) as pool:
+            return list(pool.map(call, range(count)))
+
+    def test_concurrency_cap(self):
+        replies = self.in_threads(lambda i: get_llm().generate(services.user_contents(f'hello {i}')), 6)
+        self.assertEqual(replies, [LocalLLMProvider.DEFAULT_REPLY] * 6)
+        snapshot = governor.get_governor().snapshot()
+        self.assertEqual(snapshot['peak_active'], 2)
+        self.assertEqual(snapshot['calls'], 6)
+        self.assertGreaterEqual(snapshot['queued'], 4)
+        self.assertEqual(snapshot['active'], 0)
+
+    def test_identical_prompts_share_one_call(self):
+        contents = services.user_contents('hello there')
+        with mock.patch('chatbot.llm.LocalLLMProvider.reply', wraps=LocalLLMProvider().reply) as reply:
+            replies = self.in_threads(lambda i: get_llm().generate(contents), 4)
+        self.assertEqual(set(replies), {LocalLLMProvider.DEFAULT_REPLY})
+        self.assertEqual(reply.call_count, 1)
+        self.assertEqual(governor.get_governor().snapshot()['coalesced'], 3)
+
+    async def test_identical_async_prompts_share_one_call(self):
+        contents = services.user_contents('hello there')
+        with mock.patch('chatbot.llm.LocalLLMProvider.reply', wraps=LocalLLMProvider().reply) as reply:
+            replies = await asyncio.gather(*(get_llm().agenerate(contents) for _ in range(3)))
+            other = await get_llm().agenerate(services.user_contents('something else'))
+        self.assertEqual(replies, [LocalLLMProvider.DEFAULT_REPLY] * 3)
+        self.assertEqual(other, LocalLLMProvider.DEFAULT_REPLY)
+        self.assertEqual(reply.call_count, 2)
+
+    def test_token_bucket(self):
+        now = [0.0]
+        bucket = governor.TokenBucket(rate=10, burst=2, clock=lambda: now[0])
+        self.assertEqual([bucket.reserve(), bucket.reserve()], [0.0, 0.0])
+        self.assertIsNone(bucket.reserve(max_wait=0.05))
+        self.assertAlmostEqual(bucket.reserve(), 0.1)
+        now[0] = 1.0
+        self.assertEqual(bucket.reserve(), 0.0)
+
+    @override_settings(CHATBOT_LOCAL_LLM_LATENCY=0, CHATBOT_LLM_RATE=1, CHATBOT_LLM_BURST=1, CHATBOT_LLM_TIMEOUT=0.2)
+    def test_rate_limit_rejects_calls_that_cannot_start_in_time(self):
+        llm = get_llm()
+        llm.generate(services.user_contents('first'))
+        with self.assertRaises(governor.LLMOverloaded):
+            llm.generate(services.user_contents('second'))
+        self.assertEqual(governor.get_governor().snapshot()['rejected'], 1)
+
+    @override_settings(CHATBOT_LOCAL_LLM_LATENCY=0.5, CHATBOT_LLM_TIMEOUT=0.05)
+    def test_timeouts(self):
+        with self.assertRaises(governor.LLMTimeout):
+            get_llm().generate(services.user_contents('hello'))
+        with self.assertRaises(governor.LLMTimeout):
+            asyncio.run(get_llm().agenerate(services.user_contents('hello')))
+        with governor.deadline(0.01):
+            time.sleep(0.02)
+            with self.assertRaises(governor.LLMTimeout):
+                get_llm().generate(services.user_contents('too late'))
+        with self.assertRaises(governor.LLMTimeout):
+            list(get_llm().stream(services.user_contents('hello')))
+        self.assertEqual(governor.get_governor().snapshot()['timeouts'], 4)
+
+    @override_settings(CHATBOT_LOCAL_LLM_LATENCY=0.5, CHATBOT_LLM_TIMEOUT=0.05)
+    def test_chat_degrades_to_catalog_reply(self):
+        with self.assertLogs('chatbot', 'WARNING'):
+            response = self.client.post('/api/v1/chatbot/chat/', {'message': 'play some jazz music'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['songs']), 3)
+        self.assertTrue(response.data['message'].startswith(services.CATALOG_REPLY))
+        self.assertIn('Jazz Song 0 by', response.data['message'])
+
+        with self.assertLogs('chatbot', 'WARNING'):
+            response = self.client.post('/api/v1/chatbot/chat/', {'message': 'hello there'}, format='json')
+        self.assertEqual(response.data['message'], services.UNAVAILABLE_REPLY)
+
+    @override_settings(CHATBOT_LOCAL_LLM_LATENCY=0.5, CHATBOT_REPLY_DEADLINE=0.05)
+    async def test_stream_degrades_to_catalog_reply(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        with self.assertLogs('chatbot', 'WARNING'):
+            response = await client.post('/api/v1/chatbot/async/chat/stream/', content_type='application/json',
+                                         data=json.dumps({'message': 'play some jazz music'}))
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        events = [block.split('\n')[0][len('event: '):] for block in body.strip().split('\n\n')]
+        self.assertEqual(events, ['conversation', 'songs', 'token', 'done'])
+        self.assertIn(services.CATALOG_REPLY, body)
+
+    def test_stats_endpoint_requires_admin(self):
+        self.assertEqual(self.client.get('/api/v1/chatbot/llm-governor/').status_code, 403)
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='secret'))
+        response = self.client.get('/api/v1/chatbot/llm-governor/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['max_concurrency'], 2)
+
+
+class EntityExtractorTests(TestCase):
+    def setUp(self):
+        self.songs = create_songs(2, title='Midnight')
+        # What the background build does, in this thread so it sees the test's data
+        entities.refresh()
+
+    def test_phrase_matcher_finds_overlapping_phrases(self):
+        matcher = entities.PhraseMatcher()
+        matcher.add(['blue', 'moon'], 'title', 'Blue Moon')
+        matcher.add(['moon'], 'title', 'Moon')
+        matcher.add(['moon', 'river'], 'album_title', 'Moon River')
+        matcher.build()
+        found = sorted((start, end) for start, end, _ in matcher.find(['blue', 'moon', 'river']))
+        self.assertEqual(found, [(0, 2), (1, 2), (1, 3)])
+
+    def test_simple_requests_are_resolved_locally(self):
+        extract = entities.get_extractor().extract
+        self.assertEqual(extract('Play Midnight Song 0 by Midnight Artist!'), {
+            'title': 'Midnight Song 0', 'artist_name': 'Midnight Artist', 'album_title': None, 'genre': None,
+        })
+        self.assertEqual(extract('recommend some pop music')['genre'], 'Pop')
+        self.assertEqual(extract('play the album midnight album')['album_title'], 'Midnight Album')
+
+    def test_unexplained_words_fall_back_to_the_llm(self):
+        extract = entities.get_extractor().extract
+        self.assertIsNone(extract('find me songs like Midnight Song 0'))
+        self.assertIsNone(extract('play Midnight Song 0 by Midnight Artist and Midnight Song 1 by Someone'))
+
+    def test_cues_resolve_ambiguous_phrases(self):
+        Album.objects.create(title='Midnight Song 0', artist=Artist.objects.get(name='Midnight Artist'),
+                             release_date=date(2021, 1, 1))
+        entities.refresh()
+        extract = entities.get_extractor().extract
+        self.assertIsNone(extract('play midnight song 0'))
+        self.assertEqual(extract('play the album midnight song 0')['album_title'], 'Midnight Song 0')
+        self.assertEqual(extract('play the song called midnight song 0')['title'], 'Midnight Song 0')
+
+    @override_settings(CHATBOT_LLM_BACKEND='local', CHATBOT_LOCAL_LLM_LATENCY=0)
+    def test_chat_skips_the_extraction_call(self):
+        user = User.objects.create_user('listener', password='secret')
+        client = APIClient()
+        client.force_authenticate(user)
+        with mock.patch('chatbot.llm.LocalLLMProvider.reply', return_value='Enjoy!') as reply:
+            response = client.post('/api/v1/chatbot/chat/', {'message': 'play Midnight Song 1'}, format='json')
+        self.assertEqual([song['id'] for song in response.data['songs']], [self.songs[1].id])
+        self.assertEqual(reply.call_count, 1)
+
+    def test_requests_never_build(self):
+        extractor = entities.get_extractor()
+        Genre.objects.create(name='Midnight Blues')
+        with mock.patch.object(entities, 'warm') as warm, self.assertNumQueries(0):
+            self.assertIs(entities.get_extractor(), extractor)
+            self.assertIsNone(entities.extract('recommend some midnight blues music'))
+        warm.assert_called()
+
+    def test_asks_the_llm_before_the_first_build(self):
+        with mock.patch.object(entities, '_extractor', None), mock.patch.object(entities, 'warm') as warm:
+            self.assertIsNone(entities.extract('play Midnight Song 0'))
+        warm.assert_called_once()
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_intent_extraction', samples=50, stdout=out)
+        self.assertIn('LLM extraction calls avoided', out.getvalue())
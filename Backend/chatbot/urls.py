@@ -1,10 +1,15 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ChatbotViewSet
+from .views import ChatbotViewSet, IntentCacheStatsViewSet, LLMGovernorStatsViewSet
+from . import async_views
 
 router = DefaultRouter()
+router.register(r'chatbot/intent-cache', IntentCacheStatsViewSet, basename='intent-cache')
+router.register(r'chatbot/llm-governor', LLMGovernorStatsViewSet, basename='llm-governor')
 router.register(r'chatbot', ChatbotViewSet)
 
 urlpatterns = [
+    path('chatbot/async/chat/', async_views.chat, name='chatbot-async-chat'),
+    path('chatbot/async/chat/stream/', async_views.chat_stream, name='chatbot-chat-stream'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
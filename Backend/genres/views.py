@@ -2,7 +2,17 @@ from django.shortcuts import render
 from rest_framework import viewsets
 from .models import Genre
 from .serializers import GenreSerializer
+from caching.decorators import cached_response
+from caching.tags import genre_tags
  
 class GenreViewSet(viewsets.ModelViewSet):
     queryset = Genre.objects.all()
-    serializer_class = GenreSerializer
\ No newline at end of file
+    serializer_class = GenreSerializer
+
+    @cached_response('genres', data_tags=genre_tags)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response('genre:{pk}', data_tags=genre_tags)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
@@ -0,0 +1,27 @@
+from django.apps import AppConfig
+
+
+class InstrumentationConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'instrumentation'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from rest_framework.serializers import BaseSerializer
+
+        from . import recorder
+
+        def install_sql_wrapper(sender, connection, **kwargs):
+            if recorder.sql_wrapper not in connection.execute_wrappers:
+                connection.execute_wrappers.append(recorder.sql_wrapper)
+
+        connection_created.connect(install_sql_wrapper, weak=False)
+
+        # Serializer time is the rendering of .data, nested serializers counted once
+        data = BaseSerializer.data
+
+        def timed_data(serializer):
+            with recorder.timed('serialize', outermost_only=True):
+                return data.fget(serializer)
+
+        BaseSerializer.data = property(timed_data)
@@ -0,0 +1,138 @@
+import json
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse
+
+from . import recorder
+
+logger = logging.getLogger('instrumentation.requests')
+
+SERVER_TIMING_LABELS = {'db': 'queries', 'llm': 'calls'}
+
+
+def endpoint_name(request, view_func):
+    """'SongViewSet.similar' for DRF views, the URL name (or function name) otherwise"""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is not None:
+        actions = getattr(view_func, 'actions', None) or {}
+        return f'{view_class.__name__}.{actions.get(request.method.lower(), request.method.lower())}'
+    match = request.resolver_match
+    return (match.view_name if match else None) or getattr(view_func, '__name__', 'unknown')
+
+
+class InstrumentationMiddleware:
+    """
+    Times each request and reports it in a Server-Timing header, the
+    per-endpoint histograms and one JSON log line. The Server-Timing header
+    of a streamed response covers the time up to its headers. The histograms
+    and log line wait until the body is finished, so they include the work
+    done while streaming (the LLM reply of the chat stream). File downloads
+    are not wrapped, which keeps the server's sendfile path, and are measured
+    up to their headers.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics, token = recorder.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            recorder.finish(token)
+        return self.respond(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics, token = recorder.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            recorder.finish(token)
+        return self.respond(request, response, metrics)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = recorder.current()
+        if metrics is not None:
+            metrics.endpoint = endpoint_name(request, view_func)
+
+    def respond(self, request, response, metrics):
+        if settings.INSTRUMENTATION_SERVER_TIMING:
+            response['Server-Timing'] = self.server_timing(metrics)
+        if response.streaming and not isinstance(response, FileResponse):
+            if response.is_async:
+                response.streaming_content = self.ameasure(request, response, metrics, response.streaming_content)
+            else:
+                response.streaming_content = self.measure(request, response, metrics, response.streaming_content)
+        else:
+            self.report(request, response, metrics)
+        return response
+
+    def measure(self, request, response, metrics, chunks):
+        """The body, produced with the request's metrics current; reported once it ends"""
+        try:
+            while True:
+                token = recorder.activate(metrics)
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    return
+                finally:
+                    recorder.finish(token)
+                yield chunk
+        finally:
+            self.report(request, response, metrics)
+
+    async def ameasure(self, request, response, metrics, chunks):
+        try:
+            while True:
+                token = recorder.activate(metrics)
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    recorder.finish(token)
+                yield chunk
+        finally:
+            self.report(request, response, metrics)
+
+    def server_timing(self, metrics):
+        timings = []
+        for kind in recorder.KINDS:
+            timing = f'{kind};dur={metrics.durations[kind] * 1000:.1f}'
+            if kind in SERVER_TIMING_LABELS:
+                timing += f';desc="{metrics.counts[kind]} {SERVER_TIMING_LABELS[kind]}"'
+            timings.append(timing)
+        timings.append(f'total;dur={metrics.elapsed() * 1000:.1f}')
+        return ', '.join(timings)
+
+    def report(self, request, response, metrics):
+        total = metrics.elapsed()
+        endpoint = metrics.endpoint or 'unresolved'
+        recorder.endpoints.record(endpoint, metrics, total, response.status_code)
+
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'endpoint': endpoint,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'total_ms': round(total * 1000, 1),
+                'sql_queries': metrics.counts['db'],
+                'sql_ms': round(metrics.durations['db'] * 1000, 1),
+                'serialize_ms': round(metrics.durations['serialize'] * 1000, 1),
+                'llm_calls': metrics.counts['llm'],
+                'llm_ms': round(metrics.durations['llm'] * 1000, 1),
+            }))
@@ -0,0 +1,166 @@
+"""
+Per-request metrics and rolling per-endpoint histograms.
+
+The middleware starts a RequestMetrics for each request and stores it in a
+context variable, so it follows the request into sync_to_async threads and
+async views. Hooks anywhere in the stack add to it with ``timed(kind)``:
+``db`` (every SQL statement, from a connection execute wrapper),
+``serialize`` (DRF serializer ``.data``, including any queries it triggers)
+and ``llm`` (chatbot provider calls). Outside a request ``timed`` does nothing.
+
+Finished requests are kept per endpoint in a ring of the last
+INSTRUMENTATION_SAMPLES requests, summarized on demand.
+"""
+import contextvars
+import math
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from django.conf import settings
+
+KINDS = ('db', 'serialize', 'llm')
+# Upper bounds (ms) of the latency histogram buckets; the last one is open
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.endpoint = None
+        self.durations = Counter()
+        self.counts = Counter()
+        self._active = Counter()
+        self._lock = threading.Lock()
+
+    def enter(self, kind):
+        """True unless a block of this kind is already running"""
+        with self._lock:
+            self._active[kind] += 1
+            return self._active[kind] == 1
+
+    def exit(self, kind, duration=None, count=True):
+        with self._lock:
+            self._active[kind] -= 1
+            if duration is not None:
+                self.durations[kind] += duration
+                if count:
+                    self.counts[kind] += 1
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def start():
+    metrics = RequestMetrics()
+    return metrics, activate(metrics)
+
+
+def activate(metrics):
+    """Make ``metrics`` current again (while a streamed body is produced); returns the token for finish()"""
+    return _current.set(metrics)
+
+
+def finish(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def timed(kind, outermost_only=False, count=True):
+    """
+    Add the duration of the block to the current request. With
+    ``outermost_only``, blocks nested in another of the same kind are not
+    counted again (serializers rendering nested serializers). With
+    ``count=False`` the duration is added to the previous block's call
+    (the later chunks of a stream).
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    counted = metrics.enter(kind) or not outermost_only
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.exit(kind, time.perf_counter() - started if counted else None, count)
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    """Connection execute wrapper (installed on every connection by the app config)"""
+    with timed('db'):
+        return execute(sql, params, many, context)
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, math.ceil(fraction * len(values)) - 1)] if values else 0.0
+
+
+class EndpointStats:
+    """Rolling samples per endpoint; each worker reports its own"""
+
+    def __init__(self, samples=None):
+        self.samples = samples
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, metrics, total, status):
+        sample = (
+            total, status,
+            metrics.durations['db'], metrics.counts['db'],
+            metrics.durations['serialize'],
+            metrics.durations['llm'], metrics.counts['llm'],
+        )
+        with self._lock:
+            ring = self._endpoints.get(endpoint)
+            if ring is None:
+                ring = self._endpoints[endpoint] = deque(maxlen=self.samples or settings.INSTRUMENTATION_SAMPLES)
+            ring.append(sample)
+
+    def snapshot(self):
+        with self._lock:
+            endpoints = {endpoint: list(ring) for endpoint, ring in self._endpoints.items()}
+        return {endpoint: self._summarize(samples) for endpoint, samples in sorted(endpoints.items())}
+
+    @staticmethod
+    def _summarize(samples):
+        count = len(samples)
+        totals = sorted(sample[0] * 1000 for sample in samples)
+        histogram = Counter()
+        for total in totals:
+            bucket = next((f'le_{bound}' for bound in BUCKETS_MS if total <= bound), f'gt_{BUCKETS_MS[-1]}')
+            histogram[bucket] += 1
+        return {
+            'requests': count,
+            'errors': sum(1 for sample in samples if sample[1] >= 500),
+            'total_ms': {
+                'mean': sum(totals) / count,
+                'p50': _percentile(totals, 0.5),
+                'p95': _percentile(totals, 0.95),
+                'p99': _percentile(totals, 0.99),
+                'max': totals[-1],
+            },
+            'histogram_ms': dict(histogram),
+            'sql_queries': {
+                'mean': sum(sample[3] for sample in samples) / count,
+                'max': max(sample[3] for sample in samples),
+            },
+            'sql_ms_mean': sum(sample[2] for sample in samples) * 1000 / count,
+            'serialize_ms_mean': sum(sample[4] for sample in samples) * 1000 / count,
+            'llm_calls_mean': sum(sample[6] for sample in samples) / count,
+            'llm_ms_mean': sum(sample[5] for sample in samples) * 1000 / count,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+endpoints = EndpointStats()
@@ -0,0 +1,131 @@
+import asyncio
+import json
+
+from django.contrib.auth.models import User
+from django.test import AsyncClient, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from chatbot import intent_cache
+from chatbot.llm import LocalLLMProvider
+from recommendations import sampling
+from songs.models import Song
+from songs.serializers import SongSerializer
+from songs.tests import create_songs
+from . import recorder
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        recorder.endpoints.reset()
+        self.client = APIClient()
+        self.songs = create_songs(3, title='Timed')
+
+    def server_timing(self, response):
+        return dict(
+            (parts[0], dict(part.split('=', 1) for part in parts[1:]))
+            for parts in (timing.split(';') for timing in response['Server-Timing'].split(', '))
+        )
+
+    def test_server_timing_counts_queries(self):
+        with self.assertNumQueries(3) as context:
+            response = self.client.get(f'/api/v1/songs/{self.songs[0].id}/')
+        timing = self.server_timing(response)
+        self.assertEqual(timing['db']['desc'], f'"{len(context.captured_queries)} queries"')
+        self.assertEqual(set(timing), {'db', 'serialize', 'llm', 'total'})
+        self.assertGreater(float(timing['serialize']['dur']), 0)
+        self.assertEqual(timing['llm']['desc'], '"0 calls"')
+
+    def test_nested_serializers_are_counted_once(self):
+        songs = Song.objects.prefetch_related('artists', 'genres')
+        metrics, token = recorder.start()
+        try:
+            SongSerializer(songs, many=True).data
+        finally:
+            recorder.finish(token)
+        # The list serializer renders a song serializer per song, each with nested relations
+        self.assertEqual(metrics.counts['serialize'], 1)
+        self.assertEqual(metrics.counts['db'], 3)
+
+    def test_per_endpoint_report(self):
+        for _ in range(3):
+            self.client.get('/api/v1/songs/')
+        self.client.get(f'/api/v1/songs/{self.songs[0].id}/similar/')
+        self.assertEqual(self.client.get('/api/v1/instrumentation/').status_code, 403)
+
+        admin = User.objects.create_superuser('admin', password='secret')
+        self.client.force_authenticate(admin)
+        report = self.client.get('/api/v1/instrumentation/').data
+        self.assertEqual(report['SongViewSet.list']['requests'], 3)
+        self.assertEqual(sum(report['SongViewSet.list']['histogram_ms'].values()), 3)
+        self.assertGreater(report['SongViewSet.list']['sql_queries']['mean'], 0)
+        self.assertIn('SongViewSet.similar', report)
+
+    def test_request_log_line(self):
+        with self.assertLogs('instrumentation.requests', 'INFO') as logs:
+            self.client.get('/api/v1/songs/')
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['endpoint'], 'SongViewSet.list')
+        self.assertEqual(line['status'], 200)
+        self.assertGreater(line['sql_queries'], 0)
+
+    @override_settings(INSTRUMENTATION_SERVER_TIMING=False)
+    def test_server_timing_can_be_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/v1/songs/'))
+
+
+@override_settings(CHATBOT_LLM_BACKEND='local', CHATBOT_LOCAL_LLM_LATENCY=0, CHATBOT_LOCAL_LLM_TOKEN_LATENCY=0)
+class LLMInstrumentationTests(TestCase):
+    def setUp(self):
+        recorder.endpoints.reset()
+        intent_cache.reset()
+        sampling.reset()
+        self.client = APIClient()
+        self.user = User.objects.create_user('listener')
+        self.client.force_authenticate(self.user)
+        create_songs(3, title='Jazz')
+
+    def test_llm_calls_are_counted(self):
+        with self.assertLogs('instrumentation.requests', 'INFO') as logs:
+            response = self.client.post('/api/v1/chatbot/chat/', {'message': 'play some jazz music'}, format='json')
+        self.assertEqual(len(response.data['songs']), 3)
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['endpoint'], 'ChatbotViewSet.chat')
+        # Extraction, keywords and the reply
+        self.assertEqual(line['llm_calls'], 3)
+
+    async def test_async_views_are_measured(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        with self.assertLogs('instrumentation.requests', 'INFO') as logs:
+            await client.post('/api/v1/chatbot/async/chat/', data=json.dumps({'message': 'play some jazz music'}),
+                              content_type='application/json')
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['llm_calls'], 3)
+        self.assertGreater(line['sql_queries'], 0)
+
+    async def test_streamed_replies_are_measured(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        with self.assertLogs('instrumentation.requests', 'INFO') as logs:
+            response = await client.post('/api/v1/chatbot/async/chat/stream/',
+                                         data=json.dumps({'message': 'play some jazz music'}),
+                                         content_type='application/json')
+            # Reported once the stream ends, not when the headers go out
+            self.assertEqual(logs.records, [])
+            async for _ in response.streaming_content:
+                pass
+        line = json.loads(logs.records[0].getMessage())
+        # Extraction, keywords and the streamed reply
+        self.assertEqual(line['llm_calls'], 3)
+        self.assertIn('llm;', response['Server-Timing'])
+
+    async def test_streams_are_timed_while_waiting_for_chunks(self):
+        metrics, token = recorder.start()
+        try:
+            async for _ in LocalLLMProvider().astream([{'role': 'user', 'parts': ['hello there, how are you?']}]):
+                await asyncio.sleep(0.02)
+        finally:
+            recorder.finish(token)
+        self.assertEqual(metrics.counts['llm'], 1)
+        # The consumer's sleeps between chunks are not LLM time
+        self.assertLess(metrics.durations['llm'], 0.02)
@@ -0,0 +1,10 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from .views import InstrumentationViewSet
+
+router = DefaultRouter()
+router.register(r'instrumentation', InstrumentationViewSet, basename='instrumentation')
+
+urlpatterns = [
+    path('', include(router.urls)),
+]
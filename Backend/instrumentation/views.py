@@ -0,0 +1,12 @@
+from rest_framework import viewsets, permissions, status
+from rest_framework.response import Response
+
+from .recorder import endpoints
+
+
+class InstrumentationViewSet(viewsets.ViewSet):
+    permission_classes = [permissions.IsAdminUser]
+
+    def list(self, request):
+        """Latency, SQL, serializer and LLM figures per endpoint for the worker serving this request"""
+        return Response(endpoints.snapshot(), status=status.HTTP_200_OK)
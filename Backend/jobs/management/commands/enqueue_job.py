@@ -0,0 +1,33 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from jobs import queue
+
+
+class Command(BaseCommand):
+    help = 'Queue a background job, e.g. enqueue_job recommendations.build_song_embeddings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('task', nargs='?', help='Task name; omit with --list')
+        parser.add_argument('--payload', default='{}', help='Task arguments as a JSON object')
+        parser.add_argument('--priority', type=int, default=0, help='Higher runs first')
+        parser.add_argument('--delay', type=float, default=0, help='Seconds to wait before running')
+        parser.add_argument('--list', action='store_true', help='List the registered tasks')
+
+    def handle(self, *args, **options):
+        if options['list'] or not options['task']:
+            for name, registered in sorted(queue.registry.items()):
+                self.stdout.write(f'{name} (queue {registered.queue})')
+            return
+        try:
+            payload = json.loads(options['payload'])
+        except ValueError as e:
+            raise CommandError(f'Invalid --payload: {e}')
+        if not isinstance(payload, dict):
+            raise CommandError('--payload must be a JSON object')
+        try:
+            job = queue.enqueue(options['task'], payload, priority=options['priority'], delay=options['delay'])
+        except queue.UnknownTask as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f'Queued {job}'))
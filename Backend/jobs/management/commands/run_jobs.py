@@ -0,0 +1,24 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from jobs.queue import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs until stopped (SIGINT/SIGTERM finish the running jobs first)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queues', help='Comma-separated queues to take jobs from (default: all)')
+        parser.add_argument('--concurrency', type=int, default=1, help='Jobs run at once by this worker')
+        parser.add_argument('--poll-interval', type=float, help='Seconds between polls when idle (default: JOBS_POLL_INTERVAL)')
+        parser.add_argument('--once', action='store_true', help='Exit when no job is due instead of waiting')
+
+    def handle(self, *args, **options):
+        if options['verbosity'] > 1:
+            logging.getLogger('jobs').setLevel(logging.DEBUG)
+        queues = [name.strip() for name in options['queues'].split(',')] if options['queues'] else None
+        worker = Worker(queues, options['concurrency'], options['poll_interval'])
+        self.stdout.write(f"Worker {worker.name} taking jobs from {', '.join(queues) if queues else 'all queues'}")
+        processed = worker.run(once=options['once'], handle_signals=True)
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} jobs'))
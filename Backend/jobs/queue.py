@@ -0,0 +1,399 @@
+"""
+Database-backed job queue.
+
+Tasks are functions registered with @task, called with the JSON payload
+given to enqueue(). Each job is a jobs.Job row. A worker claims a due job by
+switching it from queued to running with a conditional UPDATE, so any number
+of worker threads and processes can share the table without a broker. Failed
+jobs are retried with exponential backoff up to their max_attempts. While a
+job runs, its process refreshes the job's heartbeat every
+JOBS_LOCK_TIMEOUT / 4 seconds; jobs whose heartbeat is older than
+JOBS_LOCK_TIMEOUT were left by a worker that died and are requeued. A
+task's ``concurrency`` caps how many of its jobs run at once across all
+workers (best effort: two workers claiming at the same instant can exceed
+it by one).
+
+JOBS_MODE picks where jobs run:
+
+- ``thread``: in a Worker running in each web process (JOBS_THREADS jobs at
+  a time), woken as soon as an enqueuing transaction commits; no run_jobs
+  process needed. It also runs delayed and retried jobs when due, jobs
+  queued before a restart, and requeues stale jobs
+- ``worker``: only in ``manage.py run_jobs`` processes
+- ``sync``: inside enqueue(), before it returns (tests and scripts)
+"""
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+WORKER_NAME = f'{socket.gethostname()}:{os.getpid()}'
+# Longest stored error message
+MAX_ERROR_LENGTH = 2000
+
+registry = {}
+
+
+class UnknownTask(Exception):
+    pass
+
+
+class Task:
+    def __init__(self, func, name, queue, max_attempts, retry_delay, concurrency):
+        self.func = func
+        self.name = name
+        self.queue = queue
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.concurrency = concurrency
+
+    def __call__(self, **payload):
+        return self.func(**payload)
+
+    def enqueue(self, user=None, priority=0, delay=0, **payload):
+        return enqueue(self.name, payload, user=user, priority=priority, delay=delay)
+
+
+def task(name=None, queue='default', max_attempts=None, retry_delay=None, concurrency=None):
+    """
+    Register a function as a task, named '<app>.<function>' unless ``name``
+    is given. It is called with keyword arguments from the job payload and
+    its return value (JSON-serializable) is stored as the job result.
+    """
+    def register(func):
+        app = func.__module__.rsplit('.', 1)[0]
+        registered = Task(
+            func, name or f'{app}.{func.__name__}', queue,
+            max_attempts or settings.JOBS_MAX_ATTEMPTS,
+            settings.JOBS_RETRY_DELAY if retry_delay is None else retry_delay,
+            concurrency,
+        )
+        registry[registered.name] = registered
+        return registered
+    return register
+
+
+def get_task(name):
+    try:
+        return registry[name]
+    except KeyError:
+        raise UnknownTask(f'No task named {name!r}')
+
+
+def enqueue(name, payload=None, user=None, priority=0, delay=0):
+    """Queue a job for the task ``name``; returns the Job (already finished in sync mode)"""
+    registered = get_task(name)
+    job = Job.objects.create(
+        task=name, payload=payload or {}, queue=registered.queue, priority=priority,
+        user=user, max_attempts=registered.max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+    mode = settings.JOBS_MODE
+    if mode == 'sync':
+        if _claim(job.id, WORKER_NAME, timezone.now()):
+            execute(job.id)
+        job.refresh_from_db()
+    elif mode == 'thread':
+        transaction.on_commit(wake)
+    return job
+
+
+def cancel(job):
+    """Cancel a job that has not started; returns whether it was cancelled"""
+    cancelled = Job.objects.filter(id=job.id, status=Job.QUEUED).update(
+        status=Job.CANCELLED, finished_at=timezone.now(),
+    )
+    job.refresh_from_db()
+    return bool(cancelled)
+
+
+def _claim(job_id, worker, now):
+    return Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+        status=Job.RUNNING, locked_by=worker, started_at=now, heartbeat_at=now, attempts=F('attempts') + 1,
+    ) == 1
+
+
+def _free_slots():
+    """How many more jobs each concurrency-limited task may start"""
+    limits = {name: registered.concurrency for name, registered in registry.items() if registered.concurrency}
+    if not limits:
+        return {}
+    running = dict(
+        Job.objects.filter(status=Job.RUNNING, task__in=limits)
+        .values('task').annotate(count=Count('id')).values_list('task', 'count')
+    )
+    return {name: limit - running.get(name, 0) for name, limit in limits.items()}
+
+
+def claim(worker=WORKER_NAME, queues=None, limit=1):
+    """Claim up to ``limit`` due jobs, most urgent first; returns their ids"""
+    now = timezone.now()
+    free = _free_slots()
+    due = Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+    if queues:
+        due = due.filter(queue__in=queues)
+    full = [name for name, slots in free.items() if slots <= 0]
+    if full:
+        due = due.exclude(task__in=full)
+    # A few spare candidates in case other workers take some first
+    candidates = due.order_by('-priority', 'run_at', 'id').values_list('id', 'task')[:limit * 4]
+    claimed = []
+    for job_id, name in candidates:
+        if len(claimed) >= limit:
+            break
+        if name in free and free[name] <= 0:
+            continue
+        if _claim(job_id, worker, now):
+            claimed.append(job_id)
+            if name in free:
+                free[name] -= 1
+    return claimed
+
+
+def execute(job_id):
+    """
+    Run a claimed job and record the outcome. Returns the seconds until the
+    retry when the job failed and was requeued, None otherwise.
+    """
+    job = Job.objects.get(id=job_id)
+    _start_beating(job.id)
+    try:
+        registered = get_task(job.task)
+        result = registered(**job.payload)
+        finished = Job.objects.filter(id=job.id, status=Job.RUNNING)
+        finished.update(status=Job.SUCCEEDED, result=result, error='', finished_at=timezone.now())
+    except Exception as e:
+        return _failed(job, e)
+    finally:
+        _stop_beating(job.id)
+    return None
+
+
+def _failed(job, error):
+    message = f'{type(error).__name__}: {error}'[:MAX_ERROR_LENGTH]
+    registered = registry.get(job.task)
+    running = Job.objects.filter(id=job.id, status=Job.RUNNING)
+    if registered is not None and job.attempts < job.max_attempts:
+        delay = registered.retry_delay * 2 ** (job.attempts - 1)
+        logger.warning(f"Job {job} failed, retrying in {delay}s: {message}")
+        running.update(
+            status=Job.QUEUED, error=message, locked_by='',
+            run_at=timezone.now() + timedelta(seconds=delay),
+        )
+        return delay
+    logger.warning(f"Job {job} failed: {message}")
+    running.update(status=Job.FAILED, error=message, finished_at=timezone.now())
+    return None
+
+
+# Heartbeats of the jobs running in this process
+
+_beating = set()
+_beating_lock = threading.Lock()
+_heart = None
+
+
+def _start_beating(job_id):
+    global _heart
+    with _beating_lock:
+        _beating.add(job_id)
+        if _heart is None:
+            _heart = threading.Thread(target=_beat_forever, name='jobs-heartbeat', daemon=True)
+            _heart.start()
+
+
+def _stop_beating(job_id):
+    with _beating_lock:
+        _beating.discard(job_id)
+
+
+def heartbeat():
+    """Mark the jobs running in this process as alive; returns how many were"""
+    with _beating_lock:
+        job_ids = list(_beating)
+    if not job_ids:
+        return 0
+    return Job.objects.filter(id__in=job_ids, status=Job.RUNNING).update(heartbeat_at=timezone.now())
+
+
+def _beat_forever():
+    while True:
+        time.sleep(settings.JOBS_LOCK_TIMEOUT / 4)
+        try:
+            heartbeat()
+        except Exception as e:
+            logger.warning(f"Error sending job heartbeats: {str(e)}")
+        finally:
+            connection.close()
+
+
+def requeue_stale():
+    """Requeue (or fail, when out of attempts) running jobs whose worker stopped sending heartbeats"""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+    stale = Job.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+        status=Job.RUNNING,
+    )
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, error='The worker running this job stopped', finished_at=timezone.now(),
+    )
+    requeued = stale.update(status=Job.QUEUED, locked_by='', run_at=timezone.now())
+    return requeued + failed
+
+
+class Worker:
+    """
+    Runs jobs from the queue, ``concurrency`` at a time, until stopped
+    (SIGINT/SIGTERM), or with ``once`` until no job is due.
+    """
+
+    def __init__(self, queues=None, concurrency=1, poll_interval=None, name=None):
+        self.queues = queues
+        self.concurrency = concurrency
+        self.poll_interval = settings.JOBS_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.name = name or WORKER_NAME
+        self.processed = 0
+        self.stopping = False
+        self.draining = False
+        self.last_requeue = 0
+        self.wakeup = threading.Event()
+
+    def stop(self, *args):
+        self.stopping = True
+        self.wakeup.set()
+
+    def drain(self):
+        """Stop once no job is due and the running ones have finished"""
+        self.draining = True
+        self.wakeup.set()
+
+    def wake(self, *args):
+        """Look for due jobs now instead of after the poll interval"""
+        self.wakeup.set()
+
+    def _requeue_stale(self):
+        if time.monotonic() - self.last_requeue > settings.JOBS_LOCK_TIMEOUT / 2:
+            requeue_stale()
+            self.last_requeue = time.monotonic()
+
+    def _execute(self, job_id):
+        try:
+            execute(job_id)
+        except Exception:
+            logger.exception(f"Job {job_id} could not be run")
+
+    def _execute_in_thread(self, job_id):
+        try:
+            self._execute(job_id)
+        finally:
+            connection.close()
+
+    def run(self, once=False, handle_signals=False):
+        """Process jobs; returns how many were run"""
+        if handle_signals:
+            signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGTERM, self.stop)
+        self.last_requeue = 0
+        if self.concurrency == 1:
+            self._run_serially(once)
+        else:
+            self._run_in_pool(once)
+        return self.processed
+
+    def _run_serially(self, once):
+        while not self.stopping:
+            self.wakeup.clear()
+            self._requeue_stale()
+            claimed = claim(self.name, self.queues)
+            if claimed:
+                self._execute(claimed[0])
+                self.processed += 1
+            elif once or self.draining:
+                break
+            else:
+                self.wakeup.wait(self.poll_interval)
+
+    def _run_in_pool(self, once):
+        running = set()
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix='jobs') as pool:
+            while not self.stopping:
+                # Cleared before claiming, so a wake-up that arrives meanwhile is not lost
+                self.wakeup.clear()
+                done = {future for future in running if future.done()}
+                running -= done
+                self.processed += len(done)
+                self._requeue_stale()
+                free = self.concurrency - len(running)
+                claimed = claim(self.name, self.queues, free) if free > 0 else []
+                for job_id in claimed:
+                    future = pool.submit(self._execute_in_thread, job_id)
+                    # A finished job frees a slot: look for the next one straight away
+                    future.add_done_callback(self.wake)
+                    running.add(future)
+                if (once or self.draining) and not claimed and not running:
+                    break
+                if not claimed or len(running) >= self.concurrency:
+                    self.wakeup.wait(self.poll_interval)
+            # Jobs already started are finished before exiting
+            done, _ = wait(running)
+            self.processed += len(done)
+
+
+# In-process execution (JOBS_MODE=thread)
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start():
+    """Start this process's in-process worker (thread mode) if it is not running; returns it"""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = Worker(concurrency=settings.JOBS_THREADS)
+            _worker.thread = threading.Thread(target=_run_in_process, args=(_worker,), name='jobs', daemon=True)
+            _worker.thread.start()
+        return _worker
+
+
+def wake():
+    """Have the in-process worker claim due jobs now (starting it if needed)"""
+    start().wake()
+
+
+def _run_in_process(worker):
+    try:
+        while True:
+            try:
+                worker.run()
+                return
+            except Exception:
+                # Database errors would otherwise stop thread mode until a restart
+                logger.exception("In-process job worker failed, restarting")
+                connection.close()
+                time.sleep(worker.poll_interval)
+    finally:
+        connection.close()
+
+
+def reset():
+    """Run the due jobs, then stop and drop the in-process worker (tests)"""
+    global _worker
+    with _worker_lock:
+        worker, _worker = _worker, None
+    if worker is not None:
+        worker.drain()
+        worker.thread.join()
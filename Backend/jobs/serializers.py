@@ -0,0 +1,10 @@
+from rest_framework import serializers
+from .models import Job
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'task', 'queue', 'status', 'attempts', 'max_attempts', 'result', 'error',
+            'created_at', 'started_at', 'finished_at',
+        ]
@@ -0,0 +1,267 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from chatbot import intent_cache
+from chatbot.models import Message
+from recommendations import sampling
+from songs.tests import create_songs
+from .models import Job
+from . import queue
+
+calls = []
+
+
+@queue.task(name='tests.echo')
+def echo(value=None):
+    calls.append(value)
+    return {'value': value}
+
+
+@queue.task(name='tests.flaky', max_attempts=3, retry_delay=5)
+def flaky(failures):
+    calls.append(failures)
+    if len(calls) <= failures:
+        raise RuntimeError(f'attempt {len(calls)} failed')
+    return len(calls)
+
+
+@queue.task(name='tests.exclusive', queue='heavy', concurrency=1)
+def exclusive():
+    return None
+
+
+@queue.task(name='tests.beating')
+def beating():
+    return queue.heartbeat()
+
+
+@override_settings(JOBS_MODE='worker')
+class QueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_worker_runs_queued_jobs(self):
+        job = echo.enqueue(value=7)
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(queue.Worker().run(once=True), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result, {'value': 7})
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_claims_most_urgent_due_job_first(self):
+        low = echo.enqueue(value='low')
+        high = echo.enqueue(priority=5, value='high')
+        echo.enqueue(priority=9, delay=60, value='later')
+        self.assertEqual(queue.claim(limit=3), [high.id, low.id])
+        # Claimed jobs are not claimed again
+        self.assertEqual(queue.claim(limit=3), [])
+
+    def test_queues_filter_claims(self):
+        echo.enqueue(value=1)
+        heavy = exclusive.enqueue()
+        self.assertEqual(queue.claim(queues=['heavy'], limit=5), [heavy.id])
+
+    def test_failed_job_is_retried_with_backoff(self):
+        job = flaky.enqueue(failures=2)
+        self.assertEqual(queue.claim(), [job.id])
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            self.assertEqual(queue.execute(job.id), 5)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn('attempt 1 failed', job.error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=4))
+        # Not due until the backoff has passed
+        self.assertEqual(queue.claim(), [])
+
+        Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        queue.claim()
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            self.assertEqual(queue.execute(job.id), 10)
+
+        Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        queue.claim()
+        self.assertIsNone(queue.execute(job.id))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.result), (Job.SUCCEEDED, 3, 3))
+
+    def test_job_fails_after_max_attempts(self):
+        job = flaky.enqueue(failures=5)
+        for _ in range(3):
+            Job.objects.filter(id=job.id).update(run_at=timezone.now())
+            self.assertEqual(queue.claim(), [job.id])
+            with self.assertLogs('jobs.queue', 'WARNING'):
+                queue.execute(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 3)
+        self.assertIn('attempt 3 failed', job.error)
+
+    def test_concurrency_limit(self):
+        first, second = exclusive.enqueue(), exclusive.enqueue()
+        echo_job = echo.enqueue()
+        self.assertEqual(queue.claim(limit=3), [first.id, echo_job.id])
+        self.assertEqual(queue.claim(limit=3), [])
+        queue.execute(first.id)
+        self.assertEqual(queue.claim(limit=3), [second.id])
+
+    def test_stale_jobs_are_requeued(self):
+        job = echo.enqueue()
+        queue.claim()
+        self.assertEqual(queue.requeue_stale(), 0)
+        Job.objects.filter(id=job.id).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(queue.requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (Job.QUEUED, ''))
+        self.assertEqual(queue.claim(), [job.id])
+
+    def test_long_running_jobs_with_heartbeats_are_not_requeued(self):
+        job = echo.enqueue()
+        queue.claim()
+        Job.objects.filter(id=job.id).update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(queue.requeue_stale(), 0)
+
+    def test_running_jobs_send_heartbeats(self):
+        job = beating.enqueue()
+        queue.Worker().run(once=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), (Job.SUCCEEDED, 1))
+        self.assertEqual(queue.heartbeat(), 0)
+
+    def test_unknown_task(self):
+        with self.assertRaises(queue.UnknownTask):
+            queue.enqueue('tests.missing')
+
+    @override_settings(JOBS_MODE='sync')
+    def test_sync_mode_runs_inline(self):
+        job = echo.enqueue(value='now')
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(calls, ['now'])
+
+
+@override_settings(JOBS_MODE='thread')
+class ThreadModeTests(TransactionTestCase):
+    def tearDown(self):
+        queue.reset()
+
+    def test_runs_after_commit(self):
+        calls.clear()
+        job = echo.enqueue(value='threaded')
+        queue.reset()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(calls, ['threaded'])
+
+    def test_concurrency_limit(self):
+        running = Job.objects.create(
+            task='tests.exclusive', queue='heavy', status=Job.RUNNING,
+            started_at=timezone.now(), heartbeat_at=timezone.now(),
+        )
+        job = exclusive.enqueue()
+        queue.reset()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        Job.objects.filter(id=running.id).update(status=Job.SUCCEEDED)
+        queue.start()
+        queue.reset()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+
+    def test_runs_jobs_queued_before_it_started(self):
+        calls.clear()
+        # Left by an earlier process: a job due now, and a stale one
+        job = Job.objects.create(task='tests.echo', payload={'value': 'left'})
+        stale = Job.objects.create(
+            task='tests.echo', payload={'value': 'stale'}, status=Job.RUNNING, attempts=1,
+            started_at=timezone.now() - timedelta(hours=1), heartbeat_at=timezone.now() - timedelta(hours=1),
+        )
+        queue.start()
+        queue.reset()
+        self.assertEqual(
+            set(Job.objects.filter(id__in=[job.id, stale.id]).values_list('status', flat=True)), {Job.SUCCEEDED},
+        )
+        self.assertEqual(sorted(calls), ['left', 'stale'])
+
+
+@override_settings(JOBS_MODE='worker')
+class JobEndpointTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_users_see_their_own_jobs(self):
+        mine = echo.enqueue(user=self.user)
+        other = echo.enqueue(user=User.objects.create_user('other'))
+        response = self.client.get('/api/v1/jobs/')
+        self.assertEqual([job['id'] for job in response.json()['results']], [mine.id])
+        self.assertEqual(self.client.get(f'/api/v1/jobs/{mine.id}/').json()['status'], Job.QUEUED)
+        self.assertEqual(self.client.get(f'/api/v1/jobs/{other.id}/').status_code, 404)
+
+    def test_cancel(self):
+        job = echo.enqueue(user=self.user)
+        response = self.client.post(f'/api/v1/jobs/{job.id}/cancel/')
+        self.assertEqual(response.json()['status'], Job.CANCELLED)
+        self.assertEqual(queue.claim(), [])
+        response = self.client.post(f'/api/v1/jobs/{job.id}/cancel/')
+        self.assertEqual(response.status_code, 409)
+
+    def test_stats_are_admin_only(self):
+        echo.enqueue()
+        self.assertEqual(self.client.get('/api/v1/jobs/stats/').status_code, 403)
+        self.client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+        data = self.client.get('/api/v1/jobs/stats/').json()
+        self.assertEqual(data['queues']['default'], {'queued': 1})
+        self.assertIn('chatbot.generate_reply', data['tasks'])
+
+
+@override_settings(
+    JOBS_MODE='sync', CHATBOT_LLM_BACKEND='local', CHATBOT_LOCAL_LLM_LATENCY=0, CHATBOT_LOCAL_LLM_TOKEN_LATENCY=0,
+)
+class BackgroundChatTests(TestCase):
+    def setUp(self):
+        intent_cache.reset()
+        sampling.reset()
+        self.user = User.objects.create_user('listener')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        create_songs(3, title='Jazz')
+
+    def test_background_reply(self):
+        response = self.client.post('/api/v1/chatbot/chat/', {'message': 'play some jazz music', 'background': True}, format='json')
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        job = self.client.get(f"/api/v1/jobs/{data['job_id']}/").json()
+        self.assertEqual(job['status'], Job.SUCCEEDED)
+        self.assertEqual(job['result']['conversation_id'], data['conversation_id'])
+        self.assertTrue(job['result']['songs'])
+        reply = Message.objects.get(conversation_id=data['conversation_id'], role='assistant')
+        self.assertEqual(reply.content, job['result']['message'])
+
+    @override_settings(JOBS_MODE='worker')
+    def test_retried_background_reply_is_not_repeated(self):
+        response = self.client.post('/api/v1/chatbot/chat/', {'message': 'play some jazz music', 'background': True}, format='json')
+        job = Job.objects.get(id=response.json()['job_id'])
+        queue.Worker().run(once=True)
+        first = Job.objects.get(id=job.id).result
+        # As if the worker died after saving the reply and the job was requeued
+        Job.objects.filter(id=job.id).update(status=Job.QUEUED, result=None)
+        with mock.patch('chatbot.replies.respond') as respond:
+            queue.Worker().run(once=True)
+        respond.assert_not_called()
+        self.assertEqual(Job.objects.get(id=job.id).result, first)
+        self.assertEqual(Message.objects.filter(conversation_id=first['conversation_id'], role='assistant').count(), 1)
+
+    @override_settings(JOBS_MODE='worker')
+    def test_background_reply_waits_for_a_worker(self):
+        with mock.patch('chatbot.replies.respond') as respond:
+            response = self.client.post('/api/v1/chatbot/chat/', {'message': 'hello there', 'background': True}, format='json')
+        respond.assert_not_called()
+        self.assertEqual(response.json()['status'], Job.QUEUED)
+        self.assertEqual(Job.objects.get().task, 'chatbot.generate_reply')
@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.db.models import Count, Min
+from django.utils import timezone
+from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+
+from .models import Job
+from .serializers import JobSerializer
+from . import queue
+from root.pagination import JobCursorPagination
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = JobCursorPagination
+
+    def get_queryset(self):
+        jobs = Job.objects.all()
+        if not self.request.user.is_staff:
+            jobs = jobs.filter(user=self.request.user)
+        job_status = self.request.query_params.get('status')
+        if job_status:
+            jobs = jobs.filter(status=job_status)
+        return jobs
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """Cancel a job that has not started yet"""
+        job = self.get_object()
+        if not queue.cancel(job):
+            return Response({'error': f'Job is {job.status} and can no longer be cancelled'},
+                            status=status.HTTP_409_CONFLICT)
+        return Response(JobSerializer(job).data)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def stats(self, request):
+        """Jobs per queue and status, and how late the oldest due job is per queue"""
+        counts = {}
+        for row in Job.objects.values('queue', 'status').annotate(count=Count('id')).order_by('queue', 'status'):
+            counts.setdefault(row['queue'], {})[row['status']] = row['count']
+        now = timezone.now()
+        oldest_due = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).values('queue').annotate(run_at=Min('run_at'))
+        lag = {row['queue']: round((now - row['run_at']) / timedelta(seconds=1), 3) for row in oldest_due}
+        return Response({
+            'queues': counts,
+            'lag_seconds': lag,
+            'tasks': sorted(queue.registry),
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,65 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+POSITION_GAP = 1 << 20
+
+
+def number_existing_entries(apps, schema_editor):
+    PlaylistSong = apps.get_model('playlists', 'PlaylistSong')
+    entries = []
+    playlist_id, position = None, 0
+    # Existing playlists keep the order songs were added in
+    for entry in PlaylistSong.objects.order_by('playlist_id', 'id').only('id', 'playlist_id').iterator(chunk_size=10000):
+        if entry.playlist_id != playlist_id:
+            playlist_id, position = entry.playlist_id, 0
+        position += POSITION_GAP
+        entry.position = position
+        entries.append(entry)
+        if len(entries) >= 5000:
+            PlaylistSong.objects.bulk_update(entries, ['position'])
+            entries = []
+    PlaylistSong.objects.bulk_update(entries, ['position'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('playlists', '0001_initial'),
+        ('songs', '0001_initial'),
+    ]
+
+    operations = [
+        # The auto-created many-to-many table becomes an explicit model without being rebuilt
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='PlaylistSong',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('playlist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='playlists.playlist')),
+                        ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='playlist_entries', to='songs.song')),
+                    ],
+                    options={
+                        'db_table': 'playlists_playlist_songs',
+                        'unique_together': {('playlist', 'song')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='playlist',
+                    name='songs',
+                    field=models.ManyToManyField(related_name='playlists', through='playlists.PlaylistSong', to='songs.song'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='playlistsong',
+            name='position',
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.RunPython(number_existing_entries, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='playlistsong',
+            index=models.Index(fields=['playlist', 'position'], name='playlist_song_position'),
+        ),
+    ]
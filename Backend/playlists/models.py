@@ -1,13 +1,147 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed
 from django.contrib.auth.models import User
 from songs.models import Song
 
+# Space left between consecutive positions; inserts take the midpoint of a gap,
+# so a gap absorbs ~20 inserts at the same spot before the playlist is renumbered
+POSITION_GAP = 1 << 20
+
+
+class PlaylistQuerySet(models.QuerySet):
+    def with_songs(self):
+        return self.prefetch_related(
+            models.Prefetch('entries', queryset=PlaylistSong.objects.in_order().with_songs())
+        )
+
+
+class PlaylistSongQuerySet(models.QuerySet):
+    def in_order(self):
+        return self.order_by('position', 'id')
+
+    def with_songs(self):
+        return self.select_related('song__album').prefetch_related('song__artists', 'song__genres')
+
+
 class Playlist(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="playlists")
     name = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
-    songs = models.ManyToManyField(Song, related_name="playlists")
+    songs = models.ManyToManyField(Song, related_name="playlists", through='PlaylistSong')
     cover_image = models.URLField(blank=True, null=True, default='https://d1m06rjnqs2z9j.cloudfront.net/playlist-cover/placeholder.png')
 
+    objects = PlaylistQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name} ({self.user.username})"
+
+    def ordered_songs(self):
+        """Songs in playlist order (uses the with_songs() prefetch when present)"""
+        if 'entries' in getattr(self, '_prefetched_objects_cache', {}):
+            entries = self.entries.all()
+        else:
+            entries = self.entries.in_order().with_songs()
+        return [entry.song for entry in entries]
+
+    def add_songs(self, song_ids, after=None, at_start=False):
+        """
+        Insert songs (in the given order) after the song ``after``, at the start,
+        or by default at the end. Songs already in the playlist are skipped.
+        Returns the ids that were added.
+        """
+        with transaction.atomic():
+            self._lock()
+            present = set(self.entries.filter(song_id__in=song_ids).values_list('song_id', flat=True))
+            song_ids = [song_id for song_id in dict.fromkeys(song_ids) if song_id not in present]
+            if not song_ids:
+                return []
+            m2m_changed.send(
+                sender=PlaylistSong, instance=self, action='pre_add', reverse=False,
+                model=Song, pk_set=set(song_ids), using=self._state.db,
+            )
+            positions = self._positions_for(len(song_ids), after, at_start)
+            PlaylistSong.objects.bulk_create([
+                PlaylistSong(playlist=self, song_id=song_id, position=position)
+                for song_id, position in zip(song_ids, positions)
+            ])
+            m2m_changed.send(
+                sender=PlaylistSong, instance=self, action='post_add', reverse=False,
+                model=Song, pk_set=set(song_ids), using=self._state.db,
+            )
+        return song_ids
+
+    def move_songs(self, song_ids, after=None, at_start=False):
+        """Move songs already in the playlist, keeping their given order; only their rows are written"""
+        song_ids = list(dict.fromkeys(song_ids))
+        with transaction.atomic():
+            self._lock()
+            entries = {entry.song_id: entry for entry in self.entries.filter(song_id__in=song_ids)}
+            moved = [entries[song_id] for song_id in song_ids if song_id in entries]
+            if not moved:
+                return []
+            positions = self._positions_for(len(moved), after, at_start, exclude=[entry.id for entry in moved])
+            for entry, position in zip(moved, positions):
+                entry.position = position
+            PlaylistSong.objects.bulk_update(moved, ['position'])
+        return [entry.song_id for entry in moved]
+
+    def renumber(self):
+        """Spread positions evenly again; runs when a gap has been split down to nothing"""
+        entries = list(self.entries.in_order().only('id', 'position'))
+        for i, entry in enumerate(entries, 1):
+            entry.position = i * POSITION_GAP
+        PlaylistSong.objects.bulk_update(entries, ['position'], batch_size=1000)
+
+    def _lock(self):
+        # Serializes position changes to the same playlist (a no-op on SQLite)
+        list(Playlist.objects.select_for_update().filter(pk=self.pk).values_list('pk', flat=True))
+
+    def _positions_for(self, count, after=None, at_start=False, exclude=()):
+        """``count`` increasing positions for new rows at the requested spot"""
+        entries = self.entries.exclude(id__in=exclude).in_order()
+        for attempt in range(2):
+            if at_start:
+                lower, upper = None, entries.values_list('position', flat=True).first()
+            elif after is not None:
+                anchor = entries.filter(song_id=after).values_list('position', 'id').first()
+                if anchor is None:
+                    raise PlaylistSong.DoesNotExist(f"Song {after} is not in the playlist")
+                lower = anchor[0]
+                upper = entries.filter(
+                    models.Q(position__gt=anchor[0]) | models.Q(position=anchor[0], id__gt=anchor[1])
+                ).values_list('position', flat=True).first()
+            else:
+                lower, upper = entries.values_list('position', flat=True).last(), None
+
+            if lower is None and upper is None:
+                return [i * POSITION_GAP for i in range(1, count + 1)]
+            if upper is None:
+                return [lower + i * POSITION_GAP for i in range(1, count + 1)]
+            if lower is None:
+                return [upper - (count + 1 - i) * POSITION_GAP for i in range(1, count + 1)]
+            step = (upper - lower) // (count + 1)
+            if step >= 1:
+                return [lower + i * step for i in range(1, count + 1)]
+            if attempt == 0:
+                self.renumber()
+        # Still no room: the block is larger than a gap, so open one by shifting the tail
+        shift = (count + 1) * POSITION_GAP
+        entries.filter(position__gte=upper).update(position=models.F('position') + shift)
+        return [lower + i * POSITION_GAP for i in range(1, count + 1)]
+
+
+class PlaylistSong(models.Model):
+    playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE, related_name='entries')
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='playlist_entries')
+    position = models.BigIntegerField()
+
+    objects = PlaylistSongQuerySet.as_manager()
+
+    class Meta:
+        # Keeps the table of the former auto-created many-to-many
+        db_table = 'playlists_playlist_songs'
+        unique_together = [('playlist', 'song')]
+        indexes = [models.Index(fields=['playlist', 'position'], name='playlist_song_position')]
+
+    def __str__(self):
+        return f"{self.playlist_id}:{self.position} {self.song_id}"
@@ -4,7 +4,7 @@ from songs.serializers import SongSerializer
 from django.contrib.auth.models import User
 
 class PlaylistSerializer(serializers.ModelSerializer):
-    songs = SongSerializer(many=True, read_only=True)
+    songs = SongSerializer(source='ordered_songs', many=True, read_only=True)
     user = serializers.PrimaryKeyRelatedField(
         read_only=True,
         default=serializers.CurrentUserDefault()
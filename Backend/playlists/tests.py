@@ -1,3 +1,150 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from songs.tests import create_songs
+from .models import Playlist, PlaylistSong
+
+
+class PlaylistQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('listener', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_playlist(self, song_count):
+        playlist = Playlist.objects.create(user=self.user, name=f'{song_count} songs')
+        playlist.add_songs([song.id for song in create_songs(song_count, title=f'Playlist {song_count}')])
+        return playlist
+
+    def test_list(self):
+        self.create_playlist(1)
+        with self.assertNumQueries(4):
+            self.client.get('/api/v1/playlists/')
+        self.create_playlist(10)
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/v1/playlists/')
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_retrieve(self):
+        playlist = self.create_playlist(10)
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/v1/playlists/{playlist.id}/')
+        self.assertEqual(len(response.data['songs']), 10)
+
+
+class PlaylistBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('listener', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.playlist = Playlist.objects.create(user=self.user, name='Mix')
+
+    def post(self, action, song_ids):
+        return self.client.post(f'/api/v1/playlists/{self.playlist.id}/{action}/', {'song_ids': song_ids}, format='json')
+
+    def test_add_songs(self):
+        songs = create_songs(3)
+        self.playlist.add_songs([songs[0].id])
+        response = self.post('add_songs', [song.id for song in songs] + [songs[1].id])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['added'], [songs[1].id, songs[2].id])
+        self.assertEqual(self.playlist.songs.count(), 3)
+
+    def test_add_songs_is_all_or_nothing(self):
+        song = create_songs(1)[0]
+        response = self.post('add_songs', [song.id, 999999])
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['song_ids'], [999999])
+        self.assertEqual(self.playlist.songs.count(), 0)
+
+    def test_queries_do_not_grow_with_batch_size(self):
+        small = [song.id for song in create_songs(2, title='Small')]
+        large = [song.id for song in create_songs(50, title='Large')]
+        with self.assertNumQueries(10):
+            self.post('add_songs', small)
+        with self.assertNumQueries(10):
+            self.post('add_songs', large)
+        with self.assertNumQueries(5):
+            response = self.post('remove_songs', large + [small[0]])
+        self.assertEqual(len(response.data['removed']), 51)
+        self.assertEqual(list(self.playlist.songs.values_list('id', flat=True)), [small[1]])
+
+    def test_remove_songs_reports_songs_not_in_playlist(self):
+        songs = create_songs(2)
+        self.playlist.add_songs([songs[0].id])
+        response = self.post('remove_songs', [songs[0].id, songs[1].id])
+        self.assertEqual(response.data['removed'], [songs[0].id])
+        self.assertEqual(response.data['not_in_playlist'], [songs[1].id])
+
+    def test_invalid_requests(self):
+        for song_ids in ([], 'x', [1, 'two'], [True], list(range(1001))):
+            self.assertEqual(self.post('add_songs', song_ids).status_code, 400)
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('other'))
+        response = other.post(f'/api/v1/playlists/{self.playlist.id}/add_songs/', {'song_ids': [1]}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+class OrderedPlaylistTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('listener', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.playlist = Playlist.objects.create(user=self.user, name='Mix')
+        self.songs = [song.id for song in create_songs(6)]
+        self.playlist.add_songs(self.songs[:4])
+
+    def order(self):
+        return [song.id for song in self.playlist.ordered_songs()]
+
+    def test_insert_positions(self):
+        a, b, c, d, e, f = self.songs
+        self.assertEqual(self.playlist.add_songs([e], after=a), [e])
+        self.assertEqual(self.playlist.add_songs([f, a], at_start=True), [f])
+        self.assertEqual(self.order(), [f, a, e, b, c, d])
+        response = self.client.get(f'/api/v1/playlists/{self.playlist.id}/')
+        self.assertEqual([song['id'] for song in response.data['songs']], [f, a, e, b, c, d])
+
+    def test_move_writes_only_the_moved_rows(self):
+        a, b, c, d = self.songs[:4]
+        before = dict(PlaylistSong.objects.values_list('song_id', 'position'))
+        response = self.client.post(
+            f'/api/v1/playlists/{self.playlist.id}/move_songs/', {'song_ids': [d, b], 'after': a}, format='json'
+        )
+        self.assertEqual(response.data['moved'], [d, b])
+        self.assertEqual(self.order(), [a, d, b, c])
+        after = dict(PlaylistSong.objects.values_list('song_id', 'position'))
+        self.assertEqual({song_id for song_id in before if before[song_id] != after[song_id]}, {b, d})
+
+        self.playlist.move_songs([c], at_start=True)
+        self.playlist.move_songs([a])
+        self.assertEqual(self.order(), [c, d, b, a])
+
+    def test_exhausted_gap_is_renumbered(self):
+        a, b = self.songs[:2]
+        extra = [song.id for song in create_songs(40, title='Extra')]
+        # Every insert lands right after a, halving the same gap
+        for song_id in extra:
+            self.playlist.add_songs([song_id], after=a)
+        self.assertEqual(self.order(), [a] + extra[::-1] + self.songs[1:4])
+        positions = list(PlaylistSong.objects.in_order().values_list('position', flat=True))
+        self.assertEqual(len(set(positions)), len(positions))
+
+    def test_invalid_moves(self):
+        a, b = self.songs[:2]
+        url = f'/api/v1/playlists/{self.playlist.id}/move_songs/'
+        self.assertEqual(self.client.post(url, {'song_ids': [a], 'after': a}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(url, {'song_ids': [a], 'after': self.songs[5]}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(url, {'song_ids': [a], 'after': 'b'}, format='json').status_code, 400)
+        self.assertEqual(self.order(), self.songs[:4])
+
+    def test_songs_are_paginated_in_order(self):
+        self.playlist.move_songs([self.songs[3]], at_start=True)
+        expected = [self.songs[3]] + self.songs[:3]
+        url = f'/api/v1/playlists/{self.playlist.id}/songs/?page_size=3'
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        ids = [song['id'] for song in response.data['results']]
+        ids += [song['id'] for song in self.client.get(response.data['next']).data['results']]
+        self.assertEqual(ids, expected)
@@ -1,11 +1,20 @@
+from django.db import transaction
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from .models import Playlist
+from .models import Playlist, PlaylistSong
 from .serializers import PlaylistSerializer
 from songs.models import Song
 from albums.models import Album
+from songs.serializers import SongSerializer
+from recommendations.collaborative import continuation_ids
+from recommendations.embeddings import similar_song_ids
+from root.pagination import PlaylistSongCursorPagination, query_limit
+
+CONTINUE_DEFAULT_LIMIT = 10
+CONTINUE_MAX_LIMIT = 50
+MAX_BATCH_SONGS = 1000
 
 
 class PlaylistViewSet(viewsets.ModelViewSet):
@@ -13,7 +22,11 @@ class PlaylistViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return Playlist.objects.filter(user=self.request.user)
+        playlists = Playlist.objects.filter(user=self.request.user)
+        if self.action in ('list', 'retrieve', 'create', 'update', 'partial_update'):
+            return playlists.with_songs()
+        # Song actions work on ids; no need to load every song in the playlist
+        return playlists
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -24,7 +37,7 @@ class PlaylistViewSet(viewsets.ModelViewSet):
         try:
             song_id = request.data.get('song_id')
             song = Song.objects.get(id=song_id)
-            playlist.songs.add(song)
+            playlist.add_songs([song.id])
             return Response(
                 {"message": f"Song '{song.title}' added to playlist '{playlist.name}'"}, 
                 status=status.HTTP_200_OK
@@ -46,7 +59,7 @@ class PlaylistViewSet(viewsets.ModelViewSet):
         try:
             song_id = request.data.get('song_id')
             song = Song.objects.get(id=song_id)
-            if song in playlist.songs.all():
+            if PlaylistSong.objects.filter(playlist=playlist, song=song).exists():
                 playlist.songs.remove(song)
                 return Response(
                     {"message": f"Song '{song.title}' removed from playlist '{playlist.name}'"}, 
@@ -68,14 +81,137 @@ class PlaylistViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    def _song_ids(self, request):
+        """The request's 'song_ids', de-duplicated in order, or an error response"""
+        song_ids = request.data.get('song_ids')
+        if (
+            not isinstance(song_ids, list) or not song_ids
+            or not all(isinstance(song_id, int) and not isinstance(song_id, bool) for song_id in song_ids)
+        ):
+            return None, Response(
+                {"error": "'song_ids' must be a non-empty list of song ids."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(song_ids) > MAX_BATCH_SONGS:
+            return None, Response(
+                {"error": f"At most {MAX_BATCH_SONGS} songs can be changed at once."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return list(dict.fromkeys(song_ids)), None
+
+    def _placement(self, request):
+        """Where to put songs: after the song 'after', at the start with 'at_start', else at the end"""
+        after = request.data.get('after')
+        if after is not None and (not isinstance(after, int) or isinstance(after, bool)):
+            return None, Response(
+                {"error": "'after' must be a song id."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return {'after': after, 'at_start': bool(request.data.get('at_start'))}, None
+
+    @action(detail=True, methods=['post'])
+    def add_songs(self, request, pk=None):
+        """Add many songs in one transaction; songs already in the playlist are skipped"""
+        playlist = self.get_object()
+        song_ids, error = self._song_ids(request)
+        if error:
+            return error
+        placement, error = self._placement(request)
+        if error:
+            return error
+
+        with transaction.atomic():
+            existing = set(Song.objects.filter(id__in=song_ids).values_list('id', flat=True))
+            missing = [song_id for song_id in song_ids if song_id not in existing]
+            if missing:
+                return Response(
+                    {"error": "Songs not found", "song_ids": missing},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            try:
+                added = playlist.add_songs(song_ids, **placement)
+            except PlaylistSong.DoesNotExist as e:
+                return Response(
+                    {"error": str(e)},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        return Response(
+            {"message": f"{len(added)} songs added to playlist '{playlist.name}'", "added": added},
+            status=status.HTTP_200_OK
+        )
+
+    @action(detail=True, methods=['post'])
+    def remove_songs(self, request, pk=None):
+        """Remove many songs in one transaction; songs not in the playlist are reported, not an error"""
+        playlist = self.get_object()
+        song_ids, error = self._song_ids(request)
+        if error:
+            return error
+
+        with transaction.atomic():
+            present = set(
+                PlaylistSong.objects.filter(playlist=playlist, song_id__in=song_ids).values_list('song_id', flat=True)
+            )
+            removed = [song_id for song_id in song_ids if song_id in present]
+            playlist.songs.remove(*removed)
+        return Response(
+            {
+                "message": f"{len(removed)} songs removed from playlist '{playlist.name}'",
+                "removed": removed,
+                "not_in_playlist": [song_id for song_id in song_ids if song_id not in present],
+            },
+            status=status.HTTP_200_OK
+        )
+
+    @action(detail=True, methods=['post'])
+    def move_songs(self, request, pk=None):
+        """Move songs (in the given order) after another song, to the start, or to the end"""
+        playlist = self.get_object()
+        song_ids, error = self._song_ids(request)
+        if error:
+            return error
+        placement, error = self._placement(request)
+        if error:
+            return error
+        if placement['after'] in song_ids:
+            return Response(
+                {"error": "A song cannot be moved after itself."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            moved = playlist.move_songs(song_ids, **placement)
+        except PlaylistSong.DoesNotExist as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(
+            {
+                "message": f"{len(moved)} songs moved in playlist '{playlist.name}'",
+                "moved": moved,
+                "not_in_playlist": [song_id for song_id in song_ids if song_id not in moved],
+            },
+            status=status.HTTP_200_OK
+        )
+
+    @action(detail=True, methods=['get'])
+    def songs(self, request, pk=None):
+        """The playlist's songs in order, a page at a time"""
+        playlist = self.get_object()
+        paginator = PlaylistSongCursorPagination()
+        entries = paginator.paginate_queryset(playlist.entries.with_songs(), request, view=self)
+        serializer = SongSerializer([entry.song for entry in entries], many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     @action(detail=True, methods=['post'])
     def add_album(self, request, pk=None):
         playlist = self.get_object()
         try:
             album_id = request.data.get('album_id')
             album = Album.objects.get(id=album_id)
-            songs = Song.objects.filter(album=album)
-            playlist.songs.add(*songs)
+            song_ids = Song.objects.filter(album=album).order_by('id').values_list('id', flat=True)
+            playlist.add_songs(list(song_ids))
             return Response(
                 {"message": f"All songs from album '{album.title}' added to playlist '{playlist.name}'"},
                 status=status.HTTP_200_OK
@@ -90,3 +226,19 @@ class PlaylistViewSet(viewsets.ModelViewSet):
                 {"error": str(e)},
                 status=status.HTTP_400_BAD_REQUEST
             )
+
+    @action(detail=True, methods=['get'], url_path='continue')
+    def continue_playlist(self, request, pk=None):
+        """Songs to add next, from the neighbours of the songs already in the playlist"""
+        playlist = self.get_object()
+        limit, error = query_limit(request, CONTINUE_DEFAULT_LIMIT, CONTINUE_MAX_LIMIT)
+        if error:
+            return error
+
+        song_ids = list(PlaylistSong.objects.filter(playlist=playlist).values_list('song_id', flat=True))
+        if not song_ids:
+            return Response([], status=status.HTTP_200_OK)
+        ids = continuation_ids(song_ids, limit) or similar_song_ids(song_ids, limit)
+        songs = Song.objects.with_related().in_bulk(ids)
+        serializer = SongSerializer([songs[song_id] for song_id in ids if song_id in songs], many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
@@ -0,0 +1,109 @@
+"""
+Item-item collaborative filtering over playlist co-occurrence.
+
+Playlists are implicit feedback: songs that share many playlists, relative to
+how many playlists each is in, are neighbours. Training builds the sparse
+song x playlist matrix X, scores pairs with shrunk cosine similarity
+
+    sim(i, j) = co(i, j) / sqrt(n_i * n_j) * co(i, j) / (co(i, j) + shrinkage)
+
+where co = X @ X.T, and keeps the top N per song in the SongNeighbor table.
+Shrinkage damps pairs that only met in one or two playlists. Rows are scored
+in chunks so memory stays bounded on large catalogs.
+"""
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum
+
+from playlists.models import Playlist
+from .models import SongNeighbor
+
+PlaylistSong = Playlist.songs.through
+
+CHUNK_ROWS = 2048
+INSERT_BATCH = 5000
+
+
+def cooccurrence_matrix():
+    """CSR song x playlist matrix and the song id of each row"""
+    # Only training needs SciPy; serving reads the neighbour table
+    from scipy import sparse
+
+    pairs = np.array(
+        list(PlaylistSong.objects.values_list('song_id', 'playlist_id').iterator(chunk_size=10000)),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    song_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    _, cols = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (rows, cols)),
+        shape=(len(song_ids), cols.max() + 1 if len(pairs) else 0),
+    )
+    # Duplicate memberships would count twice
+    matrix.data[:] = 1
+    return matrix, song_ids
+
+
+def top_neighbors(matrix, top_n, shrinkage=0.0, min_cooccurrence=1):
+    """Yield (row, neighbour rows, scores) for each row with neighbours, best first"""
+    counts = np.asarray(matrix.sum(axis=1)).ravel()
+    transposed = matrix.T.tocsr()
+    for start in range(0, matrix.shape[0], CHUNK_ROWS):
+        co = (matrix[start:start + CHUNK_ROWS] @ transposed).tocsr()
+        for offset in range(co.shape[0]):
+            row = start + offset
+            begin, end = co.indptr[offset], co.indptr[offset + 1]
+            cols = co.indices[begin:end]
+            shared = co.data[begin:end]
+            keep = (cols != row) & (shared >= min_cooccurrence)
+            cols, shared = cols[keep], shared[keep]
+            if not len(cols):
+                continue
+            scores = shared / np.sqrt(counts[row] * counts[cols])
+            if shrinkage:
+                scores *= shared / (shared + shrinkage)
+            if len(scores) > top_n:
+                best = np.argpartition(-scores, top_n)[:top_n]
+                cols, scores = cols[best], scores[best]
+            order = np.lexsort((cols, -scores))
+            yield row, cols[order], scores[order]
+
+
+def train(top_n=50, shrinkage=10.0, min_cooccurrence=1):
+    """Recompute the neighbour table; returns the number of rows written"""
+    matrix, song_ids = cooccurrence_matrix()
+    written = 0
+    with transaction.atomic():
+        SongNeighbor.objects.all().delete()
+        batch = []
+        for row, cols, scores in top_neighbors(matrix, top_n, shrinkage, min_cooccurrence):
+            song_id = int(song_ids[row])
+            for rank, (col, score) in enumerate(zip(cols, scores)):
+                batch.append(SongNeighbor(
+                    song_id=song_id, neighbor_id=int(song_ids[col]), rank=rank, score=float(score)
+                ))
+            if len(batch) >= INSERT_BATCH:
+                SongNeighbor.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        SongNeighbor.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+def neighbor_ids(song_id, limit):
+    return list(
+        SongNeighbor.objects.filter(song_id=song_id).order_by('rank').values_list('neighbor_id', flat=True)[:limit]
+    )
+
+
+def continuation_ids(song_ids, limit):
+    """Songs that best continue a set of songs: summed neighbour scores, excluding the set"""
+    return list(
+        SongNeighbor.objects.filter(song_id__in=song_ids)
+        .exclude(neighbor_id__in=song_ids)
+        .values('neighbor_id')
+        .annotate(total=Sum('score'))
+        .order_by('-total', 'neighbor_id')
+        .values_list('neighbor_id', flat=True)[:limit]
+    )
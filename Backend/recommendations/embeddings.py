@@ -0,0 +1,371 @@
+"""
+Dense song vectors for "songs like X".
+
+Each song's features (its genres, artists and album, the playlists it is in
+and the chatbot messages that recommended it) are feature-hashed into
+SONG_EMBEDDINGS_DIM signed buckets and L2-normalized, so the dot product of
+two rows is their cosine similarity. Playlists and messages are weighted by
+1/sqrt(size), so a 500-song playlist says less about any pair than a
+10-song one.
+
+The matrix is saved as a .npy file (rows aligned with a sorted ids file) and
+memory-mapped on load. Builds only run in the build_song_embeddings job (or
+the command): requests serve the saved index, or the last one built in the
+process, and catalog changes queue a debounced rebuild instead of dropping
+it. Until the first build the index is empty and lookups return nothing.
+
+Search is an exact batched matrix product, or with
+SONG_EMBEDDINGS_ANN_LISTS > 0 an inverted-file index: rows are grouped by
+their nearest k-means centroid and only the SONG_EMBEDDINGS_ANN_PROBES
+closest groups are scanned.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from chatbot.models import Message
+from playlists.models import Playlist
+from songs.models import Song
+
+FEATURE_WEIGHTS = {
+    'genre': 1.0,
+    'artist': 1.5,
+    'album': 1.0,
+    'playlist': 1.0,
+    'message': 0.5,
+}
+
+# Rows scored per matrix product, to bound temporary memory on large catalogs
+CHUNK_ROWS = 65536
+
+
+def _bucket(feature, dim):
+    digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), 'little')
+    return digest % dim, -1.0 if digest >> 63 else 1.0
+
+
+class FeatureHasher:
+    def __init__(self, dim):
+        self.dim = dim
+        self._buckets = {}
+
+    def bucket(self, feature):
+        bucket = self._buckets.get(feature)
+        if bucket is None:
+            bucket = self._buckets[feature] = _bucket(feature, self.dim)
+        return bucket
+
+
+def song_relations(song_ids=None):
+    """(song_id, feature, weight) for every feature of the given songs (or all songs)"""
+    def scoped(queryset, field='song_id'):
+        return queryset.filter(**{f'{field}__in': song_ids}) if song_ids is not None else queryset
+
+    for song_id, genre_id in scoped(Song.genres.through.objects.values_list('song_id', 'genre_id')).iterator(chunk_size=10000):
+        yield song_id, f'genre:{genre_id}', FEATURE_WEIGHTS['genre']
+    for song_id, artist_id in scoped(Song.artists.through.objects.values_list('song_id', 'artist_id')).iterator(chunk_size=10000):
+        yield song_id, f'artist:{artist_id}', FEATURE_WEIGHTS['artist']
+    for song_id, album_id in scoped(Song.objects.values_list('id', 'album_id'), 'id').iterator(chunk_size=10000):
+        yield song_id, f'album:{album_id}', FEATURE_WEIGHTS['album']
+
+    for kind, through, context in (
+        ('playlist', Playlist.songs.through, 'playlist_id'),
+        ('message', Message.recommended_songs.through, 'message_id'),
+    ):
+        memberships = list(scoped(through.objects.values_list('song_id', context)).iterator(chunk_size=10000))
+        if song_ids is None:
+            sizes = Counter(context_id for _, context_id in memberships)
+        else:
+            # Sizes count the whole playlist/message, not just the scoped songs
+            contexts = {context_id for _, context_id in memberships}
+            sizes = Counter(through.objects.filter(**{f'{context}__in': contexts}).values_list(context, flat=True))
+        for song_id, context_id in memberships:
+            yield song_id, f'{kind}:{context_id}', FEATURE_WEIGHTS[kind] / sizes[context_id] ** 0.5
+
+
+def build_vectors(ids, relations, dim):
+    """Matrix with one L2-normalized row per id (ids must be sorted)"""
+    vectors = np.zeros((len(ids), dim), dtype=np.float32)
+    if not len(ids):
+        return vectors
+    hasher = FeatureHasher(dim)
+    song_ids, cols, values = [], [], []
+    for song_id, feature, weight in relations:
+        col, sign = hasher.bucket(feature)
+        song_ids.append(song_id)
+        cols.append(col)
+        values.append(sign * weight)
+    song_ids = np.array(song_ids, dtype=np.int64)
+    rows = np.minimum(np.searchsorted(ids, song_ids), len(ids) - 1)
+    known = ids[rows] == song_ids
+    np.add.at(vectors, (rows[known], np.array(cols, dtype=np.int64)[known]), np.array(values, dtype=np.float32)[known])
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+def kmeans(vectors, lists, iterations=10, seed=0):
+    """Spherical k-means: centroids and each row's list"""
+    rng = np.random.default_rng(seed)
+    lists = min(lists, len(vectors))
+    centroids = np.array(vectors[rng.choice(len(vectors), lists, replace=False)])
+    for _ in range(iterations):
+        assignment = assign(vectors, centroids)
+        for i in range(lists):
+            members = vectors[assignment == i]
+            if len(members):
+                centroid = members.sum(axis=0)
+                norm = np.linalg.norm(centroid)
+                centroids[i] = centroid / norm if norm else centroid
+    return centroids, assign(vectors, centroids)
+
+
+def assign(vectors, centroids):
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), CHUNK_ROWS):
+        assignment[start:start + CHUNK_ROWS] = np.argmax(vectors[start:start + CHUNK_ROWS] @ centroids.T, axis=1)
+    return assignment
+
+
+class EmbeddingIndex:
+    def __init__(self, ids, vectors, centroids=None, order=None, offsets=None):
+        self.ids = ids
+        self.vectors = vectors
+        # Inverted file: rows of list i are order[offsets[i]:offsets[i + 1]]
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+    @classmethod
+    def build(cls, dim=None, lists=None):
+        dim = dim or settings.SONG_EMBEDDINGS_DIM
+        lists = settings.SONG_EMBEDDINGS_ANN_LISTS if lists is None else lists
+        ids = np.fromiter(Song.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=10000), dtype=np.int64)
+        vectors = build_vectors(ids, song_relations(), dim)
+        if not lists or len(ids) < lists:
+            return cls(ids, vectors)
+        centroids, assignment = kmeans(vectors, lists)
+        order = np.argsort(assignment, kind='stable')
+        offsets = np.searchsorted(assignment[order], np.arange(len(centroids) + 1))
+        return cls(ids, vectors, centroids, order, offsets)
+
+    @staticmethod
+    def _paths(path):
+        base = path[:-len('.npy')] if path.endswith('.npy') else path
+        return {
+            'vectors': f'{base}.npy',
+            'ids': f'{base}.ids.npy',
+            'centroids': f'{base}.centroids.npy',
+            'order': f'{base}.order.npy',
+            'offsets': f'{base}.offsets.npy',
+        }
+
+    def save(self, path):
+        paths = self._paths(path)
+        arrays = {'vectors': self.vectors, 'ids': self.ids}
+        if self.centroids is not None:
+            arrays.update(centroids=self.centroids, order=self.order, offsets=self.offsets)
+        for name, array in arrays.items():
+            tmp_path = f'{paths[name]}.tmp.npy'
+            np.save(tmp_path, array)
+            os.replace(tmp_path, paths[name])
+        if self.centroids is None:
+            for name in ('centroids', 'order', 'offsets'):
+                if os.path.exists(paths[name]):
+                    os.remove(paths[name])
+
+    @classmethod
+    def load(cls, path):
+        paths = cls._paths(path)
+        ann = {}
+        if os.path.exists(paths['centroids']):
+            ann = {name: np.load(paths[name]) for name in ('centroids', 'order', 'offsets')}
+        # The matrix stays on disk; pages are read as rows are scored
+        return cls(np.load(paths['ids']), np.load(paths['vectors'], mmap_mode='r'), **ann)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows(self, song_ids):
+        song_ids = np.asarray(song_ids, dtype=np.int64)
+        rows = np.searchsorted(self.ids, song_ids)
+        rows[rows == len(self.ids)] = 0
+        found = (self.ids[rows] == song_ids) if len(self.ids) else np.zeros(len(song_ids), dtype=bool)
+        return rows, found
+
+    def vector_for(self, song_ids):
+        """Normalized mean vector of the songs; songs missing from the index are embedded on the fly"""
+        rows, found = self.rows(song_ids)
+        parts = [np.asarray(self.vectors[rows[found]])]
+        missing = np.asarray(song_ids, dtype=np.int64)[~found]
+        if len(missing):
+            missing = np.sort(missing)
+            parts.append(build_vectors(missing, song_relations([int(song_id) for song_id in missing]), self.dim))
+        vector = np.concatenate(parts).sum(axis=0)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _candidates(self, queries):
+        if self.centroids is None:
+            return None
+        probes = min(settings.SONG_EMBEDDINGS_ANN_PROBES, len(self.centroids))
+        closest = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :probes]
+        return [
+            np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in lists])
+            for lists in closest
+        ]
+
+    def search(self, queries, k, exclude=()):
+        """Top-k (song_id, score) lists for a batch of query vectors, best first"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        excluded = set(int(song_id) for song_id in exclude)
+        want = k + len(excluded)
+        candidates = self._candidates(queries)
+
+        results = []
+        if candidates is None:
+            # Exact: score every row in chunks, keeping the best of each chunk
+            best_rows = [np.empty(0, dtype=np.int64)] * len(queries)
+            best_scores = [np.empty(0, dtype=np.float32)] * len(queries)
+            for start in range(0, len(self.ids), CHUNK_ROWS):
+                scores = np.asarray(self.vectors[start:start + CHUNK_ROWS]) @ queries.T
+                for q in range(len(queries)):
+                    top = _top(scores[:, q], want)
+                    best_rows[q] = np.concatenate([best_rows[q], top + start])
+                    best_scores[q] = np.concatenate([best_scores[q], scores[top, q]])
+            pairs = zip(best_rows, best_scores)
+        else:
+            pairs = []
+            for q, rows in enumerate(candidates):
+                scores = np.asarray(self.vectors[rows]) @ queries[q]
+                pairs.append((rows, scores))
+
+        for rows, scores in pairs:
+            top = _top(scores, want)
+            # Best score first, ties broken by song id so results are stable across index layouts
+            top = top[np.lexsort((self.ids[rows[top]], -scores[top]))]
+            matches = [(int(self.ids[rows[i]]), float(scores[i])) for i in top if scores[i] > 0]
+            results.append([match for match in matches if match[0] not in excluded][:k])
+        return results
+
+    def similar(self, song_ids, k=10):
+        """Songs most similar to the given song (or songs, as a group), excluding them"""
+        if not len(self.ids):
+            return []
+        return self.search(self.vector_for(song_ids), k, exclude=song_ids)[0]
+
+
+def _top(scores, k):
+    if len(scores) <= k:
+        return np.arange(len(scores))
+    return np.argpartition(-scores, k)[:k]
+
+
+_index = None
+_mtime = None
+_lock = threading.Lock()
+_rebuild_scheduled_at = None
+
+
+def index_path():
+    return settings.SONG_EMBEDDINGS_PATH
+
+
+def rebuild(save=True):
+    global _index, _mtime
+    index = EmbeddingIndex.build()
+    path = index_path()
+    if save and path:
+        index.save(path)
+    with _lock:
+        _index = index
+        _mtime = os.path.getmtime(EmbeddingIndex._paths(path)['vectors']) if save and path else None
+    return index
+
+
+def _empty_index():
+    dim = settings.SONG_EMBEDDINGS_DIM
+    return EmbeddingIndex(np.zeros(0, dtype=np.int64), np.zeros((0, dim), dtype=np.float32))
+
+
+def get_index():
+    """
+    The saved index (reloaded when the file changes), else the last one built
+    in this process. Never builds: with neither, a build job is queued and an
+    empty index is returned.
+    """
+    global _index, _mtime
+    path = index_path()
+    vectors_path = EmbeddingIndex._paths(path)['vectors'] if path else None
+    if vectors_path and os.path.exists(vectors_path):
+        mtime = os.path.getmtime(vectors_path)
+        if _index is None or mtime != _mtime:
+            with _lock:
+                # Another thread may have loaded it while this one waited
+                if _index is None or mtime != _mtime:
+                    _index = EmbeddingIndex.load(path)
+                    _mtime = mtime
+        return _index
+    if _index is None:
+        schedule_rebuild(delay=0)
+        return _empty_index()
+    return _index
+
+
+def _recently_scheduled():
+    window = settings.SONG_EMBEDDINGS_REBUILD_DELAY
+    return _rebuild_scheduled_at is not None and time.monotonic() - _rebuild_scheduled_at < window
+
+
+def _enqueue_rebuild(delay):
+    global _rebuild_scheduled_at
+    from jobs.models import Job
+    from .tasks import build_song_embeddings
+
+    # Another transaction of this process may have committed first
+    if _recently_scheduled():
+        return
+    # Only set once a job is really queued: a rolled back change must not hold back later ones
+    _rebuild_scheduled_at = time.monotonic()
+    # One waiting build covers every change made before it starts
+    if not Job.objects.filter(task=build_song_embeddings.name, status=Job.QUEUED).exists():
+        build_song_embeddings.enqueue(delay=delay)
+
+
+def schedule_rebuild(delay=None):
+    """
+    Queue a build_song_embeddings job after the current transaction commits.
+    At most once per SONG_EMBEDDINGS_REBUILD_DELAY per process, and the job
+    waits that long by default, so a burst of edits costs one build.
+    """
+    if _recently_scheduled():
+        return
+    window = settings.SONG_EMBEDDINGS_REBUILD_DELAY
+    transaction.on_commit(lambda: _enqueue_rebuild(window if delay is None else delay))
+
+
+def catalog_changed():
+    """Song features changed: the current index keeps serving until the queued rebuild replaces it"""
+    schedule_rebuild()
+
+
+def reset():
+    global _index, _mtime, _rebuild_scheduled_at
+    with _lock:
+        _index = None
+        _mtime = None
+        _rebuild_scheduled_at = None
+
+
+def similar_song_ids(song_ids, k=10):
+    return [song_id for song_id, _ in get_index().similar(list(song_ids), k)]
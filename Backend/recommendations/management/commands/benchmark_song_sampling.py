@@ -0,0 +1,76 @@
+import random
+import time
+from array import array
+
+from django.core.management.base import BaseCommand
+
+from songs.models import Song
+from recommendations.sampling import DatabaseSampler, PoolSampler
+
+GENRES = 20
+
+
+def synthetic_pool(size, rng):
+    """A pool shaped like a real catalog: sequential ids, skewed playlist entries, 20 genres"""
+    ids = array('q', range(1, size + 1))
+    # Cubing a uniform draw concentrates playlist entries on the low ids
+    entries = array('q', (1 + int(size * rng.random() ** 3) for _ in range(size // 5)))
+    genres = {genre: array('q', range(genre + 1, size + 1, GENRES)) for genre in range(GENRES)}
+    return PoolSampler(ids, entries, genres)
+
+
+def timed(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def legacy_sample(ids, k):
+    # What the chatbot fallback used to do on every request
+    shuffled = list(ids)
+    random.shuffle(shuffled)
+    return shuffled[:k]
+
+
+class Command(BaseCommand):
+    help = 'Time random song sampling against catalog size (synthetic pools, optionally the live database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,100000,1000000,10000000',
+                            help='Comma-separated synthetic catalog sizes')
+        parser.add_argument('-k', type=int, default=5, help='Songs per sample')
+        parser.add_argument('--repeat', type=int, default=2000)
+        parser.add_argument('--legacy-max', type=int, default=1000000,
+                            help='Largest size to time the old load-and-shuffle approach at')
+        parser.add_argument('--database', action='store_true',
+                            help='Also time both samplers against the current database')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        k, repeat = options['k'], options['repeat']
+        genre_weights = {0: 3, 1: 1}
+
+        self.stdout.write(f'{"songs":>10} {"uniform":>10} {"popular":>10} {"genre":>10} {"legacy":>12}   (us per sample of {k})')
+        for size in (int(s) for s in options['sizes'].split(',')):
+            pool = synthetic_pool(size, rng)
+            uniform = timed(lambda: pool.sample(k, rng=rng), repeat)
+            popular = timed(lambda: pool.sample(k, popularity=True, rng=rng), repeat)
+            genre = timed(lambda: pool.sample(k, genres=genre_weights, rng=rng), repeat)
+            if size <= options['legacy_max']:
+                legacy = f'{timed(lambda: legacy_sample(pool.ids, k), max(1, min(repeat, 10_000_000 // size))):12.1f}'
+            else:
+                legacy = f'{"-":>12}'
+            self.stdout.write(f'{size:>10} {uniform:10.1f} {popular:10.1f} {genre:10.1f} {legacy}')
+
+        if options['database']:
+            count = Song.objects.count()
+            started = time.perf_counter()
+            pool = PoolSampler.build()
+            self.stdout.write(f'\nDatabase catalog: {count} songs, pool built in {(time.perf_counter() - started) * 1000:.1f} ms')
+            database = DatabaseSampler()
+            for name, sampler in (('pool', pool), ('database', database)):
+                # Includes fetching the sampled rows, as the chatbot fallback does
+                cost = timed(lambda: list(Song.objects.filter(id__in=sampler.sample(k, rng=rng))), min(repeat, 200))
+                self.stdout.write(f'{name:>10} {cost:10.1f} us per sample + fetch')
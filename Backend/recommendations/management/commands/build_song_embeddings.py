@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recommendations import embeddings
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the song similarity vectors and write them to SONG_EMBEDDINGS_PATH'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        index = embeddings.rebuild(save=True)
+        elapsed = time.perf_counter() - started
+        mode = f'{len(index.centroids)} ANN lists' if index.centroids is not None else 'exact search'
+        self.stdout.write(self.style.SUCCESS(
+            f'Embedded {len(index)} songs ({index.dim} dims, {mode}) in {elapsed:.1f}s to {embeddings.index_path()}'
+        ))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recommendations import collaborative
+
+
+class Command(BaseCommand):
+    help = 'Train item-item collaborative filtering from playlists and rewrite the song neighbour table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-n', type=int, default=50, help='Neighbours kept per song')
+        parser.add_argument('--shrinkage', type=float, default=10.0,
+                            help='Damps similarities supported by few shared playlists')
+        parser.add_argument('--min-cooccurrence', type=int, default=1,
+                            help='Shared playlists required before two songs are neighbours')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = collaborative.train(
+            top_n=options['top_n'],
+            shrinkage=options['shrinkage'],
+            min_cooccurrence=options['min_cooccurrence'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} song neighbours in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('songs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SongNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='songs.song')),
+                ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='songs.song')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('song', 'rank'), name='unique_song_neighbor_rank')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import models
+from songs.models import Song
+
+class SongNeighbor(models.Model):
+    """Top-N collaborative-filtering neighbours of a song (python manage.py train_song_neighbors)."""
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['song', 'rank'], name='unique_song_neighbor_rank'),
+        ]
+
+    def __str__(self):
+        return f'{self.song_id} -> {self.neighbor_id} ({self.score:.3f})'
@@ -0,0 +1,320 @@
+"""
+Random song sampling in O(k) per request.
+
+``pool`` (default) keeps the catalog's song ids in a compact ``array('q')``
+per worker, plus one entry per playlist membership (so a uniform draw from
+those entries is a draw weighted by popularity) and an id array per genre.
+Signals keep them current for changes made by this worker; the pool is
+rebuilt from the database every SONG_SAMPLER_TTL seconds to pick up the rest.
+Entries are never searched for: removals are recorded per song and the
+stale entry is swapped out the first time a draw lands on it.
+
+``database`` keeps nothing in memory: it draws random ids between the
+smallest and largest primary key and keeps the ones that exist, oversampling
+by the estimated id density. On PostgreSQL the row count estimate comes from
+pg_class, so no step scans the table.
+
+Both return distinct song ids; callers fetch the rows they need.
+"""
+import heapq
+import math
+import random
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max, Min
+
+from playlists.models import Playlist
+from songs.models import Song
+
+SongGenre = Song.genres.through
+PlaylistSong = Playlist.songs.through
+
+# Extra draw rounds before giving up on filling k (sparse ids, tiny genres, ...)
+MAX_ROUNDS = 4
+# Upper bound on ids probed per database round
+MAX_DRAWS = 2000
+
+
+class PoolSampler:
+    def __init__(self, ids=(), entries=(), genres=None):
+        """ids and the genre id lists must be sorted; entries are in any order"""
+        self.ids = array('q', ids)
+        # Song id per playlist membership; duplicates are the point
+        self.entries = array('q', entries)
+        self.genres = {genre_id: array('q', song_ids) for genre_id, song_ids in (genres or {}).items()}
+        # Entries still in the array but no longer in a playlist (per song), and deleted songs
+        self.removed_entries = {}
+        self.deleted = set()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def build(cls):
+        genres = {}
+        rows = SongGenre.objects.order_by('genre_id', 'song_id').values_list('song_id', 'genre_id')
+        for song_id, genre_id in rows.iterator(chunk_size=10000):
+            genres.setdefault(genre_id, array('q')).append(song_id)
+        return cls(
+            Song.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=10000),
+            PlaylistSong.objects.values_list('song_id', flat=True).iterator(chunk_size=10000),
+            genres,
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _draw(self, rng, popularity, genres):
+        """One song id, or None if the chosen population is empty"""
+        if genres:
+            genre_ids = list(genres)
+            genre_id = rng.choices(genre_ids, weights=[genres[g] for g in genre_ids])[0]
+            population = self.genres.get(genre_id)
+            return population[rng.randrange(len(population))] if population else None
+        if popularity:
+            # Weight 1 + number of playlists the song is in
+            i = rng.randrange(len(self.ids) + len(self.entries))
+            return self.ids[i] if i < len(self.ids) else self._entry(i - len(self.ids))
+        return self.ids[rng.randrange(len(self.ids))]
+
+    def _entry(self, i):
+        """The song of entry i, or None after dropping it if it was removed"""
+        song_id = self.entries[i]
+        if song_id in self.deleted:
+            self._drop_entry(i)
+            return None
+        removed = self.removed_entries.get(song_id)
+        if removed:
+            # Entries of one song are interchangeable: any of them can stand for the removed one
+            if removed == 1:
+                del self.removed_entries[song_id]
+            else:
+                self.removed_entries[song_id] = removed - 1
+            self._drop_entry(i)
+            return None
+        return song_id
+
+    def _drop_entry(self, i):
+        # Order does not matter, so fill the hole with the last entry
+        self.entries[i] = self.entries[-1]
+        self.entries.pop()
+
+    def sample(self, k, popularity=False, genres=None, rng=random):
+        with self.lock:
+            if not self.ids:
+                return []
+            if not popularity and not genres:
+                return [self.ids[i] for i in rng.sample(range(len(self.ids)), min(k, len(self.ids)))]
+
+            picked = []
+            seen = set()
+            for _ in range(k * MAX_ROUNDS):
+                song_id = self._draw(rng, popularity, genres)
+                if song_id is not None and song_id not in seen:
+                    seen.add(song_id)
+                    picked.append(song_id)
+                    if len(picked) == k:
+                        break
+            if len(picked) < k and not genres:
+                # Popularity draws kept repeating the same songs; top up uniformly
+                for i in rng.sample(range(len(self.ids)), min(k + len(seen), len(self.ids))):
+                    if len(picked) == k:
+                        break
+                    if self.ids[i] not in seen:
+                        seen.add(self.ids[i])
+                        picked.append(self.ids[i])
+            return picked
+
+    # Maintenance, called from signals
+
+    def add_song(self, song_id):
+        with self.lock:
+            _insert(self.ids, song_id)
+            self.deleted.discard(song_id)
+
+    def remove_song(self, song_id):
+        with self.lock:
+            _discard(self.ids, song_id)
+            for population in self.genres.values():
+                _discard(population, song_id)
+            # Its playlist entries go when drawn
+            self.deleted.add(song_id)
+            self.removed_entries.pop(song_id, None)
+
+    def add_songs(self, song_ids, genre_links=()):
+        """Bulk version of add_song and add_genre (imports): one merge per array instead of one insert per id"""
+        genres = {}
+        for song_id, genre_id in genre_links:
+            genres.setdefault(genre_id, set()).add(song_id)
+        with self.lock:
+            self.ids = _merged(self.ids, song_ids)
+            for genre_id, genre_song_ids in genres.items():
+                self.genres[genre_id] = _merged(self.genres.get(genre_id, array('q')), genre_song_ids)
+
+    def add_genre(self, song_id, genre_id):
+        with self.lock:
+            _insert(self.genres.setdefault(genre_id, array('q')), song_id)
+
+    def remove_genre(self, song_id, genre_id):
+        with self.lock:
+            if genre_id in self.genres:
+                _discard(self.genres[genre_id], song_id)
+
+    def add_entries(self, song_ids):
+        with self.lock:
+            self.entries.extend(song_ids)
+
+    def remove_entries(self, song_ids):
+        with self.lock:
+            for song_id in song_ids:
+                if song_id not in self.deleted:
+                    self.removed_entries[song_id] = self.removed_entries.get(song_id, 0) + 1
+
+
+def _insert(ids, value):
+    i = bisect_left(ids, value)
+    if i == len(ids) or ids[i] != value:
+        insort(ids, value)
+
+
+def _merged(ids, values):
+    """A new sorted array of ids plus the values not in it yet"""
+    new = sorted(set(values).difference(ids))
+    if not new:
+        return ids
+    return array('q', heapq.merge(ids, new))
+
+
+def _discard(ids, value):
+    i = bisect_left(ids, value)
+    if i < len(ids) and ids[i] == value:
+        del ids[i]
+
+
+def estimated_count(model):
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+            row = cursor.fetchone()
+        # -1 (never analyzed) and 0 fall through to an exact count
+        if row and row[0] > 0:
+            return int(row[0])
+    return model.objects.count()
+
+
+class DatabaseSampler:
+    """Stateless id-range sampling; estimates are cached for SONG_SAMPLER_TTL seconds"""
+
+    def __init__(self, ttl=None):
+        self.ttl = settings.SONG_SAMPLER_TTL if ttl is None else ttl
+        self._stats = {}
+
+    def _cached(self, key, compute):
+        cached = self._stats.get(key)
+        if cached and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+        value = compute()
+        self._stats[key] = (time.monotonic(), value)
+        return value
+
+    def _table_stats(self, model):
+        def compute():
+            bounds = model.objects.aggregate(low=Min('id'), high=Max('id'))
+            if bounds['low'] is None:
+                return None
+            return bounds['low'], bounds['high'], estimated_count(model)
+        return self._cached(model, compute)
+
+    def _random_rows(self, model, k, column, rng, filters=None, count=None):
+        """
+        Up to k values of ``column`` from rows with uniformly random existing
+        ids; ``count`` is the expected number of rows matching ``filters``.
+        """
+        stats = self._table_stats(model)
+        if stats is None:
+            return []
+        low, high, table_count = stats
+        count = table_count if count is None else count
+        density = max(count, 1) / (high - low + 1)
+        found = []
+        seen = set()
+        for _ in range(MAX_ROUNDS):
+            wanted = k - len(found)
+            draws = {rng.randint(low, high) for _ in range(min(math.ceil(wanted / density * 1.5) + 2, MAX_DRAWS))}
+            rows = model.objects.filter(id__in=draws, **(filters or {})).values_list(column, flat=True)
+            for value in rows:
+                if value not in seen:
+                    seen.add(value)
+                    found.append(value)
+            if len(found) >= k:
+                break
+        rng.shuffle(found)
+        return found[:k]
+
+    def sample(self, k, popularity=False, genres=None, rng=random):
+        if genres:
+            picked = []
+            genre_ids = list(genres)
+            counts = {}
+            for genre_id in rng.choices(genre_ids, weights=[genres[g] for g in genre_ids], k=k):
+                counts[genre_id] = counts.get(genre_id, 0) + 1
+            for genre_id, count in counts.items():
+                genre_size = self._cached(
+                    ('genre', genre_id), lambda: SongGenre.objects.filter(genre_id=genre_id).count()
+                )
+                if not genre_size:
+                    continue
+                rows = self._random_rows(SongGenre, count, 'song_id', rng, {'genre_id': genre_id}, genre_size)
+                picked.extend(song_id for song_id in rows if song_id not in picked)
+            return picked[:k]
+        if popularity:
+            songs = self._table_stats(Song)
+            entries = self._table_stats(PlaylistSong)
+            song_count = songs[2] if songs else 0
+            entry_count = entries[2] if entries else 0
+            # Same mixture as the pool: weight 1 + number of playlists the song is in
+            from_entries = sum(
+                rng.randrange(song_count + entry_count) >= song_count for _ in range(k)
+            ) if song_count + entry_count else 0
+            picked = self._random_rows(PlaylistSong, from_entries, 'song_id', rng) if from_entries else []
+            for song_id in self._random_rows(Song, k, 'id', rng):
+                if len(picked) == k:
+                    break
+                if song_id not in picked:
+                    picked.append(song_id)
+            return picked
+        return self._random_rows(Song, k, 'id', rng)
+
+
+_sampler = None
+_built_at = 0.0
+_lock = threading.Lock()
+
+
+def loaded_sampler():
+    """The worker's pool if it has one, without building it (for signals)"""
+    return _sampler if isinstance(_sampler, PoolSampler) else None
+
+
+def get_sampler():
+    global _sampler, _built_at
+    with _lock:
+        if _sampler is None or time.monotonic() - _built_at > settings.SONG_SAMPLER_TTL:
+            if settings.SONG_SAMPLER_BACKEND == 'database':
+                _sampler = DatabaseSampler()
+            else:
+                _sampler = PoolSampler.build()
+            _built_at = time.monotonic()
+        return _sampler
+
+
+def reset():
+    global _sampler
+    _sampler = None
+
+
+def sample_song_ids(k, popularity=False, genres=None):
+    return get_sampler().sample(k, popularity=popularity, genres=genres)
@@ -0,0 +1,89 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from playlists.models import Playlist
+from songs.models import Song
+from . import embeddings, sampling
+
+
+@receiver(post_save, sender=Song)
+def song_saved(sender, instance, created, raw=False, **kwargs):
+    pool = sampling.loaded_sampler()
+    if pool is not None and created and not raw:
+        pool.add_song(instance.pk)
+
+
+@receiver(post_delete, sender=Song)
+def song_deleted(sender, instance, **kwargs):
+    pool = sampling.loaded_sampler()
+    if pool is not None:
+        pool.remove_song(instance.pk)
+
+
+@receiver(m2m_changed, sender=Song.genres.through)
+def song_genres_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    pool = sampling.loaded_sampler()
+    if pool is None:
+        return
+    if action == 'pre_clear':
+        related = instance.songs if reverse else instance.genres
+        instance._sampling_cleared_ids = list(related.values_list('id', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_sampling_cleared_ids', [])
+    elif action not in ('post_add', 'post_remove'):
+        return
+    update = pool.remove_genre if action in ('post_remove', 'post_clear') else pool.add_genre
+    for pk in pk_set:
+        # Forward: instance is a Song and pk_set holds genre ids; reverse is the other way round
+        if reverse:
+            update(pk, instance.pk)
+        else:
+            update(instance.pk, pk)
+
+
+@receiver(m2m_changed, sender=Playlist.songs.through)
+def playlist_songs_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    pool = sampling.loaded_sampler()
+    if pool is None:
+        return
+    if action == 'pre_clear':
+        related = instance.playlists if reverse else instance.songs
+        instance._sampling_cleared_ids = list(related.values_list('id', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_sampling_cleared_ids', [])
+    elif action not in ('post_add', 'post_remove'):
+        return
+    # One entry per membership: reverse changes add the song once per playlist
+    song_ids = [instance.pk] * len(pk_set) if reverse else list(pk_set)
+    if action == 'post_add':
+        pool.add_entries(song_ids)
+    else:
+        pool.remove_entries(song_ids)
+
+
+@receiver(pre_delete, sender=Playlist)
+def playlist_deleted(sender, instance, **kwargs):
+    # The cascade to the through table sends no m2m_changed
+    pool = sampling.loaded_sampler()
+    if pool is not None:
+        pool.remove_entries(list(instance.songs.values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=Song)
+def song_features_saved(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    # Of a song's own columns only the album is a feature; saves of other fields leave the vectors alone
+    if not raw and (created or update_fields is None or {'album', 'album_id'} & set(update_fields)):
+        embeddings.catalog_changed()
+
+
+# Chatbot recommendations are features too, but change with every chat turn: they
+# are picked up by the next rebuild rather than queueing one
+@receiver(post_delete, sender=Song)
+@receiver(m2m_changed, sender=Song.genres.through)
+@receiver(m2m_changed, sender=Song.artists.through)
+@receiver(m2m_changed, sender=Playlist.songs.through)
+def song_features_changed(sender, action=None, **kwargs):
+    if action is None or action in ('post_add', 'post_remove', 'post_clear'):
+        embeddings.catalog_changed()
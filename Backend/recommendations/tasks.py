@@ -0,0 +1,14 @@
+from jobs.queue import task
+from . import collaborative, embeddings
+
+
+@task(queue='catalog', concurrency=1)
+def build_song_embeddings():
+    index = embeddings.rebuild(save=True)
+    return {'songs': len(index), 'dim': index.dim, 'path': embeddings.index_path()}
+
+
+@task(queue='catalog', concurrency=1)
+def train_song_neighbors(top_n=50, shrinkage=10.0, min_cooccurrence=1):
+    written = collaborative.train(top_n=top_n, shrinkage=shrinkage, min_cooccurrence=min_cooccurrence)
+    return {'neighbors': written}
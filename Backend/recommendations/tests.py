@@ -0,0 +1,346 @@
+import json
+import os
+import random
+import tempfile
+from collections import Counter
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from chatbot.models import Conversation, Message
+from genres.models import Genre
+from jobs import queue
+from jobs.models import Job
+from playlists.models import Playlist
+from songs.tests import create_songs
+from . import collaborative, embeddings, sampling
+from .models import SongNeighbor
+
+
+class PoolSamplerTests(TestCase):
+    def test_samples_are_distinct_and_bounded(self):
+        pool = sampling.PoolSampler(range(1, 101), [1, 1, 2], {7: [3, 4]})
+        rng = random.Random(1)
+        for options in ({}, {'popularity': True}):
+            ids = pool.sample(5, rng=rng, **options)
+            self.assertEqual(len(set(ids)), 5)
+            self.assertTrue(all(1 <= song_id <= 100 for song_id in ids))
+        self.assertEqual(sorted(pool.sample(5, genres={7: 1}, rng=rng)), [3, 4])
+        self.assertEqual(len(sampling.PoolSampler(range(1, 4)).sample(5, popularity=True)), 3)
+
+    def test_popularity_weighting(self):
+        # Song 1 is in 50 playlists, the other 99 songs in none
+        pool = sampling.PoolSampler(range(1, 101), [1] * 50)
+        rng = random.Random(2)
+        hits = sum(1 in pool.sample(1, popularity=True, rng=rng) for _ in range(1000))
+        # Weight 51 of 150 vs 1 of 100 uniformly
+        self.assertGreater(hits, 250)
+
+    def test_removed_entries_are_never_drawn(self):
+        pool = sampling.PoolSampler(range(1, 4), [1, 1, 2, 3] * 10)
+        pool.remove_entries([1] * 20)
+        pool.remove_song(3)
+        rng = random.Random(6)
+        draws = [pool._draw(rng, True, None) for _ in range(500)]
+        self.assertNotIn(3, draws)
+        # Song 1 kept no entries: only its weight-1 id remains
+        self.assertLess(draws.count(1), draws.count(2) / 3)
+        # Stale entries were dropped as they were drawn
+        self.assertLess(len(pool.entries), 40)
+
+    def test_genre_weighting(self):
+        pool = sampling.PoolSampler(range(1, 7), genres={1: [1, 2, 3], 2: [4, 5, 6]})
+        rng = random.Random(3)
+        draws = [song_id for _ in range(500) for song_id in pool.sample(1, genres={1: 9, 2: 1}, rng=rng)]
+        self.assertGreater(sum(song_id <= 3 for song_id in draws), 400)
+
+
+class SamplerSignalTests(TestCase):
+    def setUp(self):
+        sampling.reset()
+        self.songs = create_songs(3)
+        self.pool = sampling.get_sampler()
+
+    def live_entries(self):
+        """The pool's entries minus those removed but not yet drawn"""
+        live = Counter(entry for entry in self.pool.entries if entry not in self.pool.deleted)
+        live.subtract(self.pool.removed_entries)
+        return sorted(live.elements())
+
+    def test_pool_follows_catalog_changes(self):
+        new_song, = create_songs(1, title='New')
+        self.assertIn(new_song.id, self.pool.ids)
+        jazz = Genre.objects.create(name='Jazz')
+        new_song.genres.add(jazz)
+        self.assertEqual(list(self.pool.genres[jazz.id]), [new_song.id])
+
+        playlist = Playlist.objects.create(user=User.objects.create_user('listener'), name='Mix')
+        playlist.add_songs([new_song.id, self.songs[0].id])
+        self.assertEqual(self.live_entries(), sorted([new_song.id, self.songs[0].id]))
+        playlist.songs.remove(self.songs[0])
+        self.assertEqual(self.live_entries(), [new_song.id])
+
+        new_song.delete()
+        self.assertNotIn(new_song.id, self.pool.ids)
+        self.assertEqual(self.live_entries(), [])
+        self.assertEqual(len(self.pool.genres[jazz.id]), 0)
+
+    def test_playlist_delete(self):
+        playlist = Playlist.objects.create(user=User.objects.create_user('listener'), name='Mix')
+        playlist.add_songs([song.id for song in self.songs])
+        playlist.delete()
+        self.assertEqual(self.live_entries(), [])
+
+
+@override_settings(SONG_SAMPLER_BACKEND='database')
+class DatabaseSamplerTests(TestCase):
+    def setUp(self):
+        sampling.reset()
+        self.songs = create_songs(20)
+        # Leave gaps in the id range
+        for song in self.songs[::3]:
+            song.delete()
+        self.existing = {song.id for song in self.songs} - {song.id for song in self.songs[::3]}
+
+    def test_samples_existing_songs(self):
+        sampler = sampling.get_sampler()
+        self.assertIsInstance(sampler, sampling.DatabaseSampler)
+        rng = random.Random(4)
+        for options in ({}, {'popularity': True}):
+            ids = sampler.sample(5, rng=rng, **options)
+            self.assertEqual(len(set(ids)), 5)
+            self.assertTrue(set(ids) <= self.existing)
+
+    def test_genre_sampling(self):
+        genre = Genre.objects.get(name='Pop')
+        ids = sampling.get_sampler().sample(5, genres={genre.id: 1}, rng=random.Random(5))
+        self.assertEqual(len(ids), 5)
+        self.assertTrue(set(ids) <= self.existing)
+
+
+class FallbackTests(TestCase):
+    def test_random_songs_query_count_does_not_grow(self):
+        from chatbot import services
+
+        sampling.reset()
+        create_songs(10)
+        sampling.get_sampler()
+        # Sampled ids, then the songs with their related rows
+        with self.assertNumQueries(3):
+            self.assertEqual(len(list(services.random_songs())), 5)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_song_sampling', sizes='1000', repeat=10, stdout=out)
+        self.assertIn('1000', out.getvalue())
+
+
+@override_settings(SONG_EMBEDDINGS_PATH=None, SONG_EMBEDDINGS_ANN_LISTS=0)
+class EmbeddingTests(TestCase):
+    def setUp(self):
+        embeddings.reset()
+        self.addCleanup(embeddings.reset)
+        self.rock = create_songs(4, title='Rock')
+        self.jazz = create_songs(4, title='Jazz')
+        # What the build_song_embeddings job does
+        embeddings.rebuild(save=False)
+
+    def test_songs_sharing_artist_and_album_are_closest(self):
+        similar = embeddings.similar_song_ids([self.rock[0].id], k=3)
+        self.assertEqual(set(similar), {song.id for song in self.rock[1:]})
+
+    def test_playlists_pull_songs_together(self):
+        index = embeddings.get_index()
+        playlist = Playlist.objects.create(user=User.objects.create_user('listener'), name='Mix')
+        playlist.add_songs([self.rock[0].id, self.jazz[0].id])
+        # The index keeps serving until the queued rebuild runs
+        self.assertIs(embeddings.get_index(), index)
+        embeddings.rebuild(save=False)
+        similar = embeddings.similar_song_ids([self.rock[0].id], k=4)
+        self.assertIn(self.jazz[0].id, similar)
+        self.assertEqual(similar.index(self.jazz[0].id), 3)
+
+    def test_saved_index_is_memory_mapped_and_ann_matches_exact(self):
+        exact = embeddings.EmbeddingIndex.build(lists=0)
+        ann = embeddings.EmbeddingIndex.build(lists=2)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'vectors.npy')
+            ann.save(path)
+            loaded = embeddings.EmbeddingIndex.load(path)
+            self.assertEqual(loaded.vectors.__class__.__name__, 'memmap')
+            with self.settings(SONG_EMBEDDINGS_ANN_PROBES=2):
+                self.assertEqual(loaded.similar([self.jazz[0].id], 3), exact.similar([self.jazz[0].id], 3))
+
+    def test_songs_missing_from_the_index_are_embedded_on_the_fly(self):
+        index = embeddings.get_index()
+        new_song = self.rock[0].album.songs.create(title='Rock Song 9')
+        new_song.artists.add(*self.rock[0].artists.all())
+        self.assertNotIn(new_song.id, index.ids)
+        similar = [song_id for song_id, _ in index.similar([new_song.id], 3)]
+        self.assertEqual(set(similar), {song.id for song in self.rock[:3]})
+
+    def test_similar_endpoint(self):
+        response = APIClient().get(f'/api/v1/songs/{self.jazz[0].id}/similar/?limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+        self.assertTrue({song['id'] for song in response.data} <= {song.id for song in self.jazz[1:]})
+        self.assertEqual(APIClient().get(f'/api/v1/songs/{self.jazz[0].id}/similar/?limit=x').status_code, 400)
+        self.assertEqual(APIClient().get(f'/api/v1/songs/{self.jazz[0].id}/similar/?limit=-1').status_code, 400)
+        self.assertEqual(APIClient().get('/api/v1/songs/999999/similar/').status_code, 404)
+
+    def test_build_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'vectors.npy')
+            with self.settings(SONG_EMBEDDINGS_PATH=path):
+                out = StringIO()
+                call_command('build_song_embeddings', stdout=out)
+                self.assertIn('Embedded 8 songs', out.getvalue())
+                embeddings.reset()
+                # Other workers map the saved file
+                self.assertEqual(embeddings.get_index().vectors.__class__.__name__, 'memmap')
+                embeddings.reset()
+
+    @override_settings(CHATBOT_LLM_BACKEND='local', CHATBOT_LOCAL_LLM_LATENCY=0)
+    def test_chatbot_songs_like_request(self):
+        from chatbot import intent_cache
+
+        intent_cache.reset()
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('listener'))
+        extraction = json.dumps({'title': 'Jazz Song 0', 'artist_name': None, 'album_title': None, 'genre': None})
+        with mock.patch('chatbot.llm.LocalLLMProvider.reply', side_effect=[extraction, 'Try these!']):
+            response = client.post('/api/v1/chatbot/chat/', {'message': 'find me songs like Jazz Song 0'}, format='json')
+        ids = {song['id'] for song in response.data['songs']}
+        self.assertNotIn(self.jazz[0].id, ids)
+        self.assertTrue({song.id for song in self.jazz[1:]} <= ids)
+
+
+@override_settings(SONG_EMBEDDINGS_PATH=None, JOBS_MODE='worker', SONG_EMBEDDINGS_REBUILD_DELAY=300)
+class EmbeddingRebuildTests(TestCase):
+    def setUp(self):
+        self.addCleanup(embeddings.reset)
+        self.songs = create_songs(3)
+        # Creating them scheduled a rebuild whose on_commit never runs in a test
+        embeddings.reset()
+
+    def build_jobs(self):
+        return Job.objects.filter(task='recommendations.build_song_embeddings')
+
+    def test_requests_never_build(self):
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(0):
+            self.assertEqual(embeddings.similar_song_ids([self.songs[0].id]), [])
+        # A build is queued instead, to run now
+        job = self.build_jobs().get()
+        self.assertLessEqual(job.run_at, timezone.now())
+        queue.Worker(queues=['catalog']).run(once=True)
+        self.assertEqual(len(embeddings.similar_song_ids([self.songs[0].id])), 2)
+
+    def test_catalog_changes_queue_one_delayed_rebuild(self):
+        embeddings.rebuild(save=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            more = create_songs(2, title='More')
+            more[0].genres.clear()
+        self.assertEqual(self.build_jobs().count(), 1)
+        self.assertGreater(self.build_jobs().get().run_at, timezone.now() + timedelta(seconds=200))
+
+    def test_rolled_back_changes_do_not_hold_back_later_ones(self):
+        with transaction.atomic():
+            create_songs(1, title='Rolled Back')
+            transaction.set_rollback(True)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_songs(1, title='Kept')
+        self.assertEqual(self.build_jobs().count(), 1)
+
+    def test_chat_recommendations_and_other_fields_leave_the_index(self):
+        index = embeddings.rebuild(save=False)
+        message = Message.objects.create(
+            conversation=Conversation.objects.create(user=User.objects.create_user('listener')),
+            role='assistant', content='Try these',
+        )
+        song = self.songs[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            message.recommended_songs.add(song)
+            song.renditions = [{'name': '64k'}]
+            song.save(update_fields=['renditions'])
+        self.assertFalse(self.build_jobs().exists())
+        self.assertIs(embeddings.get_index(), index)
+
+
+class CollaborativeTests(TestCase):
+    def setUp(self):
+        embeddings.reset()
+        self.addCleanup(embeddings.reset)
+        self.user = User.objects.create_user('listener')
+        self.a, self.b, self.c, self.d, self.e = create_songs(5, title='Mix')
+        for songs in ([self.a, self.b, self.c], [self.a, self.b], [self.a, self.d]):
+            Playlist.objects.create(user=self.user, name='Mix').add_songs([song.id for song in songs])
+        embeddings.rebuild(save=False)
+
+    def neighbors(self, song):
+        return list(SongNeighbor.objects.filter(song=song).order_by('rank').values_list('neighbor_id', 'score'))
+
+    def test_cosine_scores_and_ranks(self):
+        self.assertEqual(collaborative.train(shrinkage=0), 8)
+        (first, first_score), (second, second_score), (third, third_score) = self.neighbors(self.a)
+        self.assertEqual([first, second, third], [self.b.id, self.c.id, self.d.id])
+        self.assertAlmostEqual(first_score, 2 / 6 ** 0.5, places=5)
+        self.assertAlmostEqual(second_score, 1 / 3 ** 0.5, places=5)
+        self.assertEqual(second_score, third_score)
+        # Never in a playlist, so no neighbours either way
+        self.assertEqual(self.neighbors(self.e), [])
+        self.assertFalse(SongNeighbor.objects.filter(neighbor=self.e).exists())
+
+    def test_shrinkage_and_thresholds(self):
+        collaborative.train(shrinkage=10)
+        scores = dict(self.neighbors(self.a))
+        self.assertAlmostEqual(scores[self.b.id], 2 / 6 ** 0.5 * 2 / 12, places=5)
+        self.assertAlmostEqual(scores[self.c.id], 1 / 3 ** 0.5 / 11, places=5)
+
+        collaborative.train(top_n=1, min_cooccurrence=2)
+        self.assertEqual([song_id for song_id, _ in self.neighbors(self.a)], [self.b.id])
+        self.assertEqual(SongNeighbor.objects.count(), 2)
+
+    def test_continuation_excludes_the_playlist(self):
+        collaborative.train(shrinkage=0)
+        self.assertEqual(collaborative.continuation_ids([self.b.id, self.c.id], 5), [self.a.id])
+        self.assertEqual(collaborative.continuation_ids([self.a.id], 2), [self.b.id, self.c.id])
+
+    def test_recommendations_endpoint(self):
+        collaborative.train()
+        client = APIClient()
+        # Song lookup, neighbour ids, then the neighbours with their relations prefetched
+        with self.assertNumQueries(7):
+            response = client.get(f'/api/v1/songs/{self.a.id}/recommendations/?limit=2')
+        self.assertEqual([song['id'] for song in response.data], [self.b.id, self.c.id])
+        # No co-occurrence data: falls back to content similarity
+        response = client.get(f'/api/v1/songs/{self.e.id}/recommendations/?limit=2')
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(client.get(f'/api/v1/songs/{self.a.id}/recommendations/?limit=x').status_code, 400)
+        self.assertEqual(client.get(f'/api/v1/songs/{self.a.id}/recommendations/?limit=-1').status_code, 400)
+        self.assertEqual(client.get(f'/api/v1/songs/{self.a.id}/recommendations/?limit=0').status_code, 400)
+
+    def test_continue_endpoint(self):
+        collaborative.train()
+        playlist = Playlist.objects.create(user=self.user, name='Start')
+        playlist.add_songs([self.b.id])
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(f'/api/v1/playlists/{playlist.id}/continue/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([song['id'] for song in response.data], [self.a.id, self.c.id])
+        self.assertEqual(client.get(f'/api/v1/playlists/{playlist.id}/continue/?limit=-1').status_code, 400)
+
+        client.force_authenticate(User.objects.create_user('other'))
+        self.assertEqual(client.get(f'/api/v1/playlists/{playlist.id}/continue/').status_code, 404)
+
+    def test_train_command(self):
+        out = StringIO()
+        call_command('train_song_neighbors', '--top-n', '1', stdout=out)
+        self.assertIn('Wrote 4 song neighbours', out.getvalue())
@@ -0,0 +1,65 @@
+from django.conf import settings
+from rest_framework import status
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+def query_limit(request, default, maximum):
+    """
+    The ``limit`` query param, capped at ``maximum``, as (limit, None); or
+    (None, a 400 response) when it is not a positive integer.
+    """
+    try:
+        limit = int(request.query_params.get('limit', default))
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return None, Response(
+            {"error": "'limit' must be a positive integer."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return min(limit, maximum), None
+
+
+class CatalogCursorPagination(CursorPagination):
+    """Keyset pagination on the primary key so deep pages cost the same as the first one."""
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 200)
+
+
+class ConversationCursorPagination(CatalogCursorPagination):
+    ordering = ('-updated_at', '-id')
+
+
+class MessageCursorPagination(CatalogCursorPagination):
+    """Newest messages first; the next pages go back in time"""
+    ordering = ('-timestamp', '-id')
+
+
+class NewMessageCursorPagination(CatalogCursorPagination):
+    """Oldest first, for fetching the messages after one the client already has"""
+    ordering = ('timestamp', 'id')
+
+
+class JobCursorPagination(CatalogCursorPagination):
+    """Most recently created jobs first"""
+    ordering = ('-created_at', '-id')
+
+
+class PlaylistSongCursorPagination(CatalogCursorPagination):
+    ordering = ('position', 'id')
+
+
+class PaginatedActionMixin:
+    """Paginate the querysets returned by custom list-style @action endpoints."""
+
+    def paginated_response(self, queryset, serializer_class=None):
+        serializer_class = serializer_class or self.get_serializer_class()
+        context = self.get_serializer_context()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = serializer_class(page, many=True, context=context)
+            return self.get_paginated_response(serializer.data)
+        serializer = serializer_class(queryset, many=True, context=context)
+        return Response(serializer.data)
@@ -0,0 +1,70 @@
+"""
+EXPLAIN every query a code path runs and report full table scans.
+
+On PostgreSQL plans are taken with enable_seqscan off, which makes the planner
+pick any index that can serve a query, so a "Seq Scan" left in the plan means
+no usable index exists, whatever the size of the test data. On SQLite a bare
+"SCAN <table>" in EXPLAIN QUERY PLAN is a full scan ("SCAN ... USING INDEX" is
+an ordered index walk, stopped by LIMIT), except in an unfiltered query with a
+LIMIT and no sort step: that walks the table in primary key order and stops
+early, like the first page of a keyset-paginated list. Other backends are not
+supported.
+"""
+import json
+import re
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+SUPPORTED_VENDORS = ('postgresql', 'sqlite')
+
+_SQLITE_SCAN = re.compile(r'^SCAN (\w+)$')
+_SQLITE_FIRST_PAGE = re.compile(r'\bLIMIT \d+$')
+# Transaction control and session statements have no plan
+_EXPLAINABLE = re.compile(r'^\s*(SELECT|WITH|UPDATE|DELETE|INSERT)\b', re.IGNORECASE)
+
+
+def explain(sql):
+    """(plan text, tables read with a full scan) for one query"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            with transaction.atomic():
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                plan = cursor.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            return json.dumps(plan, indent=2), sorted(set(_seq_scans(plan[0]['Plan'])))
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        details = [row[-1] for row in cursor.fetchall()]
+    plan = '\n'.join(details)
+    if _SQLITE_FIRST_PAGE.search(sql) and not re.search(r'\bWHERE\b', sql) and 'TEMP B-TREE' not in plan:
+        return plan, []
+    tables = set(connection.introspection.table_names())
+    scans = {match.group(1) for match in map(_SQLITE_SCAN.match, details) if match and match.group(1) in tables}
+    return plan, sorted(scans)
+
+
+def _seq_scans(node):
+    if node.get('Node Type') == 'Seq Scan':
+        yield node['Relation Name']
+    for child in node.get('Plans', []):
+        yield from _seq_scans(child)
+
+
+def audit(func, allow=()):
+    """
+    Run ``func`` and EXPLAIN each query it issued. Returns a list of
+    {'sql', 'plan', 'scans'} for the queries that fully scan a table not in ``allow``.
+    """
+    with CaptureQueriesContext(connection) as context:
+        func()
+    problems = []
+    for query in context.captured_queries:
+        sql = query['sql']
+        if not _EXPLAINABLE.match(sql):
+            continue
+        plan, scans = explain(sql)
+        scans = [table for table in scans if table not in allow]
+        if scans:
+            problems.append({'sql': sql, 'plan': plan, 'scans': scans})
+    return problems
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'allauth',
     'allauth.account',
     'allauth.socialaccount',
@@ -58,6 +59,13 @@ INSTALLED_APPS = [
     'playlists',
     'genres',
     'chatbot',
+    'search',
+    'caching',
+    'recommendations',
+    'instrumentation',
+    'benchmarks',
+    'jobs',
+    'streaming',
 ]
 
 SITE_ID = 2  # Make sure this is set
@@ -68,6 +76,7 @@ AUTHENTICATION_BACKENDS = [
 ]
 
 MIDDLEWARE = [
+    'instrumentation.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -153,6 +162,139 @@ DATABASES = {
 }
 
 
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'root.pagination.CatalogCursorPagination',
+    'PAGE_SIZE': int(os.getenv('API_PAGE_SIZE', 50)),
+}
+
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', 200))
+
+# Response cache for catalog reads (see caching/decorators.py). Any Django cache
+# backend works; e.g. CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# with CACHE_LOCATION=/var/tmp/spotifai_cache shares entries between workers.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'spotifai'),
+    }
+}
+
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+
+# Chatbot LLM backend: 'gemini', or 'local' for an offline stand-in with fixed latency
+CHATBOT_LLM_BACKEND = os.getenv('CHATBOT_LLM_BACKEND', 'gemini')
+CHATBOT_LLM_MODEL = os.getenv('CHATBOT_LLM_MODEL', 'gemini-2.0-flash')
+# Deterministic offline provider (CHATBOT_LLM_BACKEND=local)
+CHATBOT_LOCAL_LLM_LATENCY = float(os.getenv('CHATBOT_LOCAL_LLM_LATENCY', 0.5))
+CHATBOT_LOCAL_LLM_TOKEN_LATENCY = float(os.getenv('CHATBOT_LOCAL_LLM_TOKEN_LATENCY', 0.02))
+CHATBOT_LOCAL_LLM_RULES = os.getenv('CHATBOT_LOCAL_LLM_RULES')
+# Outbound LLM call governor (see chatbot/governor.py); every limit is per process.
+# 0 turns off the concurrency cap, the rate limit and the timeouts.
+CHATBOT_LLM_MAX_CONCURRENCY = int(os.getenv('CHATBOT_LLM_MAX_CONCURRENCY', 8))
+CHATBOT_LLM_RATE = float(os.getenv('CHATBOT_LLM_RATE', 0))  # calls per second
+CHATBOT_LLM_BURST = int(os.getenv('CHATBOT_LLM_BURST', 10))
+CHATBOT_LLM_TIMEOUT = float(os.getenv('CHATBOT_LLM_TIMEOUT', 30))  # seconds per call
+# Seconds for all the LLM calls of a chat turn before it degrades to a catalog-only reply
+CHATBOT_REPLY_DEADLINE = float(os.getenv('CHATBOT_REPLY_DEADLINE', 45))
+CHATBOT_LLM_COALESCE = os.getenv('CHATBOT_LLM_COALESCE', 'True').lower() == 'true'
+# Random song sampling: 'pool' keeps song ids in memory per worker, 'database' samples id ranges
+SONG_SAMPLER_BACKEND = os.getenv('SONG_SAMPLER_BACKEND', 'pool')
+SONG_SAMPLER_TTL = int(os.getenv('SONG_SAMPLER_TTL', 3600))
+# Weight the "nothing matched" fallback towards songs that are in more playlists
+CHATBOT_FALLBACK_POPULARITY = os.getenv('CHATBOT_FALLBACK_POPULARITY', 'True').lower() == 'true'
+
+# Song similarity vectors (python manage.py build_song_embeddings); ANN lists 0 means exact search
+SONG_EMBEDDINGS_PATH = os.getenv('SONG_EMBEDDINGS_PATH', str(BASE_DIR / 'song_vectors.npy'))
+SONG_EMBEDDINGS_DIM = int(os.getenv('SONG_EMBEDDINGS_DIM', 128))
+SONG_EMBEDDINGS_ANN_LISTS = int(os.getenv('SONG_EMBEDDINGS_ANN_LISTS', 0))
+SONG_EMBEDDINGS_ANN_PROBES = int(os.getenv('SONG_EMBEDDINGS_ANN_PROBES', 8))
+# Catalog edits queue a build_song_embeddings job this many seconds later (one per burst of edits)
+SONG_EMBEDDINGS_REBUILD_DELAY = int(os.getenv('SONG_EMBEDDINGS_REBUILD_DELAY', 300))
+
+# Catalog phrase matcher that fills search params without an LLM call when it can
+CHATBOT_LOCAL_EXTRACTOR = os.getenv('CHATBOT_LOCAL_EXTRACTOR', 'True').lower() == 'true'
+CHATBOT_LOCAL_EXTRACTOR_TTL = int(os.getenv('CHATBOT_LOCAL_EXTRACTOR_TTL', 300))
+# Extraction/keyword answers cached per normalized request; size 0 disables.
+# CHATBOT_INTENT_CACHE_ALIAS names a CACHES entry to also persist them in.
+CHATBOT_INTENT_CACHE_SIZE = int(os.getenv('CHATBOT_INTENT_CACHE_SIZE', 1024))
+CHATBOT_INTENT_CACHE_TTL = int(os.getenv('CHATBOT_INTENT_CACHE_TTL', 24 * 60 * 60))
+CHATBOT_INTENT_CACHE_ALIAS = os.getenv('CHATBOT_INTENT_CACHE_ALIAS') or None
+CHATBOT_SPECULATIVE_KEYWORDS = os.getenv('CHATBOT_SPECULATIVE_KEYWORDS', 'False').lower() == 'true'
+# Conversation turns send a summary of older messages plus the recent ones that fit in
+# CHATBOT_CONTEXT_TOKENS (see chatbot/context.py). The summarizer is 'llm' or 'extractive'.
+CHATBOT_CONTEXT_TOKENS = int(os.getenv('CHATBOT_CONTEXT_TOKENS', 3000))
+CHATBOT_CONTEXT_MAX_MESSAGES = int(os.getenv('CHATBOT_CONTEXT_MAX_MESSAGES', 50))
+CHATBOT_SUMMARY_TOKENS = int(os.getenv('CHATBOT_SUMMARY_TOKENS', 400))
+CHATBOT_CONTEXT_SUMMARIZER = os.getenv('CHATBOT_CONTEXT_SUMMARIZER', 'llm')
+# Background replies (chat with background=true) generated at once, across all workers
+CHATBOT_JOB_CONCURRENCY = int(os.getenv('CHATBOT_JOB_CONCURRENCY', 4))
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+
+# In-process inverted index for catalog lookups (see search/memindex.py)
+SEARCH_MEMORY_INDEX = os.getenv('SEARCH_MEMORY_INDEX', 'False').lower() == 'true'
+SEARCH_INDEX_SNAPSHOT = os.getenv('SEARCH_INDEX_SNAPSHOT', str(BASE_DIR / 'search_index.snapshot'))
+SEARCH_MEMORY_INDEX_MAX_IDS = int(os.getenv('SEARCH_MEMORY_INDEX_MAX_IDS', 5000))
+
+# Per-request SQL/serializer/LLM timings (see instrumentation/recorder.py)
+INSTRUMENTATION_ENABLED = os.getenv('INSTRUMENTATION_ENABLED', 'True').lower() == 'true'
+INSTRUMENTATION_SAMPLES = int(os.getenv('INSTRUMENTATION_SAMPLES', 1000))
+INSTRUMENTATION_SERVER_TIMING = os.getenv('INSTRUMENTATION_SERVER_TIMING', 'True').lower() == 'true'
+
+# Database-backed job queue (see jobs/queue.py). JOBS_MODE is 'thread' (a pool
+# in each web process), 'worker' (only `manage.py run_jobs`) or 'sync' (inline)
+JOBS_MODE = os.getenv('JOBS_MODE', 'thread')
+JOBS_THREADS = int(os.getenv('JOBS_THREADS', 4))
+JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', 1.0))
+# Running jobs without a heartbeat (sent every JOBS_LOCK_TIMEOUT / 4 seconds) for
+# this many seconds are assumed lost and requeued
+JOBS_LOCK_TIMEOUT = int(os.getenv('JOBS_LOCK_TIMEOUT', 600))
+JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', 3))
+# Seconds before the first retry; doubled for each later one
+JOBS_RETRY_DELAY = float(os.getenv('JOBS_RETRY_DELAY', 10))
+
+# Audio files behind /songs/{id}/stream/ (see streaming/storage.py). The backend is
+# 'local' (files under AUDIO_STORAGE_ROOT), 's3' (any S3-compatible bucket) or a dotted path.
+# 's3' needs boto3, which is not in requirements.txt: pip install boto3 where it is used.
+AUDIO_STORAGE_BACKEND = os.getenv('AUDIO_STORAGE_BACKEND', 'local')
+AUDIO_STORAGE_ROOT = os.getenv('AUDIO_STORAGE_ROOT', str(BASE_DIR / 'media' / 'audio'))
+AUDIO_S3_BUCKET = os.getenv('AUDIO_S3_BUCKET', '')
+AUDIO_S3_PREFIX = os.getenv('AUDIO_S3_PREFIX', 'audio')
+AUDIO_S3_ENDPOINT_URL = os.getenv('AUDIO_S3_ENDPOINT_URL') or None
+AUDIO_S3_REGION = os.getenv('AUDIO_S3_REGION') or None
+# '' serves the bytes from Django; 'accel' (nginx X-Accel-Redirect), 'sendfile'
+# (X-Sendfile) or 'redirect' (signed storage URL) hand them to something faster
+AUDIO_STREAM_OFFLOAD = os.getenv('AUDIO_STREAM_OFFLOAD', '')
+AUDIO_ACCEL_PREFIX = os.getenv('AUDIO_ACCEL_PREFIX', '/protected-audio/')
+AUDIO_STREAM_MAX_AGE = int(os.getenv('AUDIO_STREAM_MAX_AGE', 24 * 60 * 60))
+AUDIO_URL_EXPIRY = int(os.getenv('AUDIO_URL_EXPIRY', 3600))  # seconds a signed URL stays valid
+# HLS packaging (python manage.py package_hls, see streaming/hls.py): AAC bitrates in
+# kbit/s, each cut into segments of AUDIO_HLS_SEGMENT_SECONDS
+FFMPEG_BINARY = os.getenv('FFMPEG_BINARY', 'ffmpeg')
+AUDIO_HLS_BITRATES = os.getenv('AUDIO_HLS_BITRATES', '64,128,256')
+AUDIO_HLS_SEGMENT_SECONDS = int(os.getenv('AUDIO_HLS_SEGMENT_SECONDS', 6))
+AUDIO_HLS_TIMEOUT = int(os.getenv('AUDIO_HLS_TIMEOUT', 600))  # seconds per ffmpeg run
+AUDIO_HLS_JOB_CONCURRENCY = int(os.getenv('AUDIO_HLS_JOB_CONCURRENCY', 2))
+# Segments and media playlists never change under a URL; the master playlist does
+AUDIO_HLS_SEGMENT_MAX_AGE = int(os.getenv('AUDIO_HLS_SEGMENT_MAX_AGE', 365 * 24 * 60 * 60))
+AUDIO_HLS_PLAYLIST_MAX_AGE = int(os.getenv('AUDIO_HLS_PLAYLIST_MAX_AGE', 60))
+# Seconds a replaced ladder stays available to players that started on it
+AUDIO_HLS_RETIRE_DELAY = int(os.getenv('AUDIO_HLS_RETIRE_DELAY', 24 * 60 * 60))
+
+# The per-request JSON lines go to the 'instrumentation.requests' logger at INFO
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'instrumentation': {'handlers': ['console'], 'level': os.getenv('INSTRUMENTATION_LOG_LEVEL', 'WARNING')},
+        'chatbot': {'handlers': ['console'], 'level': os.getenv('CHATBOT_LOG_LEVEL', 'INFO')},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
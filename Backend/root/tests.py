@@ -0,0 +1,100 @@
+import os
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from albums.models import Album
+from chatbot import services
+from chatbot.models import Conversation, Message
+from playlists.models import Playlist
+from recommendations import collaborative
+from songs.importer import CatalogImporter
+from songs.models import Song
+from . import query_plans
+
+SEED_SONGS = int(os.getenv('QUERY_PLAN_SEED_SONGS', 2000))
+
+
+@skipUnless(connection.vendor in query_plans.SUPPORTED_VENDORS, 'EXPLAIN parsing is backend specific')
+class QueryPlanTests(TestCase):
+    """Every hot path must be served by indexes; fails with the offending plan otherwise"""
+
+    @classmethod
+    def setUpTestData(cls):
+        CatalogImporter().run(
+            {
+                'title': f'Track {i}',
+                'artists': f'Artist {i % 200}',
+                'album': f'Album {i // 10}',
+                'release_date': f'{1960 + i % 60}',
+                'genres': f'Genre {i % 12};Genre {i % 5}',
+            }
+            for i in range(SEED_SONGS)
+        )
+        cls.user = User.objects.create_user('listener')
+        song_ids = list(Song.objects.order_by('id').values_list('id', flat=True))
+        for i in range(20):
+            playlist = Playlist.objects.create(user=User.objects.create_user(f'user{i}'), name=f'Mix {i}')
+            playlist.add_songs(song_ids[i * 40:i * 40 + 60])
+        cls.playlist = Playlist.objects.create(user=cls.user, name='Mine')
+        cls.playlist.add_songs(song_ids[:100])
+        collaborative.train()
+        for i in range(30):
+            conversation = Conversation.objects.create(user=cls.user if i % 3 == 0 else User.objects.get(username=f'user{i % 20}'))
+            for j in range(10):
+                message = Message.objects.create(conversation=conversation, role='assistant' if j % 2 else 'user', content='hi')
+                if j % 2:
+                    message.recommended_songs.add(*song_ids[j:j + 3])
+        cls.conversation = Conversation.objects.filter(user=cls.user).first()
+        cls.song_id = song_ids[5]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertIndexed(self, func, allow=()):
+        problems = query_plans.audit(func, allow)
+        self.assertFalse(problems, '\n\n'.join(
+            f"Full scan of {', '.join(problem['scans'])}:\n{problem['sql']}\n{problem['plan']}" for problem in problems
+        ))
+
+    def get(self, url):
+        return lambda: self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_conversations(self):
+        self.assertIndexed(self.get('/api/v1/chatbot/'))
+        self.assertIndexed(self.get(f'/api/v1/chatbot/{self.conversation.id}/'))
+        messages = f'/api/v1/chatbot/{self.conversation.id}/messages/'
+        self.assertIndexed(self.get(f'{messages}?page_size=3'))
+        self.assertIndexed(self.get(f'{messages}?since={self.conversation.messages.first().id}'))
+        # The chat context's tail of recent messages
+        self.assertIndexed(lambda: list(self.conversation.messages.order_by('-timestamp', '-id')[:50]))
+
+    def test_playlists(self):
+        self.assertIndexed(self.get('/api/v1/playlists/'))
+        self.assertIndexed(self.get(f'/api/v1/playlists/{self.playlist.id}/'))
+        self.assertIndexed(self.get(f'/api/v1/playlists/{self.playlist.id}/songs/'))
+
+    def test_catalog(self):
+        self.assertIndexed(self.get('/api/v1/songs/'))
+        self.assertIndexed(self.get(f'/api/v1/songs/{self.song_id}/'))
+        self.assertIndexed(self.get(f'/api/v1/songs/{self.song_id}/recommendations/'))
+        self.assertIndexed(lambda: list(Album.objects.order_by('-release_date', '-id')[:50]))
+
+    def test_audit_reports_full_scans(self):
+        problems = query_plans.audit(lambda: list(Message.objects.filter(content='hi')[:5]))
+        self.assertEqual([problem['scans'] for problem in problems], [['chatbot_message']])
+        self.assertFalse(query_plans.audit(lambda: list(Message.objects.filter(content='hi')[:5]), allow=['chatbot_message']))
+
+    @skipUnless(connection.vendor == 'postgresql', 'SQLite cannot index case-insensitive LIKE')
+    def test_title_lookups(self):
+        # Exact title, then every word of the title
+        self.assertIndexed(lambda: list(services.find_songs({'title': 'track 42'})))
+        self.assertIndexed(lambda: list(services.find_songs({'title': 'trac 4'})))
+        self.assertIndexed(self.get('/api/v1/search/?q=track'))
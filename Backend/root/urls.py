@@ -14,6 +14,11 @@ api_v1_patterns = [
     path('', include('playlists.urls')),
     path('', include('genres.urls')),
     path('', include('chatbot.urls')),
+    path('', include('search.urls')),
+    path('', include('caching.urls')),
+    path('', include('instrumentation.urls')),
+    path('', include('jobs.urls')),
+    path('', include('streaming.urls')),
 ]
 
 schema_view = get_schema_view(
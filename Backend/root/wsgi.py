@@ -9,8 +9,21 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'root.settings')
 
 application = get_wsgi_application()
+
+if settings.JOBS_MODE == 'thread':
+    from jobs import queue
+
+    # Delayed, retried and leftover jobs run without waiting for the next enqueue
+    queue.start()
+
+if settings.CHATBOT_LOCAL_EXTRACTOR:
+    from chatbot import entities
+
+    # Built before the first chat request needs it
+    entities.warm()
@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+
+
+class SearchConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'search'
+
+    def ready(self):
+        from . import memindex, signals  # noqa: F401
+
+        if memindex.enabled():
+            # Only maps the snapshot file; it is checked against the catalog on first use
+            memindex.load_snapshot()
@@ -0,0 +1,221 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from albums.models import Album
+from artists.models import Artist
+from songs.models import Song
+from . import memindex
+from .documents import tokenize
+from .models import SongDocument
+
+
+class BaseSearchBackend:
+    def filter_songs(self, queryset, query):
+        raise NotImplementedError
+
+    def rank_songs(self, queryset, query):
+        raise NotImplementedError
+
+    def filter_albums(self, queryset, query):
+        raise NotImplementedError
+
+    def filter_artists(self, queryset, query):
+        raise NotImplementedError
+
+    def rank_albums(self, queryset, query):
+        raise NotImplementedError
+
+    def rank_artists(self, queryset, query):
+        raise NotImplementedError
+
+    def filter_songs_by_fields(self, queryset, **fields):
+        """Songs whose title/artists/album/genres each match the given text"""
+        condition = Q()
+        for field, value in fields.items():
+            for token in tokenize(value):
+                condition &= Q(**{f'search_document__{field}__contains': token})
+        return queryset.filter(condition)
+
+    def update_vectors(self, song_ids):
+        pass
+
+    def search_songs(self, query, limit):
+        songs = self.filter_songs(Song.objects.with_related(), query)
+        return self.rank_songs(songs, query)[:limit]
+
+    def search_albums(self, query, limit):
+        albums = self.filter_albums(Album.objects.with_related(), query)
+        return self.rank_albums(albums, query)[:limit]
+
+    def search_artists(self, query, limit):
+        artists = self.filter_artists(Artist.objects.all(), query)
+        return self.rank_artists(artists, query)[:limit]
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """tsvector prefix matching with trigram word similarity for typos, both GIN indexed."""
+    config = 'simple'
+    weights = {'title': 'A', 'artists': 'B', 'album': 'C', 'genres': 'D'}
+
+    def _tsquery(self, tokens):
+        # Tokens are \w-only after normalization, so they are safe inside a raw tsquery
+        return SearchQuery(' & '.join(f'{token}:*' for token in tokens), search_type='raw', config=self.config)
+
+    def filter_songs(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+        return queryset.filter(
+            Q(search_document__search_vector=self._tsquery(tokens))
+            | Q(search_document__document__trigram_word_similar=' '.join(tokens))
+        )
+
+    def rank_songs(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset
+        rank = (
+            SearchRank(F('search_document__search_vector'), self._tsquery(tokens))
+            + TrigramWordSimilarity(' '.join(tokens), 'search_document__document')
+        )
+        return queryset.annotate(rank=rank).order_by('-rank', 'id')
+
+    def filter_songs_by_fields(self, queryset, **fields):
+        # Field restriction through the tsvector weight labels set in update_vectors
+        terms = [
+            f'{token}:*{self.weights[field]}'
+            for field, value in fields.items()
+            for token in tokenize(value)
+        ]
+        if not terms:
+            return queryset
+        query = SearchQuery(' & '.join(terms), search_type='raw', config=self.config)
+        return queryset.filter(search_document__search_vector=query)
+
+    def filter_albums(self, queryset, query):
+        return queryset.filter(title__trigram_word_similar=query)
+
+    def filter_artists(self, queryset, query):
+        return queryset.filter(name__trigram_word_similar=query)
+
+    def rank_albums(self, queryset, query):
+        return queryset.annotate(rank=TrigramWordSimilarity(query, 'title')).order_by('-rank', 'id')
+
+    def rank_artists(self, queryset, query):
+        return queryset.annotate(rank=TrigramWordSimilarity(query, 'name')).order_by('-rank', 'id')
+
+    def update_vectors(self, song_ids):
+        SongDocument.objects.filter(song_id__in=song_ids).update(
+            search_vector=(
+                SearchVector('title', weight=self.weights['title'], config=self.config)
+                + SearchVector('artists', weight=self.weights['artists'], config=self.config)
+                + SearchVector('album', weight=self.weights['album'], config=self.config)
+                + SearchVector('genres', weight=self.weights['genres'], config=self.config)
+            )
+        )
+
+
+class BasicSearchBackend(BaseSearchBackend):
+    """Portable fallback (SQLite, tests): token-prefix matching on the normalized document."""
+
+    def filter_songs(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+        condition = Q()
+        for token in tokens:
+            condition &= Q(search_document__document__contains=' ' + token)
+        return queryset.filter(condition)
+
+    def rank_songs(self, queryset, query):
+        text = ' '.join(tokenize(query))
+        rank = Case(
+            When(search_document__title=text, then=Value(3)),
+            When(search_document__title__startswith=text, then=Value(2)),
+            When(search_document__title__contains=text, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        return queryset.annotate(rank=rank).order_by('-rank', 'id')
+
+    def _filter_words(self, queryset, field, query):
+        condition = Q()
+        for token in query.split():
+            condition &= Q(**{f'{field}__icontains': token})
+        return queryset.filter(condition)
+
+    def _rank_words(self, queryset, field, query):
+        rank = Case(
+            When(**{f'{field}__iexact': query}, then=Value(2)),
+            When(**{f'{field}__istartswith': query}, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        return queryset.annotate(rank=rank).order_by('-rank', 'id')
+
+    def filter_albums(self, queryset, query):
+        return self._filter_words(queryset, 'title', query)
+
+    def filter_artists(self, queryset, query):
+        return self._filter_words(queryset, 'name', query)
+
+    def rank_albums(self, queryset, query):
+        return self._rank_words(queryset, 'title', query)
+
+    def rank_artists(self, queryset, query):
+        return self._rank_words(queryset, 'name', query)
+
+
+class MemoryIndexBackend(BaseSearchBackend):
+    """Resolves matches from the worker's in-memory index, then fetches rows by primary key.
+
+    Ranking and vector maintenance stay with the database backend it wraps.
+    """
+
+    def __init__(self, database_backend):
+        self.database_backend = database_backend
+
+    def _limit(self, ids):
+        return ids[:getattr(settings, 'SEARCH_MEMORY_INDEX_MAX_IDS', 5000)]
+
+    def filter_songs(self, queryset, query):
+        return queryset.filter(id__in=self._limit(memindex.get_index().search_songs(query)))
+
+    def filter_songs_by_fields(self, queryset, **fields):
+        if not fields:
+            return queryset
+        ids = memindex.get_index().search_songs_by_fields(**fields)
+        return queryset.filter(id__in=self._limit(ids))
+
+    def filter_albums(self, queryset, query):
+        return queryset.filter(id__in=self._limit(memindex.get_index().search_albums(query)))
+
+    def filter_artists(self, queryset, query):
+        return queryset.filter(id__in=self._limit(memindex.get_index().search_artists(query)))
+
+    def rank_songs(self, queryset, query):
+        return self.database_backend.rank_songs(queryset, query)
+
+    def rank_albums(self, queryset, query):
+        return self.database_backend.rank_albums(queryset, query)
+
+    def rank_artists(self, queryset, query):
+        return self.database_backend.rank_artists(queryset, query)
+
+    def update_vectors(self, song_ids):
+        self.database_backend.update_vectors(song_ids)
+
+
+_BACKENDS = {
+    'postgresql': PostgresSearchBackend(),
+}
+_DEFAULT_BACKEND = BasicSearchBackend()
+
+
+def get_backend():
+    backend = _BACKENDS.get(connection.vendor, _DEFAULT_BACKEND)
+    if memindex.enabled():
+        return MemoryIndexBackend(backend)
+    return backend
@@ -0,0 +1,71 @@
+import re
+import unicodedata
+
+from songs.models import Song
+from .models import SongDocument
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+BATCH_SIZE = 1000
+
+
+def normalize(text):
+    """Lowercase, strip accents and collapse punctuation so 'Beyoncé!' matches 'beyonce'."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+
+def tokenize(text):
+    return normalize(text).split()
+
+
+def build_document(song):
+    title = normalize(song.title)
+    artists = normalize(' '.join(artist.name for artist in song.artists.all()))
+    album = normalize(song.album.title) if song.album_id else ''
+    genres = normalize(' '.join(genre.name for genre in song.genres.all()))
+    return SongDocument(
+        song_id=song.id,
+        title=title,
+        artists=artists,
+        album=album,
+        genres=genres,
+        # Padded with spaces so token-prefix matching can anchor on ' token'
+        document=' %s ' % ' '.join(part for part in (title, artists, album, genres) if part),
+    )
+
+
+def refresh_documents(song_ids=None):
+    """Rebuild search documents for the given songs (or the whole catalog) in batches."""
+    from . import memindex
+    from .backends import get_backend
+
+    songs = Song.objects.with_related().order_by('id')
+    if song_ids is not None:
+        song_ids = list(song_ids)
+        if not song_ids:
+            return 0
+        songs = songs.filter(id__in=song_ids)
+
+    count = 0
+    last_id = 0
+    while True:
+        batch = list(songs.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        documents = [build_document(song) for song in batch]
+        SongDocument.objects.bulk_create(
+            documents,
+            update_conflicts=True,
+            unique_fields=['song'],
+            update_fields=['title', 'artists', 'album', 'genres', 'document'],
+        )
+        get_backend().update_vectors([doc.song_id for doc in documents])
+        index = memindex.loaded_index()
+        if index is not None:
+            for document in documents:
+                index.index_document(document)
+        count += len(documents)
+        last_id = batch[-1].id
+    return count
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from search import memindex
+
+
+class Command(BaseCommand):
+    help = 'Build the in-memory search index from the catalog and write its snapshot file'
+
+    def handle(self, *args, **options):
+        index = memindex.rebuild(save=True)
+        tokens = sum(len(postings) for postings in index.namespaces.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {tokens} tokens to {settings.SEARCH_INDEX_SNAPSHOT}'
+        ))
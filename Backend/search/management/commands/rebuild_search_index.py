@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from search.documents import refresh_documents
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized search document of every song'
+
+    def handle(self, *args, **options):
+        count = refresh_documents()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} songs'))
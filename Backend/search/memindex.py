@@ -0,0 +1,291 @@
+"""
+Optional in-process inverted index over the catalog (settings.SEARCH_MEMORY_INDEX).
+
+Tokens map to sorted ``array('q')`` postings lists of primary keys. The index is
+persisted as a snapshot file whose postings block is memory-mapped on load, so a
+worker starts serving queries without scanning the catalog tables; postings are
+only copied out of the mapping when a signal modifies them.
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from albums.models import Album
+from artists.models import Artist
+from songs.models import Song
+from .documents import tokenize
+from .models import SongDocument
+
+SONG_FIELDS = ('title', 'artists', 'album', 'genres')
+ALBUMS = 'album_titles'
+ARTISTS = 'artist_names'
+NAMESPACES = SONG_FIELDS + (ALBUMS, ARTISTS)
+
+SNAPSHOT_MAGIC = b'SPIX\x01'
+_HEADER_LENGTH = struct.Struct('<Q')
+_ITEM_SIZE = array('q').itemsize
+
+
+class PostingsIndex:
+    """token -> sorted ids, with prefix lookup through a sorted vocabulary"""
+
+    def __init__(self, postings=None):
+        self._postings = postings or {}
+        self._vocabulary = sorted(self._postings)
+        # id -> tokens, only needed to apply updates; built on first mutation
+        self._forward = None
+
+    def __len__(self):
+        return len(self._vocabulary)
+
+    def items(self):
+        return self._postings.items()
+
+    def match_prefix(self, prefix):
+        ids = set()
+        i = bisect_left(self._vocabulary, prefix)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(prefix):
+            ids.update(self._postings[self._vocabulary[i]])
+            i += 1
+        return ids
+
+    def _ensure_forward(self):
+        if self._forward is None:
+            forward = {}
+            for token, ids in self._postings.items():
+                for doc_id in ids:
+                    forward.setdefault(doc_id, set()).add(token)
+            self._forward = forward
+
+    def _writable(self, token):
+        postings = self._postings.get(token)
+        if postings is None:
+            postings = self._postings[token] = array('q')
+            insort(self._vocabulary, token)
+        elif not isinstance(postings, array):
+            # Still backed by the read-only snapshot mapping
+            postings = self._postings[token] = array('q', postings)
+        return postings
+
+    def replace(self, doc_id, tokens):
+        self._ensure_forward()
+        old = self._forward.get(doc_id, set())
+        new = set(tokens)
+        for token in old - new:
+            postings = self._writable(token)
+            i = bisect_left(postings, doc_id)
+            if i < len(postings) and postings[i] == doc_id:
+                del postings[i]
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+        for token in new - old:
+            postings = self._writable(token)
+            i = bisect_left(postings, doc_id)
+            if i == len(postings) or postings[i] != doc_id:
+                postings.insert(i, doc_id)
+        if new:
+            self._forward[doc_id] = new
+        else:
+            self._forward.pop(doc_id, None)
+
+    def remove(self, doc_id):
+        self.replace(doc_id, ())
+
+
+class CatalogIndex:
+    def __init__(self, namespaces=None, fingerprint=None):
+        namespaces = namespaces or {}
+        self.namespaces = {name: namespaces.get(name) or PostingsIndex() for name in NAMESPACES}
+        self.fingerprint = fingerprint
+        self.lock = threading.RLock()
+
+    def _match(self, namespaces, tokens):
+        """Ids where every token prefixes a token in any of the given namespaces"""
+        result = None
+        with self.lock:
+            for token in tokens:
+                ids = set()
+                for name in namespaces:
+                    ids |= self.namespaces[name].match_prefix(token)
+                result = ids if result is None else result & ids
+                if not result:
+                    return []
+        return sorted(result or ())
+
+    def search_songs(self, query):
+        return self._match(SONG_FIELDS, tokenize(query))
+
+    def search_songs_by_fields(self, **fields):
+        result = None
+        for field, value in fields.items():
+            ids = set(self._match((field,), tokenize(value)))
+            result = ids if result is None else result & ids
+        return sorted(result or ())
+
+    def search_albums(self, query):
+        return self._match((ALBUMS,), tokenize(query))
+
+    def search_artists(self, query):
+        return self._match((ARTISTS,), tokenize(query))
+
+    def index_document(self, document):
+        with self.lock:
+            for field in SONG_FIELDS:
+                self.namespaces[field].replace(document.song_id, getattr(document, field).split())
+
+    def remove_song(self, song_id):
+        with self.lock:
+            for field in SONG_FIELDS:
+                self.namespaces[field].remove(song_id)
+
+    def index_album(self, album_id, title):
+        with self.lock:
+            self.namespaces[ALBUMS].replace(album_id, tokenize(title))
+
+    def index_artist(self, artist_id, name):
+        with self.lock:
+            self.namespaces[ARTISTS].replace(artist_id, tokenize(name))
+
+    def remove(self, namespace, doc_id):
+        with self.lock:
+            self.namespaces[namespace].remove(doc_id)
+
+    @classmethod
+    def build(cls):
+        namespaces = {name: {} for name in NAMESPACES}
+
+        def add(name, doc_id, tokens):
+            postings = namespaces[name]
+            for token in set(tokens):
+                postings.setdefault(token, array('q')).append(doc_id)
+
+        # Ordered scans append ids in ascending order, so postings come out sorted
+        rows = SongDocument.objects.order_by('song_id').values_list('song_id', *SONG_FIELDS)
+        for song_id, *values in rows.iterator(chunk_size=5000):
+            for field, value in zip(SONG_FIELDS, values):
+                add(field, song_id, value.split())
+        for album_id, title in Album.objects.order_by('id').values_list('id', 'title').iterator(chunk_size=5000):
+            add(ALBUMS, album_id, tokenize(title))
+        for artist_id, name in Artist.objects.order_by('id').values_list('id', 'name').iterator(chunk_size=5000):
+            add(ARTISTS, artist_id, tokenize(name))
+
+        return cls(
+            {name: PostingsIndex(postings) for name, postings in namespaces.items()},
+            fingerprint=catalog_fingerprint(),
+        )
+
+    def save(self, path):
+        header = {'fingerprint': self.fingerprint, 'namespaces': {}}
+        offset = 0
+        with self.lock:
+            for name, index in self.namespaces.items():
+                tokens = header['namespaces'][name] = {}
+                for token, ids in index.items():
+                    tokens[token] = [offset, len(ids)]
+                    offset += len(ids)
+            header_bytes = json.dumps(header).encode()
+            # Align the postings block so it can be cast to int64 in place
+            padding = -(len(SNAPSHOT_MAGIC) + _HEADER_LENGTH.size + len(header_bytes)) % _ITEM_SIZE
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(SNAPSHOT_MAGIC)
+                f.write(_HEADER_LENGTH.pack(len(header_bytes) + padding))
+                f.write(header_bytes + b' ' * padding)
+                for index in self.namespaces.values():
+                    for _, ids in index.items():
+                        f.write(array('q', ids).tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                raise ValueError(f'{path} is not a search index snapshot')
+            (header_length,) = _HEADER_LENGTH.unpack(f.read(_HEADER_LENGTH.size))
+            header = json.loads(f.read(header_length))
+            start = len(SNAPSHOT_MAGIC) + _HEADER_LENGTH.size + header_length
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        block = memoryview(mapping)[start:]
+        ids = block.cast('q') if len(block) else array('q')
+        namespaces = {
+            name: PostingsIndex({
+                token: ids[offset:offset + length]
+                for token, (offset, length) in tokens.items()
+            })
+            for name, tokens in header['namespaces'].items()
+        }
+        return cls(namespaces, fingerprint=header['fingerprint'])
+
+
+def catalog_fingerprint():
+    """Cheap row count / max id summary used to detect a stale snapshot"""
+    fingerprint = {}
+    for model in (Song, Album, Artist):
+        stats = model.objects.aggregate(count=Count('id'), max_id=Max('id'))
+        fingerprint[model._meta.label] = [stats['count'], stats['max_id']]
+    return fingerprint
+
+
+_index = None
+_validated = False
+_lock = threading.Lock()
+
+
+def enabled():
+    return getattr(settings, 'SEARCH_MEMORY_INDEX', False)
+
+
+def snapshot_path():
+    return getattr(settings, 'SEARCH_INDEX_SNAPSHOT', None)
+
+
+def load_snapshot():
+    """Map the snapshot into memory without touching the database (called at startup)"""
+    global _index
+    path = snapshot_path()
+    if path and os.path.exists(path):
+        with _lock:
+            _index = CatalogIndex.load(path)
+
+
+def rebuild(save=True):
+    global _index, _validated
+    index = CatalogIndex.build()
+    if save and snapshot_path():
+        index.save(snapshot_path())
+    with _lock:
+        _index = index
+        _validated = True
+    return index
+
+
+def get_index():
+    """The worker's index: the startup snapshot if still current, else a fresh build"""
+    global _validated
+    if _index is not None and _validated:
+        return _index
+    if _index is not None and _index.fingerprint == catalog_fingerprint():
+        _validated = True
+        return _index
+    return rebuild()
+
+
+def loaded_index():
+    """The index if this worker has one, without loading or building it"""
+    return _index if enabled() else None
+
+
+def reset():
+    global _index, _validated
+    with _lock:
+        _index = None
+        _validated = False
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:07
+
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('songs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SongDocument',
+            fields=[
+                ('song', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='songs.song')),
+                ('title', models.TextField()),
+                ('artists', models.TextField(blank=True)),
+                ('album', models.TextField(blank=True)),
+                ('genres', models.TextField(blank=True)),
+                ('document', models.TextField()),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# GIN indexes only exist on PostgreSQL; other backends fall back to
+# search.backends.BasicSearchBackend and need nothing here.
+POSTGRES_INDEXES = [
+    ('search_songdocument_vector_gin', 'search_songdocument', 'search_vector'),
+    ('search_songdocument_document_trgm', 'search_songdocument', 'document gin_trgm_ops'),
+    ('albums_album_title_trgm', 'albums_album', 'title gin_trgm_ops'),
+    ('artists_artist_name_trgm', 'artists_artist', 'name gin_trgm_ops'),
+]
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in POSTGRES_INDEXES:
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ({column})')
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in POSTGRES_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0001_initial'),
+        ('albums', '0001_initial'),
+        ('artists', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,17 @@
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models
+from songs.models import Song
+
+class SongDocument(models.Model):
+    """Denormalized, normalized text of a song and everything it is searchable by."""
+    song = models.OneToOneField(Song, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    title = models.TextField()
+    artists = models.TextField(blank=True)
+    album = models.TextField(blank=True)
+    genres = models.TextField(blank=True)
+    document = models.TextField()
+    # Only populated on PostgreSQL, where it is GIN indexed (see migrations)
+    search_vector = SearchVectorField(null=True, blank=True)
+
+    def __str__(self):
+        return self.document
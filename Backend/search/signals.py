@@ -0,0 +1,68 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from albums.models import Album
+from artists.models import Artist
+from genres.models import Genre
+from songs.models import Song
+from . import memindex
+from .documents import refresh_documents
+
+
+@receiver(post_save, sender=Song)
+def song_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_documents([instance.pk])
+
+
+@receiver(m2m_changed, sender=Song.artists.through)
+@receiver(m2m_changed, sender=Song.genres.through)
+def song_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            refresh_documents([instance.pk])
+        return
+    # Reverse side: instance is an Artist/Genre and pk_set holds song ids
+    if action == 'pre_clear':
+        instance._search_cleared_song_ids = list(instance.songs.values_list('id', flat=True))
+    elif action == 'post_clear':
+        refresh_documents(getattr(instance, '_search_cleared_song_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        refresh_documents(pk_set)
+
+
+@receiver(post_save, sender=Album)
+@receiver(post_save, sender=Artist)
+@receiver(post_save, sender=Genre)
+def catalog_entry_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        # A new album/artist/genre has no songs pointing at it yet
+        return
+    refresh_documents(instance.songs.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Album)
+def album_indexed(sender, instance, raw=False, **kwargs):
+    index = memindex.loaded_index()
+    if index is not None and not raw:
+        index.index_album(instance.pk, instance.title)
+
+
+@receiver(post_save, sender=Artist)
+def artist_indexed(sender, instance, raw=False, **kwargs):
+    index = memindex.loaded_index()
+    if index is not None and not raw:
+        index.index_artist(instance.pk, instance.name)
+
+
+@receiver(post_delete, sender=Song)
+@receiver(post_delete, sender=Album)
+@receiver(post_delete, sender=Artist)
+def catalog_entry_deleted(sender, instance, **kwargs):
+    index = memindex.loaded_index()
+    if index is None:
+        return
+    if sender is Song:
+        index.remove_song(instance.pk)
+    else:
+        index.remove(memindex.ALBUMS if sender is Album else memindex.ARTISTS, instance.pk)
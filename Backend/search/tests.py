@@ -0,0 +1,116 @@
+import os
+import tempfile
+
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from genres.models import Genre
+from songs.tests import create_songs
+from . import memindex
+from .documents import normalize
+from .models import SongDocument
+
+
+class SongDocumentTests(TestCase):
+    def test_document_follows_catalog_changes(self):
+        song = create_songs(1, title='Café')[0]
+        document = SongDocument.objects.get(song=song)
+        self.assertEqual(document.title, 'cafe song 0')
+        self.assertIn(' pop ', document.document)
+
+        artist = song.artists.get()
+        artist.name = 'Nina Simone'
+        artist.save()
+        jazz = Genre.objects.create(name='Jazz')
+        song.genres.add(jazz)
+
+        document.refresh_from_db()
+        self.assertEqual(document.artists, 'nina simone')
+        self.assertIn('jazz', document.genres)
+
+    def test_normalize(self):
+        self.assertEqual(normalize("  Beyoncé -- Halo!"), 'beyonce halo')
+
+
+class SearchEndpointTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        create_songs(2, title='Blue Moon')
+        create_songs(2, title='Yellow Submarine')
+
+    def test_ranked_results_across_types(self):
+        response = self.client.get('/api/v1/search/?q=yellow sub')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([song['title'] for song in response.data['songs']], ['Yellow Submarine Song 0', 'Yellow Submarine Song 1'])
+        self.assertEqual([album['title'] for album in response.data['albums']], ['Yellow Submarine Album'])
+        self.assertEqual([artist['name'] for artist in response.data['artists']], ['Yellow Submarine Artist'])
+
+    def test_matches_artist_and_genre_prefixes(self):
+        response = self.client.get('/api/v1/search/?q=blue art&type=songs')
+        self.assertEqual(len(response.data['songs']), 2)
+        self.assertNotIn('albums', response.data)
+
+    def test_requires_query(self):
+        self.assertEqual(self.client.get('/api/v1/search/').status_code, 400)
+
+    def test_limit_must_be_positive(self):
+        for limit in ('-1', '0', 'x'):
+            self.assertEqual(self.client.get(f'/api/v1/search/?q=blue&limit={limit}').status_code, 400, limit)
+        self.assertEqual(len(self.client.get('/api/v1/search/?q=blue&limit=1&type=songs').data['songs']), 1)
+
+    def test_find_song_uses_search_documents(self):
+        response = self.client.get('/api/v1/songs/find_song/?q=submarine pop')
+        self.assertEqual(len(response.data['results']), 2)
+
+
+class MemoryIndexTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.snapshot = os.path.join(self.tmpdir.name, 'index.snapshot')
+        override = override_settings(SEARCH_MEMORY_INDEX=True, SEARCH_INDEX_SNAPSHOT=self.snapshot)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(self.tmpdir.cleanup)
+        self.addCleanup(memindex.reset)
+        memindex.reset()
+        self.songs = create_songs(3, title='Paper Planes')
+
+    def test_lookups_come_from_memory(self):
+        index = memindex.get_index()
+        with self.assertNumQueries(0):
+            self.assertEqual(index.search_songs('paper plan'), [song.id for song in self.songs])
+            self.assertEqual(index.search_songs_by_fields(artists='paper', genres='pop'), [song.id for song in self.songs])
+            self.assertEqual(index.search_albums('planes'), [self.songs[0].album_id])
+            self.assertEqual(index.search_songs('nothing'), [])
+
+    def test_incremental_updates(self):
+        index = memindex.get_index()
+        song = self.songs[0]
+        song.title = 'Clash'
+        song.save()
+        self.assertEqual(index.search_songs_by_fields(title='clash'), [song.id])
+        self.assertNotIn(song.id, index.search_songs_by_fields(title='paper'))
+        self.songs[1].delete()
+        self.assertEqual(index.search_songs('paper planes song'), [self.songs[2].id])
+
+    def test_snapshot_round_trip(self):
+        memindex.rebuild(save=True)
+        memindex.reset()
+        memindex.load_snapshot()
+        index = memindex.get_index()
+        self.assertEqual(index.search_artists('paper'), [self.songs[0].artists.get().id])
+        # Mutations copy postings out of the read-only mapping
+        self.songs[0].genres.clear()
+        self.assertEqual(index.search_songs_by_fields(genres='pop'), [s.id for s in self.songs[1:]])
+
+    def test_stale_snapshot_is_rebuilt(self):
+        memindex.rebuild(save=True)
+        memindex.reset()
+        extra = create_songs(1, title='Late Addition')[0]
+        memindex.load_snapshot()
+        self.assertEqual(memindex.loaded_index().search_songs('late'), [])
+        self.assertEqual(memindex.get_index().search_songs('late'), [extra.id])
+
+    def test_find_song_endpoint(self):
+        response = APIClient().get('/api/v1/songs/find_song/?q=planes')
+        self.assertEqual(len(response.data['results']), 3)
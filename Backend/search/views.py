@@ -0,0 +1,41 @@
+from rest_framework import viewsets, permissions, status
+from rest_framework.response import Response
+
+from albums.serializers import AlbumSerializer
+from artists.serializers import ArtistSerializer
+from root.pagination import query_limit
+from songs.serializers import SongSerializer
+from .backends import get_backend
+
+SEARCH_TYPES = ('songs', 'albums', 'artists')
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+
+class SearchViewSet(viewsets.ViewSet):
+    permission_classes = [permissions.AllowAny]
+
+    def list(self, request):
+        """Relevance-ranked top matches across songs, albums and artists"""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {"error": "Please provide a query parameter 'q' to search for."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        types = request.query_params.get('type')
+        types = [t for t in types.split(',') if t in SEARCH_TYPES] if types else SEARCH_TYPES
+        limit, error = query_limit(request, DEFAULT_LIMIT, MAX_LIMIT)
+        if error:
+            return error
+
+        backend = get_backend()
+        results = {}
+        if 'songs' in types:
+            results['songs'] = SongSerializer(backend.search_songs(query, limit), many=True).data
+        if 'albums' in types:
+            results['albums'] = AlbumSerializer(backend.search_albums(query, limit), many=True).data
+        if 'artists' in types:
+            results['artists'] = ArtistSerializer(backend.search_artists(query, limit), many=True).data
+        return Response(results, status=status.HTTP_200_OK)
@@ -0,0 +1,313 @@
+"""
+Bulk catalog import from CSV or JSON Lines.
+
+Rows are read one at a time and written in batches: each batch creates the
+missing artists, genres, albums and songs with one bulk_create per table,
+then links songs to artists and genres with bulk inserts into the through
+tables. Artist, album and genre ids are kept in lookup maps; songs are
+matched per batch, so memory does not grow with the number of tracks.
+
+Artists are matched by name, albums by (album artist, title) and songs by
+(album, title). Rows that already exist are left as they are, so running an
+import twice creates nothing the second time.
+
+bulk_create sends no model signals, so after each batch commits the importer
+updates what the signal handlers would have: it bumps the response cache
+tags, adds the new songs to a loaded sampling pool, and marks the entity
+extractor and the song embeddings as out of date.
+
+Each row has ``title``, ``album``, ``artists`` and optionally
+``album_artist`` (defaults to the first artist), ``release_date`` (needed
+for new albums; YYYY-MM-DD or YYYY), ``genres``, ``audio_url``,
+``cover_image`` and ``album_cover_image``. In CSV files ``artists`` and
+``genres`` are separated by ';'; JSON rows may use lists.
+"""
+import csv
+import gzip
+import json
+import sys
+from collections import Counter
+from datetime import date
+
+from django.db import transaction
+
+from albums.models import Album
+from artists.models import Artist
+from genres.models import Genre
+from .models import Song
+
+BATCH_SIZE = 5000
+LIST_SEPARATOR = ';'
+# Invalid rows reported individually; the rest are only counted
+MAX_ERRORS = 20
+
+SongArtist = Song.artists.through
+SongGenre = Song.genres.through
+
+
+def open_rows(path, format=None):
+    """Iterate over the rows of a CSV/JSONL file (optionally gzipped, '-' for stdin)"""
+    name = path[:-len('.gz')] if path.endswith('.gz') else path
+    format = format or ('jsonl' if name.endswith(('.jsonl', '.ndjson', '.json')) else 'csv')
+    if path == '-':
+        f = sys.stdin
+    elif path.endswith('.gz'):
+        f = gzip.open(path, 'rt', encoding='utf-8', newline='')
+    else:
+        f = open(path, encoding='utf-8', newline='')
+    try:
+        if format == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def _max_length(model, field):
+    return model._meta.get_field(field).max_length
+
+
+def _text(raw, key, model, field, required=False):
+    value = (raw.get(key) or '').strip()
+    if required and not value:
+        raise ValueError(f"'{key}' is required")
+    if len(value) > _max_length(model, field):
+        raise ValueError(f"'{key}' is longer than {_max_length(model, field)} characters")
+    return value or None
+
+
+def _names(raw, key, model, field):
+    value = raw.get(key) or []
+    if isinstance(value, str):
+        value = value.split(LIST_SEPARATOR)
+    names = []
+    for name in value:
+        name = name.strip()
+        if len(name) > _max_length(model, field):
+            raise ValueError(f"'{key}' has a name longer than {_max_length(model, field)} characters")
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def _date(value):
+    value = str(value or '').strip()
+    if not value:
+        return None
+    try:
+        if len(value) == 4:
+            return date(int(value), 1, 1)
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"'release_date' is not a date: {value!r}")
+
+
+def parse_row(raw):
+    artists = _names(raw, 'artists', Artist, 'name')
+    album_artist = _text(raw, 'album_artist', Artist, 'name')
+    if not artists and not album_artist:
+        raise ValueError("'artists' is required")
+    return {
+        'title': _text(raw, 'title', Song, 'title', required=True),
+        'album': _text(raw, 'album', Album, 'title', required=True),
+        'artists': artists,
+        'album_artist': album_artist or artists[0],
+        'release_date': _date(raw.get('release_date')),
+        'genres': _names(raw, 'genres', Genre, 'name'),
+        'audio_url': _text(raw, 'audio_url', Song, 'audio_url'),
+        'cover_image': _text(raw, 'cover_image', Song, 'cover_image'),
+        'album_cover_image': _text(raw, 'album_cover_image', Album, 'cover_image'),
+    }
+
+
+class CatalogImporter:
+    def __init__(self, batch_size=BATCH_SIZE, refresh_search=True):
+        self.batch_size = batch_size
+        self.refresh_search = refresh_search
+        self.stats = Counter()
+        self.errors = []
+        self.artists = {}
+        self.albums = {}
+        self.genres = {}
+
+    def load_lookups(self):
+        # Newest first, so the oldest row wins when names repeat
+        rows = Artist.objects.order_by('-id').values_list('id', 'name')
+        self.artists = {name: artist_id for artist_id, name in rows.iterator(chunk_size=10000)}
+        rows = Album.objects.order_by('-id').values_list('id', 'artist_id', 'title')
+        self.albums = {(artist_id, title): album_id for album_id, artist_id, title in rows.iterator(chunk_size=10000)}
+        self.genres = {name: genre_id for genre_id, name in Genre.objects.values_list('id', 'name')}
+
+    def error(self, line, message):
+        self.stats['skipped'] += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(f'row {line}: {message}')
+
+    def run(self, rows, progress=None):
+        """Import an iterable of raw rows; ``progress(stats)`` is called after each batch"""
+        self.load_lookups()
+        batch = []
+        for line, raw in enumerate(rows, 1):
+            self.stats['rows'] += 1
+            try:
+                batch.append((line, parse_row(raw)))
+            except (ValueError, AttributeError) as e:
+                self.error(line, e)
+                continue
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+                if progress:
+                    progress(self.stats)
+        if batch:
+            self.import_batch(batch)
+            if progress:
+                progress(self.stats)
+        return self.stats
+
+    def import_batch(self, batch):
+        """Write one batch of (line, parsed row) pairs; returns the ids of its songs"""
+        batch = self._check_albums(batch)
+        with transaction.atomic():
+            new_artists = self._ensure_artists(
+                {name for _, row in batch for name in row['artists'] + [row['album_artist']]}
+            )
+            new_genres = self._ensure_genres({name for _, row in batch for name in row['genres']})
+            rows, new_albums = self._ensure_albums(batch)
+            song_ids, new_songs = self._ensure_songs(rows)
+            genre_links = self._link(rows, song_ids)
+        if self.refresh_search and song_ids:
+            from search.documents import refresh_documents
+
+            refresh_documents(song_ids.values())
+        if song_ids:
+            self._catalog_changed(rows, song_ids, new_songs, new_albums, new_artists, new_genres, genre_links)
+        return list(song_ids.values())
+
+    def _catalog_changed(self, rows, song_ids, new_songs, new_albums, new_artists, new_genres, genre_links):
+        """What the post_save and m2m_changed handlers would have done for the batch"""
+        from caching.tags import bump
+        from chatbot import entities
+        from recommendations import embeddings, sampling
+
+        # Existing songs may have gained artists or genres, so every song of the batch is bumped
+        tags = {f'song:{song_id}' for song_id in song_ids.values()}
+        tags.update(f"album:{row['album_id']}" for row in rows)
+        created = {'songs': new_songs, 'albums': new_albums, 'artists': new_artists, 'genres': new_genres}
+        tags.update(tag for tag, ids in created.items() if ids)
+        bump(*tags)
+
+        pool = sampling.loaded_sampler()
+        if pool is not None:
+            pool.add_songs(new_songs, genre_links)
+        entities.invalidate()
+        embeddings.catalog_changed()
+
+    def _ensure_artists(self, names):
+        """Create the artists not seen yet; returns their ids"""
+        missing = [name for name in names if name not in self.artists]
+        if not missing:
+            return []
+        Artist.objects.bulk_create([Artist(name=name) for name in missing], batch_size=self.batch_size)
+        for artist_id, name in Artist.objects.filter(name__in=missing).order_by('-id').values_list('id', 'name'):
+            self.artists[name] = artist_id
+        self.stats['artists'] += len(missing)
+        return [self.artists[name] for name in missing]
+
+    def _ensure_genres(self, names):
+        """Create the genres not seen yet; returns their ids"""
+        missing = [name for name in names if name not in self.genres]
+        if not missing:
+            return []
+        Genre.objects.bulk_create([Genre(name=name) for name in missing], ignore_conflicts=True)
+        self.genres.update(Genre.objects.filter(name__in=missing).values_list('name', 'id'))
+        self.stats['genres'] += len(missing)
+        return [self.genres[name] for name in missing]
+
+    def _check_albums(self, batch):
+        """Skip rows that need a new album but give no release date, before anything is created for them"""
+        dated = {(row['album_artist'], row['album']) for _, row in batch if row['release_date'] is not None}
+        checked = []
+        for line, row in batch:
+            exists = (self.artists.get(row['album_artist']), row['album']) in self.albums
+            if row['release_date'] is None and not exists and (row['album_artist'], row['album']) not in dated:
+                self.error(line, f"'release_date' is required for the new album {row['album']!r}")
+                continue
+            checked.append((line, row))
+        return checked
+
+    def _ensure_albums(self, batch):
+        """The rows with their album ids, and the ids of the albums created for them"""
+        new = {}
+        rows = []
+        for _, row in batch:
+            key = (self.artists[row['album_artist']], row['album'])
+            # Any row of the batch with a date can create the album (_check_albums made sure one does)
+            if key not in self.albums and key not in new and row['release_date'] is not None:
+                new[key] = Album(
+                    title=row['album'], artist_id=key[0],
+                    release_date=row['release_date'], cover_image=row['album_cover_image'],
+                )
+            row['album_id'] = key
+            rows.append(row)
+        if new:
+            Album.objects.bulk_create(new.values(), batch_size=self.batch_size)
+            created = Album.objects.filter(
+                artist_id__in={artist_id for artist_id, _ in new},
+                title__in={title for _, title in new},
+            ).order_by('-id').values_list('id', 'artist_id', 'title')
+            for album_id, artist_id, title in created:
+                if (artist_id, title) in new:
+                    self.albums[(artist_id, title)] = album_id
+            self.stats['albums'] += len(new)
+        for row in rows:
+            row['album_id'] = self.albums[row['album_id']]
+        return rows, [self.albums[key] for key in new]
+
+    def _song_ids(self, keys):
+        songs = Song.objects.filter(
+            album_id__in={album_id for album_id, _ in keys},
+            title__in={title for _, title in keys},
+        ).order_by('-id').values_list('id', 'album_id', 'title')
+        return {(album_id, title): song_id for song_id, album_id, title in songs if (album_id, title) in keys}
+
+    def _ensure_songs(self, rows):
+        """Song ids by (album id, title) for every row, and the ids of the songs created"""
+        keys = {(row['album_id'], row['title']) for row in rows}
+        song_ids = self._song_ids(keys)
+        new = {}
+        for row in rows:
+            key = (row['album_id'], row['title'])
+            if key not in song_ids and key not in new:
+                new[key] = Song(
+                    title=row['title'], album_id=row['album_id'],
+                    audio_url=row['audio_url'], cover_image=row['cover_image'],
+                )
+        if new:
+            Song.objects.bulk_create(new.values(), batch_size=self.batch_size)
+            song_ids = self._song_ids(keys)
+            self.stats['songs'] += len(new)
+        return song_ids, [song_ids[key] for key in new]
+
+    def _link(self, rows, song_ids):
+        """Link songs to their artists and genres; returns the (song id, genre id) pairs"""
+        artist_links = set()
+        genre_links = set()
+        for row in rows:
+            song_id = song_ids[(row['album_id'], row['title'])]
+            artist_links.update((song_id, self.artists[name]) for name in row['artists'] or [row['album_artist']])
+            genre_links.update((song_id, self.genres[name]) for name in row['genres'])
+        # Links that already exist are skipped by the through tables' unique constraints
+        SongArtist.objects.bulk_create(
+            [SongArtist(song_id=song_id, artist_id=artist_id) for song_id, artist_id in artist_links],
+            ignore_conflicts=True, batch_size=self.batch_size,
+        )
+        SongGenre.objects.bulk_create(
+            [SongGenre(song_id=song_id, genre_id=genre_id) for song_id, genre_id in genre_links],
+            ignore_conflicts=True, batch_size=self.batch_size,
+        )
+        return genre_links
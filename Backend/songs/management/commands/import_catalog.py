@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from songs.importer import BATCH_SIZE, CatalogImporter, open_rows
+
+# Progress is reported every this many batches at the default verbosity
+PROGRESS_EVERY = 10
+
+
+class Command(BaseCommand):
+    help = 'Import artists, albums, genres and songs from CSV or JSON Lines files in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help="CSV/JSONL files, optionally gzipped ('-' reads stdin)")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--no-search-index', action='store_true',
+                            help='Skip search documents; run rebuild_search_index afterwards')
+
+    def handle(self, *args, **options):
+        importer = CatalogImporter(options['batch_size'], refresh_search=not options['no_search_index'])
+        started = time.perf_counter()
+        batches = 0
+
+        def progress(stats):
+            nonlocal batches
+            batches += 1
+            if options['verbosity'] > 1 or batches % PROGRESS_EVERY == 0:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"{stats['rows']} rows, {stats['rows'] / elapsed:.0f} rows/s")
+
+        for path in options['paths']:
+            importer.run(open_rows(path, options['format']), progress)
+
+        for error in importer.errors:
+            self.stderr.write(error)
+        stats = importer.stats
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['rows']} rows in {elapsed:.1f}s ({stats['rows'] / max(elapsed, 1e-9):.0f} rows/s): "
+            f"{stats['songs']} songs, {stats['albums']} albums, {stats['artists']} artists, "
+            f"{stats['genres']} genres created, {stats['skipped']} rows skipped"
+        ))
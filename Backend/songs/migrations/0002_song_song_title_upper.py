@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:41
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('albums', '0002_album_album_release_date'),
+        ('artists', '0001_initial'),
+        ('genres', '0001_initial'),
+        ('songs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(django.db.models.functions.text.Upper('title'), name='song_title_upper'),
+        ),
+    ]
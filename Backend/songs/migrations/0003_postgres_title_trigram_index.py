@@ -0,0 +1,31 @@
+from django.db import migrations
+
+# icontains compiles to UPPER(title::text) LIKE UPPER('%word%') on PostgreSQL, which
+# only a trigram index on the same expression can serve. Other backends scan.
+INDEX_NAME = 'songs_song_title_upper_trgm'
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON songs_song USING gin ((UPPER(title::text)) gin_trgm_ops)'
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0002_song_song_title_upper'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
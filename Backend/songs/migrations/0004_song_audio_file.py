@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0003_postgres_title_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='audio_file',
+            field=models.CharField(blank=True, default='', max_length=500),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0004_song_audio_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='renditions',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
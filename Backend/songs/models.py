@@ -1,15 +1,32 @@
 from django.db import models
+from django.db.models.functions import Upper
 from albums.models import Album
 from artists.models import Artist
 from genres.models import Genre
 
+class SongQuerySet(models.QuerySet):
+    def with_related(self):
+        # Everything SongSerializer touches, fetched in a constant number of queries
+        return self.select_related('album').prefetch_related('artists', 'genres')
+
 class Song(models.Model):
     title = models.CharField(max_length=255)
     album = models.ForeignKey(Album, on_delete=models.CASCADE, related_name="songs")
     artists = models.ManyToManyField(Artist, related_name="songs")
     audio_url = models.URLField(null=True, blank=True)
+    # Storage key of an uploaded audio file, served by /songs/{id}/stream/
+    audio_file = models.CharField(max_length=500, blank=True, default='')
+    # HLS bitrate ladder made by streaming.hls.package, served from /songs/{id}/hls/
+    renditions = models.JSONField(default=list, blank=True)
     cover_image = models.URLField(null=True, blank=True)
     genres = models.ManyToManyField(Genre, related_name="songs")
 
+    objects = SongQuerySet.as_manager()
+
+    class Meta:
+        # title__iexact compiles to UPPER(title) = UPPER(%s) on PostgreSQL; icontains
+        # is served by the trigram index in migration 0003
+        indexes = [models.Index(Upper('title'), name='song_title_upper')]
+
     def __str__(self):
         return self.title
@@ -0,0 +1,11 @@
+from jobs.queue import task
+from .importer import BATCH_SIZE, CatalogImporter, open_rows
+
+
+@task(queue='catalog')
+def import_catalog(paths, format=None, batch_size=BATCH_SIZE, refresh_search=True):
+    """Bulk import catalog files readable by the worker; a retry skips the rows already imported"""
+    importer = CatalogImporter(batch_size, refresh_search=refresh_search)
+    for path in paths:
+        importer.run(open_rows(path, format))
+    return {'stats': dict(importer.stats), 'errors': importer.errors}
@@ -1,3 +1,184 @@
+import json
+import os
+import tempfile
+from datetime import date
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from albums.models import Album
+from caching import tags
+from caching.tags import get_cache
+from artists.models import Artist
+from genres.models import Genre
+from recommendations import sampling
+from .importer import CatalogImporter
+from .models import Song
+
+
+def create_songs(count, title='Song'):
+    artist = Artist.objects.create(name=f'{title} Artist')
+    album = Album.objects.create(title=f'{title} Album', artist=artist, release_date=date(2020, 1, 1))
+    genre, _ = Genre.objects.get_or_create(name='Pop')
+    songs = []
+    for i in range(count):
+        song = Song.objects.create(title=f'{title} Song {i}', album=album)
+        song.artists.add(artist)
+        song.genres.add(genre)
+        songs.append(song)
+    return songs
+
+
+class SongQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def assertConstantQueries(self, url, num):
+        create_songs(1, title='First')
+        with self.assertNumQueries(num):
+            self.client.get(url)
+        create_songs(10, title='Second')
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_list(self):
+        self.assertConstantQueries('/api/v1/songs/', 3)
+
+    def test_find_song(self):
+        self.assertConstantQueries('/api/v1/songs/find_song/?q=Song', 3)
+
+    def test_fetch_songs_by_artist(self):
+        artist = create_songs(3)[0].artists.get()
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/v1/songs/fetch_songs_by_artist/?artist_id={artist.id}')
+        self.assertEqual(len(response.data['results']), 3)
+
+
+class SongPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.songs = create_songs(5)
+
+    def test_cursor_walks_every_song_once(self):
+        url = '/api/v1/songs/find_song/?q=Song&page_size=2'
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen.extend(song['id'] for song in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, [song.id for song in self.songs])
+
+
+CATALOG_CSV = """title,artists,album,album_artist,release_date,genres,audio_url
+Blue Moon,Nat King Cole,Love Songs,,1956-03-01,Jazz;Vocal,https://example.com/blue-moon.mp3
+Stardust,Nat King Cole;Nelson Riddle,Love Songs,Nat King Cole,,Jazz,
+Take Five,The Dave Brubeck Quartet,Time Out,,1959,Jazz,
+No Album,Someone,,,2001,Pop,
+No Date,Someone,Unknown Album,,,Pop,
+"""
+
+
+class ImportCatalogTests(TestCase):
+    def write(self, name, content):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def import_catalog(self, path, *args):
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_import(self):
+        Artist.objects.create(name='Nat King Cole')
+        out, err = self.import_catalog(self.write('catalog.csv', CATALOG_CSV))
+        self.assertIn('Imported 5 rows', out)
+        self.assertIn('3 songs, 2 albums, 2 artists, 2 genres created, 2 rows skipped', out)
+        self.assertIn("row 4: 'album' is required", err)
+        self.assertIn("row 5: 'release_date' is required", err)
+        # Nothing is created for skipped rows
+        self.assertFalse(Artist.objects.filter(name='Someone').exists())
+        self.assertFalse(Genre.objects.filter(name='Pop').exists())
+
+        stardust = Song.objects.get(title='Stardust')
+        self.assertEqual(stardust.album.title, 'Love Songs')
+        self.assertEqual(stardust.album.release_date, date(1956, 3, 1))
+        self.assertEqual(sorted(stardust.artists.values_list('name', flat=True)), ['Nat King Cole', 'Nelson Riddle'])
+        self.assertEqual(Artist.objects.filter(name='Nat King Cole').count(), 1)
+        self.assertEqual(Song.objects.get(title='Take Five').album.release_date, date(1959, 1, 1))
+        self.assertEqual(sorted(Song.objects.get(title='Blue Moon').genres.values_list('name', flat=True)), ['Jazz', 'Vocal'])
+        # Imported songs are searchable
+        self.assertEqual(self.client.get('/api/v1/search/?q=stardust').data['songs'][0]['id'], stardust.id)
+
+    def test_album_date_can_come_from_a_later_row(self):
+        out, _ = self.import_catalog(self.write('catalog.csv', (
+            "title,artists,album,release_date\n"
+            "Intro,Band,Debut,\n"
+            "Outro,Band,Debut,2001\n"
+        )))
+        self.assertIn('2 songs, 1 albums', out)
+        self.assertEqual(Album.objects.get(title='Debut').release_date, date(2001, 1, 1))
+
+    def test_reimport_creates_nothing(self):
+        path = self.write('catalog.csv', CATALOG_CSV)
+        self.import_catalog(path, '--batch-size', '2')
+        counts = [model.objects.count() for model in (Artist, Album, Genre, Song, Song.artists.through, Song.genres.through)]
+        out, _ = self.import_catalog(path)
+        self.assertIn('0 songs, 0 albums, 0 artists, 0 genres created', out)
+        self.assertEqual(
+            [model.objects.count() for model in (Artist, Album, Genre, Song, Song.artists.through, Song.genres.through)],
+            counts,
+        )
+
+    def test_import_updates_warm_caches(self):
+        get_cache().clear()
+        sampling.reset()
+        self.addCleanup(sampling.reset)
+        existing = create_songs(1, title='Old')[0]
+        self.assertEqual(len(self.client.get('/api/v1/albums/').data['results']), 1)
+        pool = sampling.get_sampler()
+        self.import_catalog(self.write('catalog.jsonl', json.dumps(
+            {'title': 'Again', 'artists': ['Old Artist'], 'album': 'Old Album', 'genres': ['Jazz']},
+        ) + '\n' + json.dumps(
+            {'title': 'So What', 'artists': ['Miles Davis'], 'album': 'Kind of Blue', 'release_date': '1959', 'genres': ['Jazz']},
+        )))
+        albums = self.client.get('/api/v1/albums/').data['results']
+        self.assertEqual(sorted(album['title'] for album in albums), ['Kind of Blue', 'Old Album'])
+        tracks = self.client.get(f'/api/v1/albums/{existing.album_id}/get_all_songs/').data
+        self.assertIn('Again', [song['title'] for song in tags.results(tracks)])
+        jazz = Genre.objects.get(name='Jazz').id
+        self.assertEqual(sorted(pool.sample(10, genres={jazz: 1})), sorted(Song.objects.filter(genres=jazz).values_list('id', flat=True)))
+        self.assertEqual(len(pool), 3)
+
+    def test_jsonl_import(self):
+        rows = [
+            {'title': 'So What', 'artists': ['Miles Davis'], 'album': 'Kind of Blue', 'release_date': '1959-08-17', 'genres': ['Jazz']},
+            {'title': 'Freddie Freeloader', 'artists': 'Miles Davis', 'album': 'Kind of Blue'},
+        ]
+        out, _ = self.import_catalog(self.write('catalog.jsonl', '\n'.join(json.dumps(row) for row in rows)))
+        self.assertIn('2 songs, 1 albums, 1 artists, 1 genres created', out)
+        self.assertEqual(Album.objects.get().songs.count(), 2)
+
+    def test_queries_do_not_grow_with_batch_size(self):
+        def queries(count, title):
+            rows = [
+                {'title': f'{title} {i}', 'artists': [f'{title} Artist {i % 3}'], 'album': f'{title} Album {i % 2}',
+                 'release_date': '2020', 'genres': [f'{title} {i % 4}']}
+                for i in range(count)
+            ]
+            with CaptureQueriesContext(connection) as context:
+                CatalogImporter(refresh_search=False).run(rows)
+            return len(context)
 
-# Create your tests here.
+        self.assertEqual(queries(5, 'Small'), queries(50, 'Large'))
+        self.assertEqual(Song.objects.count(), 55)
@@ -1,17 +1,40 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from django.shortcuts import redirect
 from rest_framework.response import Response
 
 from .models import Song
 from .serializers import SongSerializer
 from artists.models import Artist
 from albums.models import Album
+from root.pagination import PaginatedActionMixin, query_limit
+from search.backends import get_backend
+from caching.decorators import cached_response
+from caching.tags import song_tags
+from recommendations.collaborative import neighbor_ids
+from recommendations.embeddings import similar_song_ids
+from streaming.responses import stream_response
+from streaming.storage import get_storage
 
-class SongViewSet(viewsets.ModelViewSet):
-    queryset = Song.objects.all()
+SIMILAR_DEFAULT_LIMIT = 10
+SIMILAR_MAX_LIMIT = 50
+
+class SongViewSet(PaginatedActionMixin, viewsets.ModelViewSet):
+    queryset = Song.objects.with_related()
     serializer_class = SongSerializer
 
+    def get_queryset(self):
+        if self.action == 'stream':
+            # Players send a request per seek; skip the relations the serializer needs
+            return Song.objects.only('audio_file', 'audio_url')
+        return super().get_queryset()
+
+    @cached_response('song:{pk}', data_tags=song_tags)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     @action(detail=True, methods=['get'])
+    @cached_response('song:{pk}', data_tags=song_tags)
     def details(self, request, pk=None):
         try:
             song = self.get_object()
@@ -23,27 +46,69 @@ class SongViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Songs most like this one, from the embedding index, most similar first"""
+        song = self.get_object()
+        limit, error = query_limit(request, SIMILAR_DEFAULT_LIMIT, SIMILAR_MAX_LIMIT)
+        if error:
+            return error
+
+        return self._songs_response(similar_song_ids([song.id], limit))
+
+    @action(detail=True, methods=['get'])
+    def recommendations(self, request, pk=None):
+        """Songs that share playlists with this one (falls back to similar songs when it has no neighbours)"""
+        song = self.get_object()
+        limit, error = query_limit(request, SIMILAR_DEFAULT_LIMIT, SIMILAR_MAX_LIMIT)
+        if error:
+            return error
+
+        return self._songs_response(neighbor_ids(song.id, limit) or similar_song_ids([song.id], limit))
+
+    @action(detail=True, methods=['get'])
+    def stream(self, request, pk=None):
+        """The song's audio, with Range support; songs without a stored file redirect to audio_url"""
+        song = self.get_object()
+        if song.audio_file:
+            try:
+                return stream_response(request, get_storage(), song.audio_file)
+            except FileNotFoundError:
+                # Stored file gone (deleted or not yet uploaded): the external copy still plays
+                pass
+        if song.audio_url:
+            return redirect(song.audio_url)
+        return Response(
+            {"error": "No audio for this song"},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    def _songs_response(self, ids):
+        songs = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer([songs[song_id] for song_id in ids if song_id in songs], many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['get'])
     def find_song(self, request):
         query = request.query_params.get('q', '')
-        songs = Song.objects.filter(title__icontains=query)
-        serializer = self.get_serializer(songs, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        songs = self.get_queryset()
+        if query:
+            songs = get_backend().filter_songs(songs, query)
+        return self.paginated_response(songs)
 
     @action(detail=False, methods=['get'])
     def fetch_songs_by_artist(self, request):
         artist_id = request.query_params.get('artist_id')
         try:
             # Direct query using the many-to-many relationship
-            songs = Song.objects.filter(artists__id=artist_id)
+            songs = self.get_queryset().filter(artists__id=artist_id)
             if not songs.exists():
                 return Response(
                     {"error": "No songs found for the given artist."},
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            serializer = self.get_serializer(songs, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return self.paginated_response(songs)
         except Exception as e:
             return Response(
                 {"error": str(e)},
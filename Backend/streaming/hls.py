@@ -0,0 +1,203 @@
+"""
+HLS packaging: a song's source audio transcoded into an AAC bitrate ladder.
+
+One ffmpeg run decodes the source once and encodes every bitrate in
+settings.AUDIO_HLS_BITRATES, each cut into AUDIO_HLS_SEGMENT_SECONDS MPEG-TS
+segments with a VOD media playlist. The files are uploaded to the audio
+storage under songs/<id>/hls/<version>/<bitrate>k/, and Song.renditions
+records what was made. A new version directory is used on every run, so
+segment URLs never change content and CDNs can cache them indefinitely; the
+master playlist, built from Song.renditions on each request, is the only
+response that has to expire. The previous version is deleted by a job
+AUDIO_HLS_RETIRE_DELAY seconds later.
+"""
+import logging
+import os
+import subprocess
+import tempfile
+import time
+
+from django.conf import settings
+
+from .storage import clean_key, get_storage
+
+logger = logging.getLogger(__name__)
+
+CODEC = 'mp4a.40.2'  # AAC-LC
+PLAYLIST_NAME = 'index.m3u8'
+SEGMENT_PATTERN = 'seg_%05d.ts'
+# What ffmpeg may open while reading a source (playlists it reads can name further inputs)
+LOCAL_PROTOCOLS = 'file'
+REMOTE_PROTOCOLS = 'file,http,https,tcp,tls'
+
+
+class PackagingError(Exception):
+    pass
+
+
+def bitrates():
+    """The configured ladder in kbit/s, lowest first"""
+    return sorted({int(value) for value in str(settings.AUDIO_HLS_BITRATES).split(',') if value.strip()})
+
+
+def song_prefix(song_id):
+    return f'songs/{song_id}/hls'
+
+
+def source_of(song, allow_remote=False):
+    """
+    (input, protocol whitelist) for ffmpeg: a stored file by path or signed URL,
+    or, with ``allow_remote``, the external audio_url. audio_url is writable
+    through the API, so it is not fetched unless asked for.
+    """
+    if song.audio_file:
+        storage = get_storage()
+        path = storage.path(song.audio_file)
+        if path:
+            return path, LOCAL_PROTOCOLS
+        return storage.url(song.audio_file), REMOTE_PROTOCOLS
+    if song.audio_url and allow_remote:
+        return song.audio_url, REMOTE_PROTOCOLS
+    if song.audio_url:
+        raise PackagingError(f'Song {song.id} only has an external audio_url; allow remote sources to package it')
+    raise PackagingError(f'Song {song.id} has no audio to package')
+
+
+def ffmpeg_command(source, outputs, segment_seconds, protocols=LOCAL_PROTOCOLS):
+    """ffmpeg arguments for ``outputs``, a list of (kbit/s, output directory)"""
+    command = [
+        settings.FFMPEG_BINARY, '-hide_banner', '-nostdin', '-loglevel', 'error', '-y',
+        '-protocol_whitelist', protocols, '-i', source,
+    ]
+    for bitrate, directory in outputs:
+        command += [
+            '-map', '0:a:0', '-vn', '-c:a', 'aac', '-b:a', f'{bitrate}k', '-ac', '2', '-ar', '44100',
+            '-f', 'hls', '-hls_time', str(segment_seconds), '-hls_playlist_type', 'vod',
+            '-hls_segment_type', 'mpegts', '-hls_flags', 'independent_segments',
+            '-hls_segment_filename', os.path.join(directory, SEGMENT_PATTERN),
+            os.path.join(directory, PLAYLIST_NAME),
+        ]
+    return command
+
+
+def parse_playlist(text):
+    """(segment URI, duration in seconds) pairs of a media playlist"""
+    segments = []
+    duration = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXTINF:'):
+            duration = float(line[len('#EXTINF:'):].split(',')[0])
+        elif line and not line.startswith('#') and duration is not None:
+            segments.append((line, duration))
+            duration = None
+    return segments
+
+
+def _upload(storage, directory, key_prefix, bitrate):
+    """Upload one rendition's files; returns its Song.renditions entry"""
+    with open(os.path.join(directory, PLAYLIST_NAME)) as playlist:
+        segments = parse_playlist(playlist.read())
+    if not segments:
+        raise PackagingError(f'ffmpeg produced no segments for {bitrate}k')
+
+    peak = total_bytes = total_seconds = 0
+    for name, seconds in segments:
+        path = os.path.join(directory, clean_key(name))
+        size = os.path.getsize(path)
+        with open(path, 'rb') as segment:
+            storage.save(f'{key_prefix}/{name}', segment)
+        total_bytes += size
+        total_seconds += seconds
+        if seconds > 0:
+            peak = max(peak, size * 8 / seconds)
+    # The playlist last: a rendition is only playable once all its segments are stored
+    with open(os.path.join(directory, PLAYLIST_NAME), 'rb') as playlist:
+        storage.save(f'{key_prefix}/{PLAYLIST_NAME}', playlist)
+
+    return {
+        'name': f'{bitrate}k',
+        'bitrate': bitrate * 1000,
+        'bandwidth': int(peak),
+        'average_bandwidth': int(total_bytes * 8 / total_seconds) if total_seconds else int(peak),
+        'codecs': CODEC,
+        'playlist': f'{key_prefix}/{PLAYLIST_NAME}',
+        'segments': len(segments),
+        'duration': round(total_seconds, 3),
+    }
+
+
+def delete_renditions(renditions):
+    """Remove the stored files of Song.renditions entries"""
+    storage = get_storage()
+    for rendition in renditions:
+        playlist = rendition['playlist']
+        directory = playlist.rsplit('/', 1)[0]
+        try:
+            file = storage.open(playlist)
+        except FileNotFoundError:
+            continue
+        try:
+            segments = parse_playlist(file.read().decode())
+        finally:
+            file.close()
+        for name, _ in segments:
+            storage.delete(f'{directory}/{name}')
+        storage.delete(playlist)
+
+
+def package(song, ladder=None, segment_seconds=None, allow_remote=False):
+    """Transcode and segment ``song``, store the files and record them on the song"""
+    ladder = sorted(ladder or bitrates())
+    segment_seconds = segment_seconds or settings.AUDIO_HLS_SEGMENT_SECONDS
+    source, protocols = source_of(song, allow_remote)
+    storage = get_storage()
+    version = f'{time.time_ns() // 1000:x}'
+    started = time.perf_counter()
+
+    with tempfile.TemporaryDirectory(prefix='hls-') as workdir:
+        outputs = []
+        for bitrate in ladder:
+            directory = os.path.join(workdir, f'{bitrate}k')
+            os.makedirs(directory)
+            outputs.append((bitrate, directory))
+
+        try:
+            result = subprocess.run(
+                ffmpeg_command(source, outputs, segment_seconds, protocols),
+                capture_output=True, text=True, timeout=settings.AUDIO_HLS_TIMEOUT,
+            )
+        except FileNotFoundError:
+            raise PackagingError(f'{settings.FFMPEG_BINARY} not found; install ffmpeg or set FFMPEG_BINARY')
+        except subprocess.TimeoutExpired:
+            raise PackagingError(f'ffmpeg took longer than {settings.AUDIO_HLS_TIMEOUT}s')
+        if result.returncode != 0:
+            raise PackagingError(f'ffmpeg failed: {result.stderr.strip()[-500:]}')
+
+        renditions = [
+            _upload(storage, directory, f'{song_prefix(song.id)}/{version}/{bitrate}k', bitrate)
+            for bitrate, directory in outputs
+        ]
+
+    previous = song.renditions or []
+    song.renditions = renditions
+    song.save(update_fields=['renditions'])
+    if previous:
+        # Players part way through the old version keep their playlists; its files go later
+        from .tasks import delete_hls_renditions
+        delete_hls_renditions.enqueue(delay=settings.AUDIO_HLS_RETIRE_DELAY, renditions=previous)
+
+    logger.info(f'Packaged song {song.id} into {len(renditions)} renditions in {time.perf_counter() - started:.1f}s')
+    return renditions
+
+
+def master_playlist(renditions):
+    """The multivariant playlist listing ``renditions``, with URIs relative to the song's hls/ path"""
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-INDEPENDENT-SEGMENTS']
+    for rendition in sorted(renditions, key=lambda rendition: rendition['bandwidth']):
+        lines.append(
+            f"#EXT-X-STREAM-INF:BANDWIDTH={rendition['bandwidth']},"
+            f"AVERAGE-BANDWIDTH={rendition['average_bandwidth']},CODECS=\"{rendition['codecs']}\""
+        )
+        lines.append(rendition['playlist'].split('/hls/', 1)[1])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,70 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from songs.models import Song
+from streaming import hls
+from streaming.tasks import package_hls
+
+
+class Command(BaseCommand):
+    help = 'Transcode songs into HLS bitrate renditions (requires ffmpeg)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('song_ids', nargs='*', type=int)
+        parser.add_argument('--all', action='store_true',
+                            help='Every song with a stored audio file that has not been packaged yet')
+        parser.add_argument('--force', action='store_true', help='With --all, repackage packaged songs too')
+        parser.add_argument('--bitrates', help='Comma-separated kbit/s; defaults to AUDIO_HLS_BITRATES')
+        parser.add_argument('--segment-seconds', type=int)
+        parser.add_argument('--allow-remote', action='store_true',
+                            help="Also fetch songs' external audio_url (only for trusted catalogs)")
+        parser.add_argument('--background', action='store_true',
+                            help='Queue streaming.package_hls jobs for run_jobs instead of transcoding here')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            if options['allow_remote']:
+                songs = Song.objects.exclude(Q(audio_file='') & (Q(audio_url__isnull=True) | Q(audio_url='')))
+            else:
+                songs = Song.objects.exclude(audio_file='')
+            if not options['force']:
+                songs = songs.filter(renditions=[])
+            song_ids = list(songs.order_by('id').values_list('id', flat=True))
+        elif options['song_ids']:
+            song_ids = options['song_ids']
+        else:
+            raise CommandError('Give song ids or --all')
+
+        try:
+            bitrates = [int(value) for value in options['bitrates'].split(',')] if options['bitrates'] else None
+        except ValueError:
+            raise CommandError('--bitrates must be comma-separated integers')
+
+        if options['background']:
+            for song_id in song_ids:
+                package_hls.enqueue(
+                    song_id=song_id, bitrates=bitrates, segment_seconds=options['segment_seconds'],
+                    allow_remote=options['allow_remote'],
+                )
+            self.stdout.write(self.style.SUCCESS(f'Queued {len(song_ids)} songs on the media queue'))
+            return
+
+        failed = 0
+        for song_id in song_ids:
+            started = time.perf_counter()
+            try:
+                song = Song.objects.get(id=song_id)
+                renditions = hls.package(song, bitrates, options['segment_seconds'], options['allow_remote'])
+            except (Song.DoesNotExist, hls.PackagingError) as e:
+                failed += 1
+                self.stderr.write(f'Song {song_id}: {e}')
+                continue
+            self.stdout.write(
+                f"Song {song_id}: {', '.join(rendition['name'] for rendition in renditions)} "
+                f"({renditions[0]['segments']} segments) in {time.perf_counter() - started:.1f}s"
+            )
+
+        message = f'Packaged {len(song_ids) - failed} of {len(song_ids)} songs'
+        self.stdout.write(self.style.SUCCESS(message) if not failed else self.style.WARNING(message))
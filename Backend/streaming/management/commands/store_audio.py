@@ -0,0 +1,36 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from songs.models import Song
+from streaming.storage import get_storage
+from streaming.tasks import package_hls
+
+
+class Command(BaseCommand):
+    help = "Copy an audio file into the audio storage and serve it as a song's stream"
+
+    def add_arguments(self, parser):
+        parser.add_argument('song_id', type=int)
+        parser.add_argument('path', help='Local audio file')
+        parser.add_argument('--key', help="Storage key; defaults to songs/<song_id>/<file name>")
+        parser.add_argument('--hls', action='store_true', help='Also queue a streaming.package_hls job')
+
+    def handle(self, *args, **options):
+        try:
+            song = Song.objects.get(id=options['song_id'])
+        except Song.DoesNotExist:
+            raise CommandError(f"Song {options['song_id']} does not exist")
+
+        path = options['path']
+        key = options['key'] or f'songs/{song.id}/{os.path.basename(path)}'
+        try:
+            with open(path, 'rb') as file:
+                song.audio_file = get_storage().save(key, file)
+        except OSError as e:
+            raise CommandError(str(e))
+        song.save(update_fields=['audio_file'])
+
+        self.stdout.write(self.style.SUCCESS(f'Stored {path} as {song.audio_file} for "{song.title}"'))
+        if options['hls']:
+            self.stdout.write(f'Queued {package_hls.enqueue(song_id=song.id)}')
@@ -0,0 +1,150 @@
+"""
+HTTP responses for stored audio: byte ranges, conditional requests and offload.
+
+Players seek by asking for byte ranges (``Range: bytes=1048576-``), so every
+stream response advertises ``Accept-Ranges: bytes`` and answers a satisfiable
+single range with 206 Partial Content. Requests for several ranges at once are
+served the whole file, which RFC 9110 allows and no audio player sends.
+
+With settings.AUDIO_STREAM_OFFLOAD set, Django only authorises the request and
+hands the bytes off:
+
+  'accel'     X-Accel-Redirect to AUDIO_ACCEL_PREFIX + key; nginx serves the
+              file from an ``internal`` location and handles ranges itself
+  'sendfile'  X-Sendfile with the file's path, for Apache mod_xsendfile or
+              lighttpd (local storage only)
+  'redirect'  302 to a signed URL from the storage (S3 storage only)
+"""
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class AudioFileResponse(FileResponse):
+    # Larger than FileResponse's 4 KiB: fewer writes for multi-megabyte tracks
+    block_size = 64 * 1024
+
+
+def parse_range(header, size):
+    """
+    (start, end) with inclusive ``end`` for a single-range header, or None to
+    serve the whole file. Raises RangeNotSatisfiable when the range starts
+    past the end of the file.
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        # Malformed and multi-range headers are ignored
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def _range_applies(request, stored):
+    """If-Range: only honour the range when the client's copy is still current"""
+    validator = request.headers.get('If-Range')
+    if not validator:
+        return True
+    if validator.startswith(('"', 'W/')):
+        return validator == stored.etag
+    modified = parse_http_date_safe(validator)
+    return modified is not None and modified >= int(stored.modified.timestamp())
+
+
+def _set_headers(response, stored, max_age):
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = stored.etag
+    response['Last-Modified'] = http_date(stored.modified.timestamp())
+    patch_cache_control(response, public=True, max_age=max_age)
+    return response
+
+
+def _offload(storage, stored):
+    mode = settings.AUDIO_STREAM_OFFLOAD
+    if mode == 'accel':
+        response = HttpResponse(content_type=stored.content_type)
+        response['X-Accel-Redirect'] = settings.AUDIO_ACCEL_PREFIX.rstrip('/') + '/' + stored.key
+        return response
+    if mode == 'sendfile':
+        path = storage.path(stored.key)
+        if path:
+            response = HttpResponse(content_type=stored.content_type)
+            response['X-Sendfile'] = path
+            return response
+    if mode == 'redirect':
+        url = storage.url(stored.key)
+        if url:
+            return HttpResponseRedirect(url)
+    return None
+
+
+def stream_response(request, storage, key, max_age=None):
+    """The response for a GET or HEAD of ``key``; raises FileNotFoundError"""
+    stored = storage.stat(key)
+    if max_age is None:
+        max_age = settings.AUDIO_STREAM_MAX_AGE
+
+    offloaded = _offload(storage, stored)
+    if offloaded is not None:
+        if isinstance(offloaded, HttpResponseRedirect):
+            return offloaded
+        return _set_headers(offloaded, stored, max_age)
+
+    not_modified = get_conditional_response(
+        request, etag=stored.etag, last_modified=int(stored.modified.timestamp()),
+    )
+    if not_modified is not None:
+        return _set_headers(not_modified, stored, max_age)
+
+    byte_range = None
+    header = request.headers.get('Range')
+    if header and _range_applies(request, stored):
+        try:
+            byte_range = parse_range(header, stored.size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stored.size}'
+            return _set_headers(response, stored, max_age)
+
+    if request.method == 'HEAD':
+        # Headers only; nothing is opened
+        response = HttpResponse(content_type=stored.content_type)
+        if byte_range:
+            start, end = byte_range
+            response.status_code = 206
+            response['Content-Range'] = f'bytes {start}-{end}/{stored.size}'
+        else:
+            start, end = 0, stored.size - 1
+        response['Content-Length'] = end - start + 1
+        return _set_headers(response, stored, max_age)
+
+    if byte_range:
+        start, end = byte_range
+        response = AudioFileResponse(
+            storage.open(key, start, end - start + 1), status=206, content_type=stored.content_type,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{stored.size}'
+        response['Content-Length'] = end - start + 1
+    else:
+        response = AudioFileResponse(storage.open(key), content_type=stored.content_type)
+        response['Content-Length'] = stored.size
+    return _set_headers(response, stored, max_age)
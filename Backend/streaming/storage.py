@@ -0,0 +1,269 @@
+"""
+Storage for audio files, selected with settings.AUDIO_STORAGE_BACKEND.
+
+Files are addressed by a relative key ("songs/12/master.mp3"), which is what
+Song.audio_file stores. The backend is 'local' (a directory on disk), 's3'
+(any S3-compatible object store, boto3 required) or the dotted path of a
+Storage subclass. Every backend can stat a file and read a byte range of
+it; the local one also gives the filesystem path that X-Sendfile needs, and
+the S3 one signed URLs that clients can be redirected to.
+"""
+import mimetypes
+import os
+import posixpath
+import shutil
+import threading
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, SuspiciousFileOperation
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+BACKENDS = {
+    'local': 'streaming.storage.LocalStorage',
+    's3': 'streaming.storage.S3Storage',
+}
+
+# Types mimetypes does not know on every platform
+CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.m4a': 'audio/mp4',
+    '.aac': 'audio/aac',
+    '.flac': 'audio/flac',
+    '.opus': 'audio/ogg',
+    '.ts': 'video/mp2t',
+}
+
+
+def content_type(key):
+    extension = posixpath.splitext(key)[1].lower()
+    return CONTENT_TYPES.get(extension) or mimetypes.guess_type(key)[0] or 'application/octet-stream'
+
+
+def clean_key(key):
+    """The key in normal form; rejects keys that would escape the storage root"""
+    normal = posixpath.normpath(str(key).replace('\\', '/'))
+    if not key or normal.startswith(('/', '../')) or normal in ('.', '..'):
+        raise SuspiciousFileOperation(f'Invalid storage key {key!r}')
+    return normal
+
+
+class StoredFile:
+    def __init__(self, key, size, modified, etag, content_type):
+        self.key = key
+        self.size = size
+        # Aware datetime, for Last-Modified
+        self.modified = modified
+        self.etag = etag
+        self.content_type = content_type
+
+
+class RangeFile:
+    """A file object that reads ``length`` bytes from ``start`` and then reports EOF"""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+class Storage:
+    def stat(self, key):
+        """StoredFile for ``key``; raises FileNotFoundError"""
+        raise NotImplementedError
+
+    def open(self, key, start=0, length=None):
+        """A binary file object reading ``length`` bytes (to the end when None) from ``start``"""
+        raise NotImplementedError
+
+    def save(self, key, file):
+        """Store the contents of a binary file object under ``key``"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def exists(self, key):
+        try:
+            self.stat(key)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def path(self, key):
+        """Filesystem path of the file, or None when it is not on a local disk"""
+        return None
+
+    def url(self, key, expires=None):
+        """A URL clients can fetch the file from directly, or None"""
+        return None
+
+
+class LocalStorage(Storage):
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(settings.AUDIO_STORAGE_ROOT)
+
+    def path(self, key):
+        return os.path.join(self.root, *clean_key(key).split('/'))
+
+    def stat(self, key):
+        path = self.path(key)
+        stat = os.stat(path)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        return StoredFile(
+            clean_key(key), stat.st_size,
+            datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+            f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"',
+            content_type(key),
+        )
+
+    def open(self, key, start=0, length=None):
+        file = open(self.path(key), 'rb')
+        if start == 0 and length is None:
+            # The plain file keeps its fileno, so WSGI servers can sendfile() it
+            return file
+        if length is None:
+            length = os.fstat(file.fileno()).st_size - start
+        return RangeFile(file, start, length)
+
+    def save(self, key, file):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written next to the target and renamed, so readers never see a partial file
+        partial = f'{path}.partial'
+        with open(partial, 'wb') as out:
+            shutil.copyfileobj(file, out)
+        os.replace(partial, path)
+        return clean_key(key)
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3Storage(Storage):
+    """Objects in an S3-compatible bucket (AWS S3, MinIO, R2...), under AUDIO_S3_PREFIX"""
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None):
+        try:
+            # Imported lazily: only needed by deployments that store audio in a bucket
+            import boto3
+        except ImportError as e:
+            raise ImproperlyConfigured('AUDIO_STORAGE_BACKEND=s3 requires boto3') from e
+        if not bucket:
+            raise ImproperlyConfigured('AUDIO_STORAGE_BACKEND=s3 requires AUDIO_S3_BUCKET')
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.client = boto3.client('s3', endpoint_url=endpoint_url or None, region_name=region or None)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            settings.AUDIO_S3_BUCKET, settings.AUDIO_S3_PREFIX,
+            settings.AUDIO_S3_ENDPOINT_URL, settings.AUDIO_S3_REGION,
+        )
+
+    def object_key(self, key):
+        key = clean_key(key)
+        return f'{self.prefix}/{key}' if self.prefix else key
+
+    def _missing(self, error):
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def stat(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except ClientError as e:
+            if self._missing(e):
+                raise FileNotFoundError(key) from e
+            raise
+        return StoredFile(
+            clean_key(key), head['ContentLength'], head['LastModified'], head['ETag'],
+            head.get('ContentType') or content_type(key),
+        )
+
+    def open(self, key, start=0, length=None):
+        from botocore.exceptions import ClientError
+
+        arguments = {'Bucket': self.bucket, 'Key': self.object_key(key)}
+        if start or length is not None:
+            end = '' if length is None else start + length - 1
+            arguments['Range'] = f'bytes={start}-{end}'
+        try:
+            return self.client.get_object(**arguments)['Body']
+        except ClientError as e:
+            if self._missing(e):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def save(self, key, file):
+        self.client.upload_fileobj(
+            file, self.bucket, self.object_key(key), ExtraArgs={'ContentType': content_type(key)},
+        )
+        return clean_key(key)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    def url(self, key, expires=None):
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': self.object_key(key)},
+            ExpiresIn=expires or settings.AUDIO_URL_EXPIRY,
+        )
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage_class(backend=None):
+    backend = backend or settings.AUDIO_STORAGE_BACKEND
+    try:
+        storage_class = import_string(BACKENDS.get(backend, backend))
+    except ImportError as e:
+        raise ImproperlyConfigured(f'Unknown AUDIO_STORAGE_BACKEND {backend!r}') from e
+    if not (isinstance(storage_class, type) and issubclass(storage_class, Storage)):
+        raise ImproperlyConfigured(f'AUDIO_STORAGE_BACKEND {backend!r} is not a Storage')
+    return storage_class
+
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = get_storage_class().from_settings()
+    return _storage
+
+
+def reset():
+    global _storage
+    _storage = None
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    if setting.startswith(('AUDIO_STORAGE_', 'AUDIO_S3_')):
+        reset()
@@ -0,0 +1,19 @@
+from django.conf import settings
+
+from jobs.queue import task
+from songs.models import Song
+from . import hls
+
+
+@task(queue='media', max_attempts=2, concurrency=settings.AUDIO_HLS_JOB_CONCURRENCY)
+def package_hls(song_id, bitrates=None, segment_seconds=None, allow_remote=False):
+    """Transcode a song into the HLS bitrate ladder (see streaming/hls.py)"""
+    song = Song.objects.get(id=song_id)
+    renditions = hls.package(song, bitrates, segment_seconds, allow_remote)
+    return {'song_id': song_id, 'renditions': [rendition['name'] for rendition in renditions]}
+
+
+@task(queue='media')
+def delete_hls_renditions(renditions):
+    hls.delete_renditions(renditions)
+    return {'deleted': len(renditions)}
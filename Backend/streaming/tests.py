@@ -0,0 +1,328 @@
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+
+from jobs import queue
+from jobs.models import Job
+from songs.tests import create_songs
+from . import hls
+from .responses import RangeNotSatisfiable, parse_range
+from .storage import LocalStorage, get_storage
+
+AUDIO = bytes(range(256)) * 40  # 10240 bytes
+
+
+class ParseRangeTests(TestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=500-', 1000), (500, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 999))
+        self.assertEqual(parse_range('bytes=900-5000', 1000), (900, 999))
+
+    def test_ignored_ranges(self):
+        for header in ('bytes=0-1,5-9', 'bytes=9-1', 'items=0-1', 'bytes=-'):
+            self.assertIsNone(parse_range(header, 1000), header)
+
+    def test_unsatisfiable(self):
+        for header in ('bytes=1000-', 'bytes=-0'):
+            with self.assertRaises(RangeNotSatisfiable):
+                parse_range(header, 1000)
+
+
+class LocalStorageTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.storage = LocalStorage(self.root.name)
+
+    def tearDown(self):
+        self.root.cleanup()
+
+    def test_save_stat_and_read_ranges(self):
+        self.assertEqual(self.storage.save('songs/1/a.mp3', io.BytesIO(AUDIO)), 'songs/1/a.mp3')
+        stored = self.storage.stat('songs/1/a.mp3')
+        self.assertEqual((stored.size, stored.content_type), (len(AUDIO), 'audio/mpeg'))
+        with self.storage.open('songs/1/a.mp3') as file:
+            self.assertEqual(file.read(), AUDIO)
+        part = self.storage.open('songs/1/a.mp3', 100, 50)
+        self.assertEqual(part.read(), AUDIO[100:150])
+        self.assertEqual(part.read(), b'')
+        part.close()
+
+    def test_missing_and_escaping_keys(self):
+        with self.assertRaises(FileNotFoundError):
+            self.storage.stat('songs/missing.mp3')
+        for key in ('../outside.mp3', '/etc/passwd', 'songs/../../x', ''):
+            with self.assertRaises(SuspiciousFileOperation):
+                self.storage.path(key)
+
+
+class StreamEndpointTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        settings_override = override_settings(AUDIO_STORAGE_BACKEND='local', AUDIO_STORAGE_ROOT=self.root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(self.root.cleanup)
+
+        self.song = create_songs(1)[0]
+        self.song.audio_file = get_storage().save(f'songs/{self.song.id}/track.mp3', io.BytesIO(AUDIO))
+        self.song.save()
+        self.url = f'/api/v1/songs/{self.song.id}/stream/'
+        self.client = APIClient()
+
+    def test_full_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), AUDIO)
+        self.assertEqual(response['Content-Length'], str(len(AUDIO)))
+        self.assertEqual(response['Content-Type'], 'audio/mpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('max-age=86400', response['Cache-Control'])
+        self.assertTrue(response['ETag'])
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=1000-1999')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), AUDIO[1000:2000])
+        self.assertEqual(response['Content-Range'], f'bytes 1000-1999/{len(AUDIO)}')
+        self.assertEqual(response['Content-Length'], '1000')
+
+    def test_suffix_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-16')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), AUDIO[-16:])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(AUDIO)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(AUDIO)}')
+
+    def test_if_range(self):
+        etag = self.client.head(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        # The file changed since the client's copy: the whole file, not a range of the new one
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], str(len(AUDIO)))
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(response.status_code, 304)
+
+    def test_head(self):
+        response = self.client.head(self.url, HTTP_RANGE='bytes=0-99')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(response.content, b'')
+
+    @override_settings(AUDIO_STREAM_OFFLOAD='accel')
+    def test_accel_redirect(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-99')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-audio/songs/{self.song.id}/track.mp3')
+        self.assertEqual(response.content, b'')
+
+    @override_settings(AUDIO_STREAM_OFFLOAD='sendfile')
+    def test_sendfile(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.root.name, 'songs', str(self.song.id), 'track.mp3'))
+
+    def test_external_audio_url(self):
+        song = create_songs(1, title='Remote')[0]
+        song.audio_url = 'https://cdn.example.com/remote.mp3'
+        song.save()
+        response = self.client.get(f'/api/v1/songs/{song.id}/stream/')
+        self.assertRedirects(response, song.audio_url, fetch_redirect_response=False)
+
+    def test_no_audio(self):
+        song = create_songs(1, title='Silent')[0]
+        self.assertEqual(self.client.get(f'/api/v1/songs/{song.id}/stream/').status_code, 404)
+        os.remove(get_storage().path(self.song.audio_file))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_missing_file_falls_back_to_audio_url(self):
+        self.song.audio_url = 'https://cdn.example.com/track.mp3'
+        self.song.save()
+        os.remove(get_storage().path(self.song.audio_file))
+        self.assertRedirects(self.client.get(self.url), self.song.audio_url, fetch_redirect_response=False)
+
+    def test_store_audio_command(self):
+        song = create_songs(1, title='Uploaded')[0]
+        with tempfile.NamedTemporaryFile(suffix='.mp3') as source:
+            source.write(AUDIO[:100])
+            source.flush()
+            call_command('store_audio', song.id, source.name, stdout=StringIO())
+        song.refresh_from_db()
+        self.assertEqual(song.audio_file, f'songs/{song.id}/{os.path.basename(source.name)}')
+        response = self.client.get(f'/api/v1/songs/{song.id}/stream/')
+        self.assertEqual(b''.join(response.streaming_content), AUDIO[:100])
+
+
+def fake_ffmpeg(command, **kwargs):
+    """Stands in for subprocess.run: writes three segments and a playlist per output"""
+    for position, argument in enumerate(command):
+        if argument == '-b:a':
+            bitrate = int(command[position + 1].rstrip('k'))
+        elif argument == '-hls_segment_filename':
+            pattern, playlist = command[position + 1], command[position + 2]
+            lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:6', '#EXT-X-PLAYLIST-TYPE:VOD']
+            for index, seconds in enumerate((6.0, 6.0, 2.5)):
+                with open(pattern % index, 'wb') as segment:
+                    segment.write(b'\x47' * int(bitrate * 1000 * seconds / 8))
+                lines += [f'#EXTINF:{seconds},', os.path.basename(pattern % index)]
+            with open(playlist, 'w') as file:
+                file.write('\n'.join(lines + ['#EXT-X-ENDLIST']) + '\n')
+    return subprocess.CompletedProcess(command, 0, '', '')
+
+
+@override_settings(AUDIO_HLS_BITRATES='128,64', JOBS_MODE='worker')
+class HLSTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        settings_override = override_settings(AUDIO_STORAGE_BACKEND='local', AUDIO_STORAGE_ROOT=self.root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(self.root.cleanup)
+
+        self.song = create_songs(1)[0]
+        self.song.audio_file = get_storage().save(f'songs/{self.song.id}/track.mp3', io.BytesIO(AUDIO))
+        self.song.save()
+        self.client = APIClient()
+
+    def package(self, song=None):
+        with mock.patch('streaming.hls.subprocess.run', side_effect=fake_ffmpeg) as run:
+            renditions = hls.package(song or self.song)
+        return renditions, run.call_args[0][0]
+
+    def test_one_ffmpeg_run_for_the_whole_ladder(self):
+        _, command = self.package()
+        self.assertEqual(command.count('-i'), 1)
+        self.assertEqual(command[command.index('-i') + 1], get_storage().path(self.song.audio_file))
+        self.assertEqual(command[command.index('-protocol_whitelist') + 1], 'file')
+        self.assertEqual([command[i + 1] for i, arg in enumerate(command) if arg == '-b:a'], ['64k', '128k'])
+
+    def test_renditions_are_stored_and_recorded(self):
+        renditions, _ = self.package()
+        self.song.refresh_from_db()
+        self.assertEqual(self.song.renditions, renditions)
+        self.assertEqual([rendition['name'] for rendition in renditions], ['64k', '128k'])
+        low = renditions[0]
+        self.assertEqual((low['segments'], low['duration'], low['codecs']), (3, 14.5, 'mp4a.40.2'))
+        self.assertEqual(low['bandwidth'], 64000)
+        self.assertTrue(get_storage().exists(low['playlist']))
+        self.assertTrue(get_storage().exists(low['playlist'].replace('index.m3u8', 'seg_00002.ts')))
+
+    def test_master_playlist(self):
+        renditions, _ = self.package()
+        response = self.client.get(f'/api/v1/songs/{self.song.id}/hls/master.m3u8')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/vnd.apple.mpegurl')
+        self.assertIn('max-age=60', response['Cache-Control'])
+        lines = response.content.decode().splitlines()
+        self.assertEqual(lines[0], '#EXTM3U')
+        self.assertIn('#EXT-X-STREAM-INF:BANDWIDTH=64000,AVERAGE-BANDWIDTH=64000,CODECS="mp4a.40.2"', lines)
+        variant = lines[lines.index('#EXT-X-STREAM-INF:BANDWIDTH=64000,AVERAGE-BANDWIDTH=64000,CODECS="mp4a.40.2"') + 1]
+        self.assertEqual(variant, renditions[0]['playlist'].split('/hls/')[1])
+
+        # The relative URIs resolve to the media playlist and its segments
+        media = self.client.get(f'/api/v1/songs/{self.song.id}/hls/{variant}')
+        self.assertEqual(media.status_code, 200)
+        self.assertIn('seg_00000.ts', b''.join(media.streaming_content).decode())
+        segment = self.client.get(
+            f"/api/v1/songs/{self.song.id}/hls/{variant.replace('index.m3u8', 'seg_00001.ts')}", HTTP_RANGE='bytes=0-99',
+        )
+        self.assertEqual(segment.status_code, 206)
+        self.assertEqual(segment['Content-Type'], 'video/mp2t')
+        self.assertIn(f'max-age={365 * 24 * 60 * 60}', segment['Cache-Control'])
+
+    def test_missing_playlists(self):
+        self.assertEqual(self.client.get(f'/api/v1/songs/{self.song.id}/hls/master.m3u8').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/v1/songs/{self.song.id}/hls/1/64k/index.m3u8').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/v1/songs/{self.song.id}/hls/../track.mp3').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/v1/songs/{self.song.id}/hls/a/../../track.mp3').status_code, 404)
+
+    def test_repackaging_retires_the_old_ladder(self):
+        old, _ = self.package()
+        new, _ = self.package()
+        self.assertNotEqual(old[0]['playlist'], new[0]['playlist'])
+        job = Job.objects.get(task='streaming.delete_hls_renditions')
+        self.assertGreater(job.run_at, timezone.now())
+        # Still playable until the job runs
+        self.assertTrue(get_storage().exists(old[0]['playlist']))
+        Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        queue.Worker(queues=['media']).run(once=True)
+        self.assertFalse(get_storage().exists(old[0]['playlist']))
+        self.assertFalse(get_storage().exists(old[0]['playlist'].replace('index.m3u8', 'seg_00000.ts')))
+        self.assertTrue(get_storage().exists(new[0]['playlist']))
+
+    def test_ffmpeg_failure(self):
+        failed = subprocess.CompletedProcess([], 1, '', 'Invalid data found when processing input')
+        with mock.patch('streaming.hls.subprocess.run', return_value=failed):
+            with self.assertRaisesMessage(hls.PackagingError, 'Invalid data found'):
+                hls.package(self.song)
+        self.song.refresh_from_db()
+        self.assertEqual(self.song.renditions, [])
+
+    def test_song_without_audio(self):
+        with self.assertRaises(hls.PackagingError):
+            hls.package(create_songs(1, title='Silent')[0])
+
+    def test_external_audio_url_needs_opting_in(self):
+        remote = create_songs(1, title='Remote')[0]
+        remote.audio_url = 'http://169.254.169.254/latest/meta-data'
+        remote.save()
+        with mock.patch('streaming.hls.subprocess.run', side_effect=fake_ffmpeg) as run:
+            with self.assertRaisesMessage(hls.PackagingError, 'external audio_url'):
+                hls.package(remote)
+            run.assert_not_called()
+            hls.package(remote, allow_remote=True)
+        command = run.call_args[0][0]
+        self.assertEqual(command[command.index('-protocol_whitelist') + 1], 'file,http,https,tcp,tls')
+
+    def test_command(self):
+        silent = create_songs(1, title='Silent')[0]
+        remote = create_songs(1, title='Remote')[0]
+        remote.audio_url = 'https://cdn.example.com/remote.mp3'
+        remote.save()
+        with mock.patch('streaming.hls.subprocess.run', side_effect=fake_ffmpeg):
+            call_command('package_hls', '--all', stdout=StringIO())
+        self.song.refresh_from_db()
+        silent.refresh_from_db()
+        self.assertEqual(len(self.song.renditions), 2)
+        self.assertEqual(silent.renditions, [])
+        remote.refresh_from_db()
+        self.assertEqual(remote.renditions, [])
+
+        call_command('package_hls', '--all', '--force', '--background', '--bitrates', '96', stdout=StringIO())
+        job = Job.objects.get(task='streaming.package_hls')
+        self.assertEqual(
+            job.payload, {'song_id': self.song.id, 'bitrates': [96], 'segment_seconds': None, 'allow_remote': False},
+        )
+
+    @skipUnless(shutil.which('ffmpeg'), 'ffmpeg is not installed')
+    def test_real_ffmpeg(self):
+        source = os.path.join(self.root.name, 'tone.wav')
+        subprocess.run(
+            ['ffmpeg', '-loglevel', 'error', '-f', 'lavfi', '-i', 'sine=frequency=440:duration=13', source], check=True,
+        )
+        with open(source, 'rb') as file:
+            self.song.audio_file = get_storage().save(f'songs/{self.song.id}/tone.wav', file)
+        renditions = hls.package(self.song)
+        self.assertEqual([rendition['segments'] for rendition in renditions], [3, 3])
+        self.assertAlmostEqual(renditions[0]['duration'], 13, delta=0.5)
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path('songs/<int:song_id>/hls/master.m3u8', views.master_playlist, name='hls-master'),
+    path('songs/<int:song_id>/hls/<path:name>', views.hls_file, name='hls-file'),
+]
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_safe
+
+from songs.models import Song
+from .responses import stream_response
+from .storage import clean_key, get_storage
+from . import hls
+
+# Plain views without trailing slashes: players resolve the playlists' relative
+# URIs against these paths, so they have to look like files.
+
+
+@require_safe
+def master_playlist(request, song_id):
+    """The song's bitrate ladder as an HLS multivariant playlist"""
+    song = get_object_or_404(Song.objects.only('renditions'), id=song_id)
+    if not song.renditions:
+        return JsonResponse({"error": "Song has not been packaged for HLS"}, status=404)
+    response = HttpResponse(hls.master_playlist(song.renditions), content_type='application/vnd.apple.mpegurl')
+    patch_cache_control(response, public=True, max_age=settings.AUDIO_HLS_PLAYLIST_MAX_AGE)
+    return response
+
+
+@require_safe
+def hls_file(request, song_id, name):
+    """A media playlist or segment; their URLs are versioned, so they are cached for long"""
+    try:
+        key = f'{hls.song_prefix(song_id)}/{clean_key(name)}'
+        return stream_response(request, get_storage(), key, max_age=settings.AUDIO_HLS_SEGMENT_MAX_AGE)
+    except (SuspiciousFileOperation, FileNotFoundError):
+        return JsonResponse({"error": "Not found"}, status=404)
@@ -10,7 +10,7 @@ class AlbumSongApi {
       // Fetch all albums
       final response = await DioClient.instance.get('/v1/albums/');
       if (response.statusCode == 200) {
-        return response.data as List<dynamic>;
+        return response.data['results'] as List<dynamic>;
       } else {
         throw Exception('Failed to fetch albums');
       }
@@ -25,14 +25,9 @@ class AlbumSongApi {
       await _setCsrfTokenAndCookies();
 
       // Fetch songs of a specific album
-      final response = await DioClient.instance.get(
+      return await DioClient.getAllPages(
         '/v1/albums/$albumId/get_all_songs/',
       );
-      if (response.statusCode == 200) {
-        return response.data as List<dynamic>;
-      } else {
-        throw Exception('Failed to fetch songs for album $albumId');
-      }
     } catch (e) {
       throw Exception('Error fetching songs for album $albumId: $e');
     }
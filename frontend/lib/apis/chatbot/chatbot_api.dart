@@ -1,3 +1,6 @@
+import 'dart:convert';
+
+import 'package:dio/dio.dart';
 import 'package:shared_preferences/shared_preferences.dart';
 import '../dio_client.dart';
 
@@ -37,4 +40,89 @@ class ChatBotApi {
       throw Exception('Error sending message to chatbot: $e');
     }
   }
+
+  /// Conversation summaries (message count and last message preview), most
+  /// recent first. Pass the previous page's `next` URL as [cursor] to go on.
+  static Future<Map<String, dynamic>> fetchConversations({String? cursor}) async {
+    try {
+      await _setCsrfTokenAndCookies();
+
+      final response = await DioClient.instance.get(
+        cursor ?? '/v1/chatbot/conversations/',
+      );
+
+      return response.data as Map<String, dynamic>;
+    } catch (e) {
+      throw Exception('Error fetching conversations: $e');
+    }
+  }
+
+  /// A page of a conversation's messages, newest first ([cursor] loads older
+  /// ones). With [sinceMessageId], only the messages after that one, oldest first.
+  static Future<Map<String, dynamic>> fetchMessages({
+    required int conversationId,
+    String? cursor,
+    int? sinceMessageId,
+  }) async {
+    try {
+      await _setCsrfTokenAndCookies();
+
+      final response = await DioClient.instance.get(
+        cursor ?? '/v1/chatbot/$conversationId/messages/',
+        queryParameters: {
+          if (cursor == null && sinceMessageId != null) 'since': sinceMessageId,
+        },
+      );
+
+      return response.data as Map<String, dynamic>;
+    } catch (e) {
+      throw Exception('Error fetching messages: $e');
+    }
+  }
+
+  /// Streams a chat turn as Server-Sent Events. Each event is a map with
+  /// `event` (conversation, songs, token, done or error) and its `data`.
+  static Stream<Map<String, dynamic>> streamMessage({
+    required String message,
+    String? conversationId,
+  }) async* {
+    await _setCsrfTokenAndCookies();
+
+    final Response<ResponseBody> response;
+    try {
+      response = await DioClient.instance.post<ResponseBody>(
+        '/v1/chatbot/async/chat/stream/',
+        data: {
+          'message': message,
+          if (conversationId != null) 'conversation_id': conversationId,
+        },
+        options: Options(
+          responseType: ResponseType.stream,
+          headers: {'Accept': 'text/event-stream'},
+        ),
+      );
+    } catch (e) {
+      throw Exception('Error sending message to chatbot: $e');
+    }
+
+    String? event;
+    final data = StringBuffer();
+    final lines = response.data!.stream
+        .cast<List<int>>()
+        .transform(utf8.decoder)
+        .transform(const LineSplitter());
+    await for (final line in lines) {
+      if (line.isEmpty) {
+        if (event != null) {
+          yield {'event': event, 'data': jsonDecode(data.toString())};
+        }
+        event = null;
+        data.clear();
+      } else if (line.startsWith('event:')) {
+        event = line.substring(6).trim();
+      } else if (line.startsWith('data:')) {
+        data.write(line.substring(5).trim());
+      }
+    }
+  }
 }
@@ -78,6 +78,41 @@ class DioClient {
     );
   }
 
+  /// Follow the cursor `next` links of a paginated endpoint and collect every page
+  static Future<List<dynamic>> getAllPages(
+    String path, {
+    Map<String, dynamic>? queryParameters,
+  }) async {
+    final results = <dynamic>[];
+    String? next = path;
+    Map<String, dynamic>? params = queryParameters;
+
+    while (next != null) {
+      final response = await instance.get(next, queryParameters: params);
+      results.addAll(response.data['results'] as List<dynamic>);
+      next = response.data['next'] as String?;
+      // The cursor URL already carries the original query parameters
+      params = null;
+    }
+
+    return results;
+  }
+
+  /// Where to play a song from: its HLS bitrate ladder when it has been
+  /// packaged, the backend stream (seekable, with range requests) when it has
+  /// a stored audio file, otherwise its external audio_url
+  static String audioSource(Map<String, dynamic> song) {
+    final renditions = song['renditions'] as List<dynamic>? ?? [];
+    if (renditions.isNotEmpty && song['id'] != null) {
+      return '$BASE_URL/v1/songs/${song['id']}/hls/master.m3u8';
+    }
+    final audioFile = song['audio_file'] as String? ?? '';
+    if (audioFile.isNotEmpty && song['id'] != null) {
+      return '$BASE_URL/v1/songs/${song['id']}/stream/';
+    }
+    return song['audio_url'] as String? ?? '';
+  }
+
   static Map<String, String> getCsrfTokenAndCookies(Response response) {
     final cookies = response.headers['set-cookie'];
     String? csrfToken;
@@ -7,12 +7,7 @@ class PlaylistSongApi {
     try {
       await _setCsrfTokenAndCookies();
 
-      final response = await DioClient.instance.get('/v1/playlists/');
-      if (response.statusCode == 200) {
-        return response.data as List<dynamic>;
-      } else {
-        throw Exception('Failed to fetch playlists');
-      }
+      return await DioClient.getAllPages('/v1/playlists/');
     } catch (e) {
       throw Exception('Error fetching playlists: $e');
     }
@@ -70,6 +65,71 @@ class PlaylistSongApi {
     }
   }
 
+  /// Add many songs in one request; returns the ids that were not already in the playlist
+  static Future<List<int>> addSongsToPlaylist(int playlistId, List<int> songIds) async {
+    try {
+      await _setCsrfTokenAndCookies();
+
+      final response = await DioClient.instance.post(
+        '/v1/playlists/$playlistId/add_songs/',
+        data: {'song_ids': songIds},
+      );
+
+      if (response.statusCode == 200) {
+        return List<int>.from(response.data['added']);
+      } else if (response.statusCode == 404) {
+        throw Exception('Songs not found: ${response.data['song_ids']}');
+      } else {
+        throw Exception('Failed to add songs to playlist');
+      }
+    } catch (e) {
+      throw Exception('Error adding songs to playlist: $e');
+    }
+  }
+
+  /// Remove many songs in one request; returns the ids that were removed
+  static Future<List<int>> removeSongsFromPlaylist(int playlistId, List<int> songIds) async {
+    try {
+      await _setCsrfTokenAndCookies();
+
+      final response = await DioClient.instance.post(
+        '/v1/playlists/$playlistId/remove_songs/',
+        data: {'song_ids': songIds},
+      );
+
+      if (response.statusCode == 200) {
+        return List<int>.from(response.data['removed']);
+      } else {
+        throw Exception('Failed to remove songs from playlist');
+      }
+    } catch (e) {
+      throw Exception('Error removing songs from playlist: $e');
+    }
+  }
+
+  /// Move songs (in the given order) after [afterSongId], or to the start when it is null
+  static Future<List<int>> moveSongsInPlaylist(int playlistId, List<int> songIds, {int? afterSongId}) async {
+    try {
+      await _setCsrfTokenAndCookies();
+
+      final response = await DioClient.instance.post(
+        '/v1/playlists/$playlistId/move_songs/',
+        data: {
+          'song_ids': songIds,
+          if (afterSongId != null) 'after': afterSongId else 'at_start': true,
+        },
+      );
+
+      if (response.statusCode == 200) {
+        return List<int>.from(response.data['moved']);
+      } else {
+        throw Exception('Failed to move songs in playlist');
+      }
+    } catch (e) {
+      throw Exception('Error moving songs in playlist: $e');
+    }
+  }
+
   /// Delete a playlist
   static Future<void> deletePlaylist(int playlistId) async {
     try {
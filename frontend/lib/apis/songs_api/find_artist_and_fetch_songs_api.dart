@@ -26,7 +26,7 @@ class FindArtistAndFetchSongsApi {
         queryParameters: {'q': artistName},
       );
 
-      return response.data as List<dynamic>;
+      return response.data['results'] as List<dynamic>;
     } catch (e) {
       throw Exception('Error finding artist by name: $e');
     }
@@ -36,12 +36,10 @@ class FindArtistAndFetchSongsApi {
     try {
       await _setCsrfTokenAndCookies();
 
-      final response = await DioClient.instance.get(
+      return await DioClient.getAllPages(
         '/v1/songs/fetch_songs_by_artist/',
         queryParameters: {'artist_id': artistId},
       );
-
-      return response.data as List<dynamic>;
     } catch (e) {
       throw Exception('Error fetching songs by artist: $e');
     }
@@ -26,7 +26,7 @@ class FindSongApi {
         queryParameters: {'q': songName},
       );
 
-      return response.data as List<dynamic>;
+      return response.data['results'] as List<dynamic>;
     } catch (e) {
       throw Exception('Error finding song by name: $e');
     }
@@ -10,6 +10,7 @@ import 'dart:async';
 import '../../apis/album_api/album_song_api.dart';
 import '../../apis/playlist_api/add_album_to_playlist_api.dart';
 import '../../apis/playlist_api/playlist_song_api.dart';
+import '../../apis/dio_client.dart';
 
 // Bloc imports
 import '../../utils/app_bloc.dart';
@@ -135,7 +136,7 @@ class _AlbumDetailState extends State<AlbumDetail>
               .map((a) => (a as Map<String, dynamic>)['name'] as String)
               .join(', ');
 
-          final audioSource = songData['audio_url'] as String? ?? '';
+          final audioSource = DioClient.audioSource(songData);
           final duration = await getSongDuration(
             audioSource,
           ); // Fetch duration here
@@ -5,6 +5,7 @@ import 'package:flutter_svg/flutter_svg.dart';
 import 'package:url_launcher/url_launcher.dart';
 
 import '../../apis/chatbot/chatbot_api.dart';
+import '../../apis/dio_client.dart';
 
 import '../../utils/app_bloc.dart';
 
@@ -45,6 +46,23 @@ class _ChatBotWidgetState extends State<ChatBot>
     super.dispose();
   }
 
+  Song _songFromJson(dynamic e) {
+    final songData = e as Map<String, dynamic>;
+    final artistList = songData['artists'] as List<dynamic>? ?? [];
+    final artistNames = artistList
+        .map((a) => (a as Map<String, dynamic>)['name'] as String)
+        .join(', ');
+
+    return Song(
+      id: songData['id'],
+      title: songData['title'] as String,
+      artist: artistNames,
+      albumArt: songData['cover_image'] as String? ?? '',
+      audioSource: DioClient.audioSource(songData),
+      duration: '--:--', // Placeholder for duration
+    );
+  }
+
   Future<void> _handleSend(String text) async {
     if (text.trim().isEmpty || _isSending) return;
     final appCubit = context.read<AppCubit>();
@@ -55,38 +73,43 @@ class _ChatBotWidgetState extends State<ChatBot>
     _controller.clear();
 
     try {
-      final response = await ChatBotApi.sendMessage(
-        message: text.trim(),
-        conversationId: appCubit.state.conversationId,
-      );
-      appCubit.setConversationId(response['conversation_id']?.toString());
-
+      // Placeholder reply that grows as tokens arrive
+      var reply = '';
       List<Song>? songs;
-      if (response['songs'] != null) {
-        songs =
-            (response['songs'] as List<dynamic>).map((e) {
-              final songData = e as Map<String, dynamic>;
-              final artistList = songData['artists'] as List<dynamic>? ?? [];
-              final artistNames = artistList
-                  .map((a) => (a as Map<String, dynamic>)['name'] as String)
-                  .join(', ');
+      appCubit.addChatMessage(Message(reply, false));
 
-              return Song(
-                id: songData['id'],
-                title: songData['title'] as String,
-                artist: artistNames,
-                albumArt: songData['cover_image'] as String? ?? '',
-                audioSource: songData['audio_url'] as String? ?? '',
-                duration: '--:--', // Placeholder for duration
-              );
-            }).toList();
+      await for (final event in ChatBotApi.streamMessage(
+        message: text.trim(),
+        conversationId: appCubit.state.conversationId,
+      )) {
+        final data = event['data'];
+        switch (event['event']) {
+          case 'conversation':
+            appCubit.setConversationId(data['conversation_id']?.toString());
+            break;
+          case 'songs':
+            songs = (data as List<dynamic>).map(_songFromJson).toList();
+            appCubit.replaceLastChatMessage(Message(reply, false, songs: songs));
+            break;
+          case 'token':
+            reply += data['text'] as String;
+            appCubit.replaceLastChatMessage(Message(reply, false, songs: songs));
+            break;
+          case 'done':
+            reply = data['message'] as String? ?? reply;
+            appCubit.replaceLastChatMessage(
+              Message(reply.isEmpty ? 'No response' : reply, false, songs: songs),
+            );
+            break;
+          case 'error':
+            appCubit.replaceLastChatMessage(
+              Message('Error: ${data['error']}', false, songs: songs),
+            );
+            break;
+        }
       }
-
-      appCubit.addChatMessage(
-        Message(response['message'] ?? 'No response', false, songs: songs),
-      );
     } catch (e) {
-      appCubit.addChatMessage(Message('Error: ${e.toString()}', false));
+      appCubit.replaceLastChatMessage(Message('Error: ${e.toString()}', false));
     } finally {
       if (mounted) {
         setState(() {
@@ -7,6 +7,7 @@ import 'package:flutter_svg/flutter_svg.dart';
 import '../main_widget/home.dart';
 
 import '../../apis/playlist_api/playlist_song_api.dart';
+import '../../apis/dio_client.dart';
 
 import '../../utils/app_bloc.dart';
 
@@ -48,7 +49,7 @@ class _PlaylistDetailState extends State<PlaylistDetail>
             title: songData['title'] as String,
             artist: artistNames,
             albumArt: songData['cover_image'] as String? ?? '',
-            audioSource: songData['audio_url'] as String? ?? '',
+            audioSource: DioClient.audioSource(songData),
             duration: '--:--', // Placeholder for duration
           );
         }).toList();
@@ -73,7 +74,7 @@ class _PlaylistDetailState extends State<PlaylistDetail>
                 title: songData['title'] as String,
                 artist: artistNames,
                 albumArt: songData['cover_image'] as String? ?? '',
-                audioSource: songData['audio_url'] as String? ?? '',
+                audioSource: DioClient.audioSource(songData),
                 duration: '--:--', // Placeholder for duration
               );
             }).toList();
@@ -4,6 +4,7 @@ import 'package:flutter_bloc/flutter_bloc.dart';
 import '../../utils/app_bloc.dart';
 
 import '../../apis/songs_api/find_artist_and_fetch_songs_api.dart';
+import '../../apis/dio_client.dart';
 
 class SearchResult extends StatefulWidget {
   final List<dynamic> artists;
@@ -48,7 +49,7 @@ class _SearchResultState extends State<SearchResult> {
               title: s['title'] ?? '',
               artist: artistName,
               albumArt: s['cover_image'] ?? '',
-              audioSource: s['audio_url'] ?? '',
+              audioSource: DioClient.audioSource(s as Map<String, dynamic>),
               duration: s['duration'] ?? '',
             );
           }).toList();
@@ -98,6 +98,16 @@ class AppCubit extends Cubit<AppState> {
     emit(state.copyWith(chatMessages: [...state.chatMessages, message]));
   }
 
+  void replaceLastChatMessage(Message message) {
+    if (state.chatMessages.isEmpty) {
+      addChatMessage(message);
+      return;
+    }
+    final messages = [...state.chatMessages];
+    messages[messages.length - 1] = message;
+    emit(state.copyWith(chatMessages: messages));
+  }
+
   void setConversationId(String? id) {
     emit(state.copyWith(conversationId: id));
   }